@@ -1,10 +1,19 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
+import altair as alt
 import joblib
+import json
 import os
 from datetime import datetime, timedelta
 from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+from forest import FlatForest
+from queue_engine import QueueEngine
+from routing import DoctorRouter
+import registry
 
 # Configure page
 st.set_page_config(
@@ -38,13 +47,13 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Load Model & Artifacts
-@st.cache_resource
-def load_model_artifacts():
-    """Load ML model and label encoders"""
+@st.cache_resource(max_entries=2)
+def load_model_artifacts(model_version):
+    """Load ML model and label encoders of the active model version"""
     try:
         BASE_DIR = Path(__file__).parent
         BACKEND_DIR = BASE_DIR / "backend"
-        ARTIFACTS_DIR = BACKEND_DIR / "artifacts"
+        ARTIFACTS_DIR = Path(registry.active_dir(BACKEND_DIR / "artifacts"))
         
         MODEL_PATH = ARTIFACTS_DIR / "opd_model.pkl"
         
@@ -52,8 +61,12 @@ def load_model_artifacts():
             st.error(f"❌ Model file not found at: {MODEL_PATH}")
             return None, None
         
-        # Load model
-        model = joblib.load(MODEL_PATH)
+        # Load model, preferring the array-backed forest exported by training
+        FLAT_MODEL_PATH = ARTIFACTS_DIR / "opd_model_flat.npz"
+        if FLAT_MODEL_PATH.exists() and FLAT_MODEL_PATH.stat().st_mtime >= MODEL_PATH.stat().st_mtime:
+            model = FlatForest.load(FLAT_MODEL_PATH)
+        else:
+            model = joblib.load(MODEL_PATH)
         
         # Load label encoders
         ENCODER_PATH = ARTIFACTS_DIR / "label_encoders.pkl"
@@ -69,8 +82,67 @@ def load_model_artifacts():
         st.error(f"Error loading model: {str(e)}")
         return None, None
 
+def get_model_version():
+    """
+    The active registry version. Without a registry, the version from model_metrics.json
+    plus the model file's mtime, so a retrain changes it.
+    """
+    version = registry.active_version()
+    if version:
+        return version
+    artifacts_dir = Path(__file__).parent / "backend" / "artifacts"
+    version = "unknown"
+    metrics_path = artifacts_dir / "model_metrics.json"
+    if metrics_path.exists():
+        with open(metrics_path) as f:
+            version = json.load(f).get("model_version", "unknown")
+    model_path = artifacts_dir / "opd_model.pkl"
+    return f"{version}@{int(model_path.stat().st_mtime)}" if model_path.exists() else version
+
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+@st.cache_resource(max_entries=2)
+def load_router(model_version, _label_encoders):
+    """Department -> doctors map (routing.json) of the active model version"""
+    artifacts_dir = registry.active_dir(str(Path(__file__).parent / "backend" / "artifacts"))
+    known_doctors = tuple(d for d in _label_encoders["DoctorID"].classes_ if d != "UNKNOWN")
+    return DoctorRouter.load(artifacts_dir, known_doctors)
+
+@st.cache_data(max_entries=64)
+def predict_slot_grid(model_version, department, priority_flag, start_hour, end_hour, doctors, _model, _label_encoders):
+    """
+    Predicted wait for every day x hour x doctor of one department (doctors: the ones
+    working in it), as an array of shape (7, hours, doctors). The grid is built as one
+    feature matrix and scored in a single predict call; results are cached per model
+    version and inputs.
+    """
+    dept_classes = list(_label_encoders["Department"].classes_)
+    doctor_classes = list(_label_encoders["DoctorID"].classes_)
+    doctors = list(doctors)
+    doctor_codes = np.array([doctor_classes.index(d) for d in doctors])
+    hours = np.arange(start_hour, end_hour)
+
+    day, hour, doc = np.meshgrid(np.arange(7), hours, doctor_codes, indexing="ij")
+    X = np.column_stack([
+        np.full(day.size, dept_classes.index(department) if department in dept_classes else 0),
+        np.full(day.size, priority_flag),
+        day.ravel(),
+        hour.ravel(),
+        doc.ravel(),
+    ]).astype(np.float64)
+    if hasattr(_model, "feature_names_in_"):
+        X = pd.DataFrame(X, columns=['Department', 'PriorityFlag', 'DayOfWeek', 'HourOfDay', 'DoctorID'])
+    waits = np.asarray(_model.predict(X)).reshape(day.shape)
+    return waits, hours, doctors
+
+@st.cache_resource
+def get_queue_engine():
+    """One queue engine per app process; it also issues token numbers."""
+    return QueueEngine()
+
 # Initialize model
-model, label_encoders = load_model_artifacts()
+model, label_encoders = load_model_artifacts(get_model_version())
+queue_engine = get_queue_engine()
 
 # Header
 st.markdown('<p class="main-header">🏥 OPD Flow Optimizer</p>', unsafe_allow_html=True)
@@ -106,7 +178,7 @@ with st.sidebar:
     """)
 
 # Main content
-tab1, tab2 = st.tabs(["🎫 New Patient Token", "👨‍⚕️ Doctor Dashboard"])
+tab1, tab2, tab3 = st.tabs(["🎫 New Patient Token", "👨‍⚕️ Doctor Dashboard", "📅 Slot Planner"])
 
 with tab1:
     st.subheader("Generate Patient Token")
@@ -175,8 +247,9 @@ with tab1:
             # Predict
             predicted_wait = model.predict(df[['Department', 'PriorityFlag', 'DayOfWeek', 'HourOfDay', 'DoctorID']])[0]
             
-            # Post-process
-            token_num = np.random.randint(100, 999)
+            # Post-process: issue a token and join the doctor's queue
+            entry = queue_engine.enqueue(department, data['DoctorID'][0], priority_flag, float(predicted_wait))
+            token_num = entry.token
             predicted_consult_time = scheduled_datetime + timedelta(minutes=float(predicted_wait))
             
             # Display results
@@ -207,40 +280,138 @@ with tab1:
 with tab2:
     st.subheader("Doctor Load Dashboard")
     
-    # Mock data for dashboard
-    mock_doctors = [
-        {"Doctor": "Dr. Smith (DOC_001)", "Department": "Cardiology", "Queue": 5, "Avg Wait": "15 min", "Status": "🔴 Busy"},
-        {"Doctor": "Dr. Jones (DOC_002)", "Department": "Orthopedics", "Queue": 3, "Avg Wait": "10 min", "Status": "🟢 Available"},
-        {"Doctor": "Dr. Emily (DOC_003)", "Department": "Pediatrics", "Queue": 8, "Avg Wait": "25 min", "Status": "🔴 Busy"},
-        {"Doctor": "Dr. Brown (DOC_004)", "Department": "Dermatology", "Queue": 2, "Avg Wait": "5 min", "Status": "🟢 Available"},
-        {"Doctor": "Dr. Wilson (DOC_005)", "Department": "Neurology", "Queue": 4, "Avg Wait": "12 min", "Status": "🟡 Moderate"},
-    ]
-    
-    df = pd.DataFrame(mock_doctors)
-    
-    # Display as a styled dataframe
-    st.dataframe(
-        df,
-        use_container_width=True,
-        hide_index=True
-    )
-    
-    # Add summary metrics
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        total_queue = sum([d["Queue"] for d in mock_doctors])
-        st.metric("Total Queue", total_queue)
-    
-    with col2:
-        avg_wait = np.mean([int(d["Avg Wait"].split()[0]) for d in mock_doctors])
-        st.metric("Avg Wait Time", f"{avg_wait:.0f} min")
-    
-    with col3:
-        available_docs = len([d for d in mock_doctors if "Available" in d["Status"]])
-        st.metric("Available Doctors", available_docs)
+    def queue_status_label(queue_length):
+        if queue_length > 5:
+            return "🔴 Busy"
+        if queue_length > 2:
+            return "🟡 Moderate"
+        return "🟢 Available"
+
+    queues = queue_engine.status()
     
-    st.info("📊 This is mock data. Real-time queue tracking would require additional backend implementation.")
+    if queues:
+        df = pd.DataFrame([
+            {
+                "Doctor": q["DoctorID"],
+                "Department": q["Department"],
+                "Queue": q["QueueLength"],
+                "Avg Wait": f"{q['AvgPredictedWait_Minutes']:.0f} min",
+                "Served": q["Served"],
+                "Status": queue_status_label(q["QueueLength"]),
+            }
+            for q in queues
+        ])
+        
+        # Display as a styled dataframe
+        st.dataframe(
+            df,
+            use_container_width=True,
+            hide_index=True
+        )
+        
+        # Add summary metrics
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            total_queue = sum(q["QueueLength"] for q in queues)
+            st.metric("Total Queue", total_queue)
+        
+        with col2:
+            waiting = [q for q in queues if q["QueueLength"]]
+            avg_wait = np.mean([q["AvgPredictedWait_Minutes"] for q in waiting]) if waiting else 0
+            st.metric("Avg Wait Time", f"{avg_wait:.0f} min")
+        
+        with col3:
+            available_docs = len({q["DoctorID"] for q in queues} - {q["DoctorID"] for q in queues if q["QueueLength"] > 5})
+            st.metric("Available Doctors", available_docs)
+
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            call_doctor = st.selectbox("Doctor", sorted(df["Doctor"].unique()))
+        with col2:
+            st.write("")
+            if st.button("📢 Call Next"):
+                entry = queue_engine.call_next(call_doctor)
+                if entry:
+                    st.success(f"Token #{entry.token} to {call_doctor}")
+                else:
+                    st.info("No patients waiting")
+    else:
+        st.info("📊 No patients in queue yet. Tokens generated in the first tab appear here.")
+
+with tab3:
+    st.subheader("Appointment Slot Planner")
+
+    if not model or not label_encoders:
+        st.warning("⚠️ Slot planner needs the model and label encoders")
+    else:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            plan_department = st.selectbox("Department", list(label_encoders["Department"].classes_), key="plan_department")
+        with col2:
+            plan_priority = st.selectbox("Priority", ["Normal", "High Priority"], key="plan_priority")
+        with col3:
+            start_hour, end_hour = st.slider("Clinic hours", 0, 24, (8, 18))
+            if end_hour <= start_hour:
+                # An empty range has no slots to rank; plan the one hour starting there
+                start_hour = min(start_hour, 23)
+                end_hour = start_hour + 1
+                st.caption(f"Planning {start_hour:02d}:00-{end_hour:02d}:00")
+
+        # Only the department's doctors (every doctor if routing.json is missing)
+        router = load_router(get_model_version(), label_encoders)
+        plan_doctors = router.department_doctors.get(plan_department, router.all_doctors)
+        waits, hours, doctors = predict_slot_grid(
+            get_model_version(), plan_department, 1 if plan_priority == "High Priority" else 0,
+            start_hour, end_hour, plan_doctors, model, label_encoders,
+        )
+
+        # Best doctor per day and hour
+        best = pd.DataFrame(
+            [(DAY_NAMES[d], int(h), float(waits[d, i].min())) for d in range(7) for i, h in enumerate(hours)],
+            columns=["Day", "Hour", "Wait"],
+        )
+        st.altair_chart(
+            alt.Chart(best).mark_rect().encode(
+                x=alt.X("Hour:O"),
+                y=alt.Y("Day:O", sort=DAY_NAMES),
+                color=alt.Color("Wait:Q", title="Min wait (min)", scale=alt.Scale(scheme="redyellowgreen", reverse=True)),
+                tooltip=["Day", "Hour", alt.Tooltip("Wait:Q", format=".1f")],
+            ).properties(title="Lowest predicted wait per slot (best doctor)", height=240),
+            use_container_width=True,
+        )
+
+        plan_day = st.selectbox("Day for doctor view", DAY_NAMES, key="plan_day")
+        d = DAY_NAMES.index(plan_day)
+        by_doctor = pd.DataFrame(
+            [(doc, int(h), float(waits[d, i, j])) for i, h in enumerate(hours) for j, doc in enumerate(doctors)],
+            columns=["Doctor", "Hour", "Wait"],
+        )
+        st.altair_chart(
+            alt.Chart(by_doctor).mark_rect().encode(
+                x=alt.X("Hour:O"),
+                y=alt.Y("Doctor:N"),
+                color=alt.Color("Wait:Q", title="Wait (min)", scale=alt.Scale(scheme="redyellowgreen", reverse=True)),
+                tooltip=["Doctor", "Hour", alt.Tooltip("Wait:Q", format=".1f")],
+            ).properties(title=f"Predicted wait by doctor on {plan_day}"),
+            use_container_width=True,
+        )
+
+        n_best = st.slider("Slots to list", 5, 50, 10)
+        order = np.argsort(waits, axis=None, kind="stable")[:n_best]
+        day_idx, hour_idx, doc_idx = np.unravel_index(order, waits.shape)
+        st.write("**Best slots**")
+        st.dataframe(
+            pd.DataFrame({
+                "Day": [DAY_NAMES[i] for i in day_idx],
+                "Hour": [f"{hours[i]:02d}:00" for i in hour_idx],
+                "Doctor": [doctors[i] for i in doc_idx],
+                "Predicted Wait (min)": waits[day_idx, hour_idx, doc_idx].round(1),
+            }),
+            use_container_width=True,
+            hide_index=True,
+        )
+        st.caption(f"{waits.size} slots scored in one model call (model {get_model_version()})")
 
 # Footer
 st.divider()
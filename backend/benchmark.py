@@ -0,0 +1,315 @@
+"""
+Performance benchmarks for the OPD Flow Optimizer API and training pipeline.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --compare bench.json --tolerance 0.2
+
+Needs a trained model (run `python model.py` first); the active registry version is used. Results are JSON;
+with --compare, metrics that got worse than the baseline by more than --tolerance are
+reported and the exit code is 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Synthetic requests and training runs write to a throwaway token store, prediction log,
+# data cache (CV folds) and copy of the model registry, never to the live ones; the
+# spawned uvicorn process inherits these
+SCRATCH_DIR = tempfile.mkdtemp(prefix="opd-bench-")
+LIVE_REGISTRY_DIR = os.environ.get("OPD_REGISTRY_DIR", os.path.join(BASE_DIR, "artifacts", "registry"))
+os.environ["OPD_TOKEN_STORE"] = os.path.join(SCRATCH_DIR, "visits.db")
+os.environ["OPD_PREDICTION_LOG"] = os.path.join(SCRATCH_DIR, "predictions.db")
+os.environ["OPD_DATA_CACHE_DIR"] = os.path.join(SCRATCH_DIR, "data_cache")
+os.environ["OPD_REGISTRY_DIR"] = os.path.join(SCRATCH_DIR, "registry")
+if os.path.isdir(LIVE_REGISTRY_DIR):
+    shutil.copytree(LIVE_REGISTRY_DIR, os.environ["OPD_REGISTRY_DIR"], ignore=shutil.ignore_patterns(".staging-*", "*.tmp-*"))
+
+import registry
+
+ARTIFACTS_DIR = registry.active_dir(os.path.join(BASE_DIR, "artifacts"))
+PERCENTILES = (50, 90, 99)
+DEPARTMENTS = ["Cardiology", "Orthopedics", "Dermatology", "Pediatrics", "General Medicine"]
+
+# Metric name suffix -> True if larger is better
+DIRECTIONS = {"_per_s": True, "_ms": False, "_s": False, "_mb": False}
+
+def _payloads(n, seed):
+    """Deterministic /predict request bodies."""
+    rng = np.random.default_rng(seed)
+    start = datetime(2026, 1, 5, 8, 0)
+    return [
+        {
+            "Department": DEPARTMENTS[rng.integers(len(DEPARTMENTS))],
+            "PriorityFlag": int(rng.integers(2)),
+            "ScheduledTime": (start + timedelta(minutes=int(rng.integers(0, 7 * 24 * 60)))).isoformat(),
+            "DoctorID": f"DOC_{rng.integers(1, 16)}",
+        }
+        for _ in range(n)
+    ]
+
+def _latency_summary(samples_s):
+    ms = np.asarray(samples_s) * 1000
+    summary = {f"p{p}_ms": float(np.percentile(ms, p)) for p in PERCENTILES}
+    summary["mean_ms"] = float(ms.mean())
+    summary["throughput_per_s"] = float(len(ms) / max(ms.sum() / 1000, 1e-12))
+    return summary
+
+def _time_requests(send, payloads, warmup):
+    for payload in payloads[:warmup]:
+        send(payload)
+    samples = []
+    for payload in payloads:
+        start = time.perf_counter()
+        send(payload)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def bench_testclient(n_requests, seed, warmup=20):
+    """/predict latency through FastAPI's in-process TestClient."""
+    from fastapi.testclient import TestClient
+    from main import app
+
+    payloads = _payloads(n_requests, seed)
+    with TestClient(app) as client:
+        def send(payload):
+            response = client.post("/predict", json=payload)
+            response.raise_for_status()
+        samples = _time_requests(send, payloads, warmup)
+    return {"requests": n_requests, **_latency_summary(samples)}
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def bench_uvicorn(n_requests, seed, warmup=20, startup_timeout=60):
+    """/predict latency against a real local uvicorn process over HTTP."""
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        started = time.perf_counter()
+        while True:
+            try:
+                urllib.request.urlopen(f"{base_url}/", timeout=1).read()
+                break
+            except OSError:
+                if proc.poll() is not None or time.perf_counter() - started > startup_timeout:
+                    raise RuntimeError("uvicorn did not start")
+                time.sleep(0.1)
+        startup_s = time.perf_counter() - started
+
+        def send(payload):
+            request = urllib.request.Request(
+                f"{base_url}/predict", data=json.dumps(payload).encode(),
+                headers={"Content-Type": "application/json"}, method="POST",
+            )
+            urllib.request.urlopen(request, timeout=10).read()
+
+        samples = _time_requests(send, _payloads(n_requests, seed), warmup)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return {"requests": n_requests, "startup_s": startup_s, **_latency_summary(samples)}
+
+def bench_model_throughput(seed, n_single=500, batch_size=1000, n_batches=5):
+    """Rows per second for one-row calls versus batched calls, per model variant."""
+    from serving import load_bundle
+
+    rng = np.random.default_rng(seed)
+    bundle = load_bundle(ARTIFACTS_DIR)
+    n_dept = len(bundle.category_lookups["Department"])
+    n_doc = len(bundle.category_lookups["DoctorID"])
+    X = rng.integers(0, [n_dept, 2, 7, 24, n_doc], size=(batch_size, 5)).astype(np.float64)
+
+    models = {
+        "flat_forest": load_bundle(ARTIFACTS_DIR, flat_max_rows=0).model,
+        "sklearn": load_bundle(ARTIFACTS_DIR, use_flat=False).model,
+        "hybrid": bundle.model,
+    }
+
+    results = {}
+    for name, model in models.items():
+        model.predict(X[:1])
+        start = time.perf_counter()
+        for i in range(n_single):
+            model.predict(X[i % batch_size:i % batch_size + 1])
+        single = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(n_batches):
+            model.predict(X)
+        batched = time.perf_counter() - start
+        results[name] = {
+            "single_row_per_s": n_single / single,
+            "single_row_ms": single / n_single * 1000,
+            "batched_rows_per_s": n_batches * batch_size / batched,
+        }
+    return results
+
+def bench_training(sizes, seed):
+    """train_model wall time and peak traced memory on synthetic datasets of growing size."""
+    from model import train_model
+    from synth_data import generate_visits
+
+    results = {}
+    for n_rows in sizes:
+        df = pd.concat(generate_visits(n_rows, seed=seed), ignore_index=True)
+        out_dir = tempfile.mkdtemp(prefix="opd-bench-train-")
+        try:
+            tracemalloc.start()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                train_model(output_dir=out_dir, df=df)
+            wall = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            shutil.rmtree(out_dir, ignore_errors=True)
+        results[str(n_rows)] = {"wall_s": wall, "peak_mb": peak / 2**20}
+    return results
+
+def bench_artifact_load(repeats=5):
+    """
+    Time to load a serving bundle for each model layout, from a scratch copy of the model
+    files: the flat and mmap layouts are exported there, not into a registered version.
+    """
+    from serving import load_bundle
+
+    artifacts_dir = os.path.join(SCRATCH_DIR, "load")
+    os.makedirs(artifacts_dir, exist_ok=True)
+    for name in registry.VERSIONED_FILES + (registry.METRICS_FILE,):
+        if os.path.exists(os.path.join(ARTIFACTS_DIR, name)):
+            shutil.copy2(os.path.join(ARTIFACTS_DIR, name), artifacts_dir)
+    variants = {
+        "sklearn_pickle": dict(use_flat=False),
+        "flat_npz": dict(use_flat=True),
+        "mmap": dict(use_mmap=True),
+    }
+    results = {}
+    for name, kwargs in variants.items():
+        with contextlib.redirect_stdout(io.StringIO()):
+            load_bundle(artifacts_dir, **kwargs)  # creates missing layouts
+            samples = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                load_bundle(artifacts_dir, **kwargs)
+                samples.append(time.perf_counter() - start)
+        results[name] = {"load_ms": float(np.median(samples) * 1000)}
+    return results
+
+def _flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name))
+        elif isinstance(value, (int, float)):
+            flat[name] = float(value)
+    return flat
+
+def _direction(metric):
+    for suffix, higher_is_better in DIRECTIONS.items():
+        if metric.endswith(suffix):
+            return higher_is_better
+    return None
+
+def compare(current, baseline, tolerance):
+    """Returns the metrics that regressed by more than tolerance (a fraction) versus baseline."""
+    now = _flatten(current["results"])
+    before = _flatten(baseline["results"])
+    regressions = []
+    for metric, old in before.items():
+        higher_is_better = _direction(metric)
+        if metric not in now or higher_is_better is None or old == 0:
+            continue
+        change = (now[metric] - old) / abs(old)
+        worse = -change if higher_is_better else change
+        if worse > tolerance:
+            regressions.append({"metric": metric, "baseline": old, "current": now[metric], "change": change})
+    return regressions
+
+def run(args):
+    results = {}
+    if "model" in args.suites:
+        results["model_throughput"] = bench_model_throughput(args.seed)
+    if "load" in args.suites:
+        results["artifact_load"] = bench_artifact_load()
+    if "testclient" in args.suites:
+        results["predict_testclient"] = bench_testclient(args.requests, args.seed)
+    if "uvicorn" in args.suites:
+        results["predict_uvicorn"] = bench_uvicorn(args.requests, args.seed)
+    if "train" in args.suites:
+        results["train"] = bench_training(args.train_sizes, args.seed)
+
+    import sklearn
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "sklearn": sklearn.__version__,
+            "seed": args.seed,
+            "requests": args.requests,
+        },
+        "results": results,
+    }
+
+def main():
+    suites = ["model", "load", "testclient", "uvicorn", "train"]
+    parser = argparse.ArgumentParser(description="Benchmark the OPD Flow Optimizer API and training pipeline.")
+    parser.add_argument("--suites", nargs="+", choices=suites, default=suites)
+    parser.add_argument("--requests", type=int, default=500, help="requests per latency benchmark")
+    parser.add_argument("--train-sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--compare", help="baseline results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown (default 0.2)")
+    args = parser.parse_args()
+
+    try:
+        report = run(args)
+    finally:
+        shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        report["regressions"] = compare(report, baseline, args.tolerance)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    for r in report.get("regressions", []):
+        print(f"REGRESSION {r['metric']}: {r['baseline']:.4g} -> {r['current']:.4g} ({r['change']:+.1%})",
+              file=sys.stderr)
+    if report.get("regressions"):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
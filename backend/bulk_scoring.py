@@ -0,0 +1,234 @@
+"""
+Bulk scoring of schedule files (CSV or Parquet) with bounded memory.
+
+    python bulk_scoring.py tomorrow.csv --output scores.ndjson
+    python bulk_scoring.py tomorrow.parquet --output scores.csv --chunk-rows 100000
+
+The file is read in chunks of --chunk-rows rows; each chunk is encoded with the
+serving lookups (encode_frame) and scored in one model call, and its rows are
+written out before the next chunk is read. Every input column is passed through,
+followed by WaitTime_Minutes, PredictedConsultTime, the optional quantile columns
+and Error. Rows with an unknown Department or DoctorID (rows are not routed, so a
+missing DoctorID is unknown too) or an unparsable ScheduledTime or PriorityFlag
+get an Error instead of a prediction. No tokens are issued and nothing is queued.
+
+A file that turns bad after the first chunk (e.g. a malformed line) cannot be
+rejected up front; the output then ends with a trailer saying where scoring
+stopped (see write_frames) and the command exits with status 1.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from contextlib import nullcontext
+import numpy as np
+
+# Rows per chunk; memory use depends on this, not on the size of the file
+CHUNK_ROWS = int(os.environ.get("OPD_SCORE_CHUNK_ROWS", "50000"))
+REQUIRED_COLUMNS = ("Department", "PriorityFlag", "ScheduledTime", "DoctorID")
+OUTPUT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def input_format(filename):
+    """"csv" or "parquet" from a file name; CSV when there is no extension."""
+    ext = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    if ext in ("", "csv", "txt"):
+        return "csv"
+    if ext in ("parquet", "pq"):
+        return "parquet"
+    raise ValueError(f"Unsupported schedule file type: {filename} (use .csv or .parquet)")
+
+def read_chunks(source, fmt, chunk_rows=CHUNK_ROWS):
+    """Yields DataFrames of at most chunk_rows rows from a CSV or Parquet path or file object."""
+    if fmt == "csv":
+        import pandas as pd
+        with pd.read_csv(source, chunksize=chunk_rows) as reader:
+            yield from reader
+        return
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Reading Parquet requires pyarrow: pip install pyarrow")
+    for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows):
+        yield batch.to_pandas()
+
+def open_chunks(source, fmt, chunk_rows=CHUNK_ROWS):
+    """
+    read_chunks() after reading the first chunk and checking its columns, so a bad
+    file fails with a ValueError before any output is produced.
+    """
+    if chunk_rows < 1:
+        raise ValueError("chunk_rows must be at least 1")
+    chunks = read_chunks(source, fmt, chunk_rows)
+    try:
+        first = next(chunks, None)
+    except ValueError as e:
+        raise ValueError(f"Could not read schedule file: {e}")
+    # The reader is closed right away on failure, while the caller's file object is still open
+    if first is None:
+        chunks.close()
+        return iter(())
+    missing = [col for col in REQUIRED_COLUMNS if col not in first.columns]
+    if missing:
+        chunks.close()
+        raise ValueError(f"Schedule file is missing columns: {', '.join(missing)}")
+    return itertools.chain([first], chunks)
+
+def _errors(df, unknown, invalid):
+    """
+    Returns (errors, ok): the error text per row (None where the row can be scored)
+    and the mask of scorable rows. Only the failing rows are formatted.
+    """
+    import pandas as pd
+    errors = np.full(len(df), None, dtype=object)
+    failed = invalid.copy()
+    for mask in unknown.values():
+        failed |= mask
+    for i in np.flatnonzero(failed):
+        if invalid[i]:
+            errors[i] = "Invalid ScheduledTime or PriorityFlag: " \
+                f"{df['ScheduledTime'].iloc[i]}, {df['PriorityFlag'].iloc[i]}"
+        else:
+            errors[i] = "; ".join(
+                f"Missing {col}" if pd.isna(df[col].iloc[i]) else f"Unknown {col}: {df[col].iloc[i]}"
+                for col, mask in unknown.items() if mask[i]
+            )
+    return errors, ~failed
+
+def score_frames(chunks, bundle, quantiles=(), stage=None):
+    """
+    Scores DataFrame chunks with a ModelBundle, one model call per chunk, and yields
+    each chunk with the prediction columns added. stage(name) returns a context
+    manager timing that step (telemetry.stage in the API).
+    """
+    import pandas as pd
+    from preprocessing import encode_frame
+
+    stage = stage or (lambda name: nullcontext())
+    chunks = iter(chunks)
+    while True:
+        with stage("read"):
+            df = next(chunks, None)
+        if df is None:
+            return
+        with stage("encode"):
+            X, unknown, invalid = encode_frame(df, bundle.category_lookups)
+            errors, ok = _errors(df, unknown, invalid)
+        predicted = np.full(len(df), np.nan)
+        spread = np.full((len(quantiles), len(df)), np.nan)
+        if ok.any():
+            with stage("model"):
+                point, spreads = bundle.score_quantiles(X[ok], quantiles)
+            predicted[ok] = point
+            if spreads is not None:
+                spread[:, ok] = spreads
+
+        scored = df.copy()
+        scored["WaitTime_Minutes"] = predicted
+        scored["PredictedConsultTime"] = (
+            pd.to_datetime(df["ScheduledTime"], errors="coerce") + pd.to_timedelta(predicted, unit="m")
+        ).dt.round("s")
+        if quantiles:
+            scored["WaitTime_Low_Minutes"] = spread[0]
+            scored["WaitTime_High_Minutes"] = spread[-1]
+        scored["Error"] = errors
+        yield scored
+
+def _trailer(fmt, columns, rows, error):
+    """The last output line when scoring fails mid-file: an NDJSON object or a CSV row with only Error set."""
+    import pandas as pd
+    message = f"Scoring stopped after {rows} rows: {str(error).strip()}"
+    if fmt == "csv":
+        row = pd.DataFrame([{"Error": message}], columns=columns if columns is not None else ["Error"])
+        return row.to_csv(index=False, header=columns is None)
+    return json.dumps({"Error": message, "Truncated": True, "RowsWritten": rows}) + "\n"
+
+def write_frames(frames, fmt, stage=None, on_error=None):
+    """
+    Yields the scored chunks as NDJSON lines or CSV text (with one header), one string per chunk.
+    If reading or scoring a chunk fails, the output is not just cut short: it ends with a
+    trailer (an NDJSON object with "Truncated": true, or a CSV row with only Error set)
+    giving the number of rows written and the error, and on_error(exception) is called.
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {fmt} (use {' or '.join(OUTPUT_FORMATS)})")
+    stage = stage or (lambda name: nullcontext())
+    frames = iter(frames)
+    rows, columns = 0, None
+    while True:
+        try:
+            df = next(frames, None)
+        except Exception as e:
+            if on_error is not None:
+                on_error(e)
+            yield _trailer(fmt, columns, rows, e)
+            return
+        if df is None:
+            return
+        with stage("write"):
+            if fmt == "csv":
+                text = df.to_csv(index=False, header=(columns is None))
+            else:
+                text = df.to_json(orient="records", lines=True, date_format="iso", date_unit="s") if len(df) else ""
+                if text and not text.endswith("\n"):
+                    text += "\n"
+        rows, columns = rows + len(df), df.columns
+        yield text
+
+def score_file(source, bundle, fmt="csv", output="ndjson", chunk_rows=CHUNK_ROWS, quantiles=(), stage=None,
+               on_error=None):
+    """open_chunks -> score_frames -> write_frames: yields output text chunk by chunk."""
+    frames = score_frames(open_chunks(source, fmt, chunk_rows), bundle, quantiles, stage)
+    return write_frames(frames, output, stage, on_error)
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a schedule file with the active model.")
+    parser.add_argument("input", help="schedule file (.csv or .parquet)")
+    parser.add_argument("--output", "-o", default="-", help="output file (.ndjson or .csv), - for stdout")
+    parser.add_argument("--format", choices=sorted(OUTPUT_FORMATS),
+                        help="output format (default: from the output extension, else ndjson)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--quantiles", default="", help="e.g. 0.1,0.9 to add low/high wait columns")
+    parser.add_argument("--artifacts", default=None, help="model directory (default: the active registry version)")
+    args = parser.parse_args()
+
+    import registry
+    from serving import load_bundle
+    artifacts_dir = args.artifacts or registry.active_dir(os.path.join(registry.BASE_DIR, "artifacts"))
+    bundle = load_bundle(artifacts_dir)
+    if bundle is None:
+        sys.exit(f"No trained model in {artifacts_dir}")
+
+    output = args.format
+    if output is None:
+        ext = os.path.splitext(args.output)[1].lower().lstrip(".")
+        output = ext if ext in OUTPUT_FORMATS else "ndjson"
+    quantiles = tuple(sorted({float(q) for q in args.quantiles.split(",") if q.strip()}))
+
+    def counted(frames):
+        nonlocal rows
+        for df in frames:
+            rows += len(df)
+            yield df
+
+    start = time.perf_counter()
+    rows = 0
+    failures = []
+    out = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    try:
+        chunks = open_chunks(args.input, input_format(args.input), args.chunk_rows)
+        for text in write_frames(counted(score_frames(chunks, bundle, quantiles)), output, on_error=failures.append):
+            out.write(text)
+    except (ValueError, ImportError) as e:
+        sys.exit(str(e))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if failures:
+        sys.exit(f"Scoring stopped after {rows} rows: {str(failures[0]).strip()}")
+    print(f"Scored {rows} rows with model {bundle.version} in {time.perf_counter() - start:.1f}s",
+          file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.environ.get("OPD_DATA_CACHE_DIR", os.path.join(BASE_DIR, "artifacts", "data_cache"))
+# Remembers (path, size, mtime) -> content hash so unchanged files are not re-hashed
+INDEX_FILE = "index.json"
+MANIFEST_FILE = "manifest.json"
+HASH_BLOCK_SIZE = 1 << 20
+# String columns with at most this share of distinct values are stored as category codes
+# (memory-mapped) plus a small table of labels; the rest as fixed-width strings
+CATEGORY_MAX_RATIO = 0.5
+
+def file_hash(path):
+    """Returns the SHA-256 of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def read_source(path):
+    """Parses a raw source file (Excel, CSV or Parquet) into a DataFrame."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xls"):
+        return pd.read_excel(path)
+    if ext == ".csv":
+        return pd.read_csv(path)
+    if ext == ".parquet":
+        return pd.read_parquet(path)
+    raise ValueError(f"Unsupported data file type: {path}")
+
+def _load_index(cache_dir):
+    path = os.path.join(cache_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_index(cache_dir, index):
+    path = os.path.join(cache_dir, INDEX_FILE)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _source_key(path, cache_dir):
+    """Content hash of a source file, reusing the stored hash if size and mtime are unchanged."""
+    stat = os.stat(path)
+    abs_path = os.path.abspath(path)
+    index = _load_index(cache_dir)
+    entry = index.get(abs_path)
+    if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+        return entry["sha256"]
+    digest = file_hash(path)
+    index[abs_path] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": digest}
+    _save_index(cache_dir, index)
+    return digest
+
+def write_segment(df, segment_dir, source=None):
+    """
+    Writes a DataFrame as one .npy file per column plus a manifest.
+    Low-cardinality strings become integer category codes (-1 = missing) and a label
+    array, other strings fixed-width unicode arrays with a separate missing-value mask,
+    so every column can be memory-mapped on load. The segment appears atomically;
+    if another process published the same segment first, its copy is kept.
+    """
+    tmp_dir = f"{segment_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = []
+    for i, name in enumerate(df.columns):
+        col = df[name]
+        entry = {"name": name, "file": f"c{i}.npy", "mask": None}
+        if pd.api.types.is_datetime64_any_dtype(col):
+            entry["kind"] = "datetime"
+            values = col.to_numpy(dtype="datetime64[ns]")
+        elif pd.api.types.is_bool_dtype(col) or pd.api.types.is_numeric_dtype(col):
+            entry["kind"] = "numeric"
+            values = col.to_numpy()
+        elif col.nunique() <= CATEGORY_MAX_RATIO * len(col):
+            entry["kind"] = "category"
+            missing = col.isna().to_numpy()
+            labels, uniques = pd.factorize(col[~missing].astype(str), sort=True)
+            values = np.full(len(col), -1, dtype=np.min_scalar_type(-max(len(uniques), 1)))
+            values[~missing] = labels
+            entry["categories"] = f"c{i}.categories.npy"
+            np.save(os.path.join(tmp_dir, entry["categories"]), np.asarray(uniques, dtype=str))
+        else:
+            entry["kind"] = "string"
+            missing = col.isna().to_numpy()
+            values = col.where(~missing, "").astype(str).to_numpy(dtype=str)
+            if missing.any():
+                entry["mask"] = f"c{i}.mask.npy"
+                np.save(os.path.join(tmp_dir, entry["mask"]), missing)
+        np.save(os.path.join(tmp_dir, entry["file"]), values)
+        columns.append(entry)
+
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+        json.dump({"source": source, "rows": len(df), "columns": columns}, f, indent=2)
+
+    if os.path.exists(os.path.join(segment_dir, MANIFEST_FILE)):
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return
+    shutil.rmtree(segment_dir, ignore_errors=True)
+    try:
+        os.replace(tmp_dir, segment_dir)
+    except OSError:
+        # Another process published the segment between the check and the rename
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.exists(os.path.join(segment_dir, MANIFEST_FILE)):
+            raise
+
+def read_segment(segment_dir, mmap=True):
+    """
+    Loads a segment written by write_segment, memory-mapping the column files.
+    Category columns keep their codes memory-mapped (pandas Categorical); only the
+    older plain string columns are converted to Python objects.
+    """
+    with open(os.path.join(segment_dir, MANIFEST_FILE), "r") as f:
+        manifest = json.load(f)
+    mmap_mode = "r" if mmap else None
+    data = {}
+    for entry in manifest["columns"]:
+        values = np.load(os.path.join(segment_dir, entry["file"]), mmap_mode=mmap_mode)
+        if entry["kind"] == "category":
+            categories = np.load(os.path.join(segment_dir, entry["categories"]))
+            values = pd.Categorical.from_codes(values, categories=categories)
+        elif entry["kind"] == "string":
+            values = values.astype(object)
+            if entry["mask"]:
+                missing = np.load(os.path.join(segment_dir, entry["mask"]), mmap_mode=mmap_mode)
+                values[missing] = None
+        data[entry["name"]] = values
+    return pd.DataFrame(data, copy=False)
+
+def load_cached(path, cache_dir=None, mmap=True):
+    """
+    Loads a source file through the columnar cache.
+    The first call parses the file and writes a segment keyed by its content hash;
+    later calls read the segment instead of re-parsing the source.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"File not found: {path}")
+    cache_dir = cache_dir or CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+
+    segment_dir = os.path.join(cache_dir, _source_key(path, cache_dir))
+    if not os.path.exists(os.path.join(segment_dir, MANIFEST_FILE)):
+        print(f"Building data cache for {os.path.basename(path)}...")
+        write_segment(read_source(path), segment_dir, source=os.path.abspath(path))
+    return read_segment(segment_dir, mmap=mmap)
+
+def load_many(paths, cache_dir=None, mmap=True):
+    """
+    Loads several source files (e.g. the base history plus one file per new month)
+    and concatenates them. Each file is its own cache segment, so adding a month
+    only converts the new file.
+    """
+    frames = [load_cached(p, cache_dir=cache_dir, mmap=mmap) for p in paths]
+    if len(frames) == 1:
+        return frames[0]
+    # Give category columns one shared set of labels, so concat keeps them as codes
+    for name in frames[0].columns:
+        if all(name in f.columns and isinstance(f[name].dtype, pd.CategoricalDtype) for f in frames):
+            categories = sorted(set().union(*(f[name].cat.categories for f in frames)))
+            for f in frames:
+                f[name] = f[name].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+def clear_cache(cache_dir=None):
+    """Removes all cached segments."""
+    shutil.rmtree(cache_dir or CACHE_DIR, ignore_errors=True)
@@ -0,0 +1,170 @@
+import os
+import json
+import bisect
+import threading
+import numpy as np
+
+DRIFT_REFERENCE_FILE = "drift_reference.json"
+# Served rows per window; drift is scored over the current and the previous window,
+# so the counts always cover the most recent WINDOW..2*WINDOW rows
+WINDOW = int(os.environ.get("OPD_DRIFT_WINDOW", "5000"))
+# Fewer served rows than this are reported but not scored
+MIN_SAMPLES = int(os.environ.get("OPD_DRIFT_MIN_SAMPLES", "200"))
+# PSI at or above this counts as drift (0.1 - 0.25 is the usual "moderate" band)
+PSI_THRESHOLD = float(os.environ.get("OPD_DRIFT_PSI_THRESHOLD", "0.25"))
+PSI_MODERATE = 0.1
+# Deciles of the training predictions bin the predicted wait
+PREDICTION_BINS = 10
+UNSEEN_LABEL = "(unseen)"
+# Ordinal features also get a KS statistic over their bins
+ORDINAL = ("PriorityFlag", "DayOfWeek", "HourOfDay", "PredictedWait")
+
+def _bin_labels(edges):
+    bounds = [f"{e:.1f}" for e in edges]
+    return [f"<{bounds[0]}"] + [f"{a}-{b}" for a, b in zip(bounds, bounds[1:])] + [f">={bounds[-1]}"]
+
+def build_reference(X, label_encoders, predictions):
+    """
+    Histograms of the encoded training features (FEATURES columns) and of the model's
+    predictions on them. Categorical features get one bin per class plus one for labels
+    not seen in training; the predicted wait is binned at the deciles of the training
+    predictions.
+    """
+    predictions = np.asarray(predictions, dtype=np.float64)
+    edges = np.unique(np.quantile(predictions, np.linspace(0, 1, PREDICTION_BINS + 1)[1:-1])).tolist()
+    features = {}
+    for col in ("Department", "DoctorID"):
+        labels = [str(c) for c in label_encoders[col].classes_]
+        counts = np.bincount(np.asarray(X[col], dtype=np.int64), minlength=len(labels) + 1)
+        features[col] = {"labels": labels + [UNSEEN_LABEL], "counts": counts.tolist()}
+    for col, size in (("PriorityFlag", 2), ("DayOfWeek", 7), ("HourOfDay", 24)):
+        codes = np.clip(np.asarray(X[col], dtype=np.int64), 0, size - 1)
+        features[col] = {"labels": [str(i) for i in range(size)], "counts": np.bincount(codes, minlength=size).tolist()}
+    features["PredictedWait"] = {
+        "labels": _bin_labels(edges),
+        "edges": edges,
+        "counts": np.bincount(np.searchsorted(edges, predictions, side="right"), minlength=len(edges) + 1).tolist(),
+    }
+    return {"n": len(predictions), "features": features}
+
+def save_reference(X, label_encoders, predictions, output_dir):
+    with open(os.path.join(output_dir, DRIFT_REFERENCE_FILE), "w") as f:
+        json.dump(build_reference(X, label_encoders, predictions), f, indent=2)
+
+def load_reference(artifacts_dir):
+    path = os.path.join(artifacts_dir, DRIFT_REFERENCE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def psi(expected, actual, floor=1e-4):
+    """Population stability index between two histograms over the same bins."""
+    e = np.clip(np.asarray(expected, dtype=np.float64) / max(sum(expected), 1), floor, None)
+    a = np.clip(np.asarray(actual, dtype=np.float64) / max(sum(actual), 1), floor, None)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+def ks(expected, actual):
+    """Kolmogorov-Smirnov statistic between two histograms over the same ordered bins."""
+    e = np.cumsum(expected) / max(sum(expected), 1)
+    a = np.cumsum(actual) / max(sum(actual), 1)
+    return float(np.max(np.abs(a - e)))
+
+class DriftMonitor:
+    """
+    Streaming histograms of the served features and predicted waits, compared with the
+    training-time reference. Memory is fixed (two windows of counts per feature, one
+    bin per category, hour, day or prediction decile) and observing a request is a few
+    counter increments; no prediction log is read.
+    """
+
+    def __init__(self, reference, category_lookups, window=WINDOW):
+        self.reference = reference
+        self.window = window
+        self._lookups = category_lookups
+        self._edges = reference["features"]["PredictedWait"]["edges"] if reference else []
+        self._names = ("Department", "PriorityFlag", "DayOfWeek", "HourOfDay", "DoctorID", "PredictedWait")
+        self._sizes = (
+            len(category_lookups["Department"]) + 1, 2, 7, 24,
+            len(category_lookups["DoctorID"]) + 1, len(self._edges) + 1,
+        )
+        self._lock = threading.Lock()
+        self._current = [[0] * size for size in self._sizes]
+        self._previous = [[0] * size for size in self._sizes]
+        self._current_rows = 0
+        self._previous_rows = 0
+        self.total_rows = 0
+
+    @classmethod
+    def load(cls, artifacts_dir, category_lookups):
+        return cls(load_reference(artifacts_dir), category_lookups)
+
+    def observe(self, rows, predictions):
+        """
+        Counts served rows: (Department, PriorityFlag, ScheduledTime, DoctorID) tuples and
+        their predicted waits (None for rows that were not scored).
+        """
+        departments, doctors = self._lookups["Department"], self._lookups["DoctorID"]
+        unseen_dept, unseen_doctor = self._sizes[0] - 1, self._sizes[4] - 1
+        binned = [
+            (
+                departments.get(department, unseen_dept),
+                1 if priority else 0,
+                scheduled_time.weekday(),
+                scheduled_time.hour,
+                doctors.get(doctor_id, unseen_doctor),
+                None if wait is None else bisect.bisect_right(self._edges, wait),
+            )
+            for (department, priority, scheduled_time, doctor_id), wait in zip(rows, predictions)
+        ]
+        with self._lock:
+            for bins in binned:
+                if self._current_rows >= self.window:
+                    self._previous, self._previous_rows = self._current, self._current_rows
+                    self._current = [[0] * size for size in self._sizes]
+                    self._current_rows = 0
+                for counts, b in zip(self._current, bins):
+                    if b is not None:
+                        counts[b] += 1
+                self._current_rows += 1
+            self.total_rows += len(binned)
+
+    def report(self, threshold=PSI_THRESHOLD):
+        """PSI (and KS for ordinal features) per feature over the recent windows."""
+        with self._lock:
+            counts = [[c + p for c, p in zip(cur, prev)] for cur, prev in zip(self._current, self._previous)]
+            n_rows = self._current_rows + self._previous_rows
+        result = {
+            "reference_rows": self.reference["n"] if self.reference else 0,
+            "recent_rows": n_rows,
+            "total_rows": self.total_rows,
+            "window": self.window,
+            "threshold": threshold,
+            "scored": self.reference is not None and n_rows >= MIN_SAMPLES,
+            "drifted": [],
+            "features": {},
+        }
+        if not result["scored"]:
+            return result
+        for name, actual in zip(self._names, counts):
+            ref = self.reference["features"][name]
+            expected = ref["counts"]
+            if len(expected) != len(actual):
+                continue  # reference and model disagree on the classes
+            score = psi(expected, actual)
+            e_share = np.asarray(expected) / max(sum(expected), 1)
+            a_share = np.asarray(actual) / max(sum(actual), 1)
+            top = np.argsort(-np.abs(a_share - e_share), kind="stable")[:3]
+            feature = {
+                "psi": score,
+                "status": "drift" if score >= threshold else "moderate" if score >= PSI_MODERATE else "stable",
+                "top_shifts": [
+                    {"bin": ref["labels"][i], "expected": float(e_share[i]), "actual": float(a_share[i])} for i in top
+                ],
+            }
+            if name in ORDINAL:
+                feature["ks"] = ks(expected, actual)
+            result["features"][name] = feature
+            if score >= threshold:
+                result["drifted"].append(name)
+        return result
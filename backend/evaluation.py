@@ -0,0 +1,160 @@
+"""
+Rolling-origin (time-ordered) cross-validation of the wait-time model.
+
+Rows are ordered by ScheduledTime and cut into n_folds + 1 consecutive blocks of
+about equal size. Fold k trains on the visits before block k (at most
+CV_MAX_TRAIN_ROWS, the most recent ones) and is scored on block k, so no fold
+ever sees the future. The sort order and block boundaries are cached next to the
+data cache, keyed by a hash of the timestamps, and folds are fitted in parallel
+processes that read the sorted arrays from shared memory.
+"""
+import os
+import time
+import hashlib
+import numpy as np
+from data_cache import CACHE_DIR
+from preprocessing import FEATURES
+from tuning import share_arrays, shared_array, process_pool, terminate_pool
+
+# Folds per evaluation (OPD_CV_FOLDS=0 skips the evaluation in train_model)
+CV_FOLDS = int(os.environ.get("OPD_CV_FOLDS", "5"))
+# Training rows per fold are capped to the most recent ones, which keeps fold fits
+# on a multi-year history about as fast as on a few months
+CV_MAX_TRAIN_ROWS = int(os.environ.get("OPD_CV_MAX_TRAIN_ROWS", "200000"))
+FOLDS_DIR = os.path.join(CACHE_DIR, "folds")
+MIN_TRAIN_ROWS = 10
+DEPARTMENT_COLUMN = FEATURES.index("Department")
+HOUR_COLUMN = FEATURES.index("HourOfDay")
+
+def fold_bounds(times, n_folds, cache_dir=FOLDS_DIR):
+    """
+    Returns (order, bounds): the stable time order of the rows and the n_folds + 2
+    block boundaries into it. Rows with the same timestamp always share a block.
+    Cached by content, so an unchanged history is not sorted again.
+    """
+    times = np.ascontiguousarray(times, dtype=np.int64)
+    key = hashlib.sha256(times.tobytes()).hexdigest()[:16]
+    path = os.path.join(cache_dir, f"{key}-{n_folds}.npz")
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            return cached["order"], cached["bounds"]
+
+    order = np.argsort(times, kind="stable")
+    ordered = times[order]
+    n = len(times)
+    cuts = [ordered[n * i // (n_folds + 1)] for i in range(1, n_folds + 1)]
+    bounds = np.unique(np.concatenate([[0], np.searchsorted(ordered, cuts, side="left"), [n]]))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+    np.savez(tmp_path, order=order, bounds=bounds)
+    os.replace(tmp_path, path)
+    return order, bounds
+
+def _error_sums(codes, abs_err, sq_err, size):
+    """Per-bin [count, sum of absolute errors, sum of squared errors]."""
+    return np.stack([
+        np.bincount(codes, minlength=size),
+        np.bincount(codes, weights=abs_err, minlength=size),
+        np.bincount(codes, weights=sq_err, minlength=size),
+    ])
+
+def _fit_fold(X, y, fold, estimator_cls, params, n_departments):
+    k, train_start, cutoff, end = fold
+    start = time.perf_counter()
+    model = estimator_cls(**params)
+    model.fit(X[train_start:cutoff], y[train_start:cutoff])
+    err = model.predict(X[cutoff:end]) - y[cutoff:end]
+    abs_err, sq_err = np.abs(err), err ** 2
+    X_test = X[cutoff:end]
+    return {
+        "fold": k,
+        "n_train": int(cutoff - train_start),
+        "n_test": int(end - cutoff),
+        "rmse": float(np.sqrt(sq_err.mean())),
+        "mae": float(abs_err.mean()),
+        "fit_s": time.perf_counter() - start,
+        "by_department": _error_sums(X_test[:, DEPARTMENT_COLUMN].astype(np.int64), abs_err, sq_err, n_departments),
+        "by_hour": _error_sums(X_test[:, HOUR_COLUMN].astype(np.int64), abs_err, sq_err, 24),
+    }
+
+def _fit_shared_fold(fold, estimator_cls, params, n_departments):
+    """Pool task: fits one fold on the sorted arrays attached from shared memory."""
+    return _fit_fold(shared_array("X"), shared_array("y"), fold, estimator_cls, params, n_departments)
+
+def _breakdown(sums, labels):
+    count, abs_sum, sq_sum = sums
+    return {
+        str(label): {"n": int(n), "rmse": float(np.sqrt(sq / n)), "mae": float(a / n)}
+        for label, n, a, sq in zip(labels, count, abs_sum, sq_sum) if n
+    }
+
+def rolling_origin_cv(X, y, times, label_encoders, estimator_cls, params=None, n_folds=CV_FOLDS,
+                      n_workers=None, max_train_rows=CV_MAX_TRAIN_ROWS, report=None, cache_dir=FOLDS_DIR):
+    """
+    Evaluates estimator_cls(**params) with rolling-origin folds over times (anything
+    convertible to datetime64). X holds the encoded FEATURES columns. Returns a dict
+    with the pooled and per-fold errors and per-department and per-hour breakdowns.
+    """
+    report = report or (lambda stage, fraction: None)
+    start = time.perf_counter()
+    times = np.asarray(times, dtype="datetime64[ns]")
+    order, bounds = fold_bounds(times.view(np.int64), n_folds, cache_dir)
+    X_sorted = np.ascontiguousarray(np.asarray(X, dtype=np.float64)[order])
+    y_sorted = np.ascontiguousarray(np.asarray(y, dtype=np.float64)[order])
+
+    folds = []
+    for k in range(1, len(bounds) - 1):
+        cutoff, end = int(bounds[k]), int(bounds[k + 1])
+        if cutoff >= MIN_TRAIN_ROWS and end > cutoff:
+            folds.append((len(folds) + 1, max(0, cutoff - max_train_rows), cutoff, end))
+    if not folds:
+        raise ValueError("Not enough distinct ScheduledTime values for a rolling-origin split")
+
+    params = {"random_state": 42, **(params or {}), "n_jobs": 1}
+    departments = list(label_encoders["Department"].classes_)
+    n_workers = min(len(folds), n_workers or os.cpu_count() or 1)
+    results = []
+    if n_workers == 1:
+        for fold in folds:
+            results.append(_fit_fold(X_sorted, y_sorted, fold, estimator_cls, params, len(departments)))
+            report(f"Cross-validation ({len(results)}/{len(folds)} folds)", len(results) / len(folds))
+    else:
+        blocks, specs = share_arrays({"X": X_sorted, "y": y_sorted})
+        # Workers start from a fork server, not by forking the (threaded) API process
+        pool = process_pool(n_workers, specs)
+        try:
+            futures = [pool.submit(_fit_shared_fold, fold, estimator_cls, params, len(departments))
+                       for fold in folds]
+            for future in futures:
+                results.append(future.result())
+                report(f"Cross-validation ({len(results)}/{len(folds)} folds)", len(results) / len(folds))
+            pool.shutdown()
+        finally:
+            # Kills workers still fitting if a fold failed
+            terminate_pool(pool)
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+    by_department = sum(r.pop("by_department") for r in results)
+    by_hour = sum(r.pop("by_hour") for r in results)
+    ordered_times = times[order]
+    for r, (_, train_start, cutoff, end) in zip(results, folds):
+        r["train_from"] = str(ordered_times[train_start])
+        r["test_from"] = str(ordered_times[cutoff])
+        r["test_to"] = str(ordered_times[end - 1])
+    n_test, abs_total, sq_total = by_hour.sum(axis=1)
+    fold_rmse = [r["rmse"] for r in results]
+    return {
+        "scheme": "rolling_origin",
+        "n_folds": len(results),
+        "max_train_rows": max_train_rows,
+        "rmse": float(np.sqrt(sq_total / n_test)),
+        "mae": float(abs_total / n_test),
+        "rmse_fold_std": float(np.std(fold_rmse)),
+        "folds": results,
+        "by_department": _breakdown(by_department, departments),
+        "by_hour": _breakdown(by_hour, range(24)),
+        "elapsed_s": time.perf_counter() - start,
+    }
@@ -0,0 +1,114 @@
+import os
+import json
+import asyncio
+import threading
+
+# Events kept for subscribers that fall behind; a subscriber more than this many
+# events behind gets a fresh snapshot instead of the missed diffs.
+EVENT_BUFFER_SIZE = int(os.environ.get("OPD_EVENT_BUFFER_SIZE", "1024"))
+KEEPALIVE_SECONDS = 15.0
+
+class EventBus:
+    """
+    One ordered stream of server events, fanned out to any number of subscribers.
+    publish() is O(1) whatever the number of subscribers and can be called from any
+    thread: the event is serialized once into a ring buffer and a single wake-up is
+    scheduled on the event loop. Each subscriber reads the ring from its own cursor,
+    so a slow client only falls behind itself; once it is more than the ring size
+    behind, it is sent a new snapshot and carries on from there.
+    """
+
+    def __init__(self, capacity=EVENT_BUFFER_SIZE):
+        self._lock = threading.Lock()
+        self._capacity = capacity
+        self._ring = [None] * capacity
+        self._last_seq = 0
+        self._loop = None
+        self._wakeup = None
+        self._notify_pending = False
+        self.subscribers = 0
+
+    @property
+    def last_seq(self):
+        return self._last_seq
+
+    def publish(self, event, data):
+        """Appends an event to the stream and returns its sequence number."""
+        payload = json.dumps(data, default=str)
+        with self._lock:
+            self._last_seq += 1
+            seq = self._last_seq
+            self._ring[seq % self._capacity] = (seq, event, payload)
+            loop = self._loop
+            schedule = loop is not None and not self._notify_pending
+            if schedule:
+                self._notify_pending = True
+        if schedule:
+            try:
+                loop.call_soon_threadsafe(self._notify)
+            except RuntimeError:
+                pass  # loop already closed
+        return seq
+
+    def _notify(self):
+        """Runs on the event loop: wakes every waiting subscriber at once."""
+        with self._lock:
+            self._notify_pending = False
+        wakeup, self._wakeup = self._wakeup, asyncio.Event()
+        wakeup.set()
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            with self._lock:
+                self._loop = loop
+                self._notify_pending = False
+            self._wakeup = asyncio.Event()
+
+    def _read(self, cursor):
+        """Events after cursor, or None if some of them were already overwritten."""
+        with self._lock:
+            if self._last_seq - cursor > self._capacity:
+                return None
+            return [self._ring[seq % self._capacity] for seq in range(cursor + 1, self._last_seq + 1)]
+
+    async def stream(self, snapshot, after=None, keepalive=KEEPALIVE_SECONDS):
+        """
+        Async generator of (seq, event, json_payload) for one subscriber.
+        Starts with a "snapshot" event built by awaiting snapshot() unless after (a previously
+        received sequence number) can still be resumed from. Diffs carry full rows, so
+        an event that is already reflected in the snapshot is harmless to re-apply.
+        Yields (None, None, None) when idle for keepalive seconds.
+        """
+        self._bind_loop()
+        self.subscribers += 1
+        try:
+            cursor = after if after is not None and 0 <= after <= self._last_seq else None
+            if cursor is not None and self._read(cursor) is None:
+                cursor = None
+            while True:
+                if cursor is None:
+                    cursor = self._last_seq
+                    yield cursor, "snapshot", json.dumps(await snapshot(), default=str)
+                wakeup = self._wakeup
+                events = self._read(cursor)
+                if events is None:
+                    cursor = None  # lagged: resync
+                    continue
+                if events:
+                    for item in events:
+                        yield item
+                    cursor = events[-1][0]
+                    continue
+                try:
+                    await asyncio.wait_for(wakeup.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None, None, None
+        finally:
+            self.subscribers -= 1
+
+def format_sse(seq, event, payload):
+    """Encodes one stream item as a Server-Sent Events message."""
+    if event is None:
+        return ": keepalive\n\n"
+    return f"id: {seq}\nevent: {event}\ndata: {payload}\n\n"
@@ -0,0 +1,195 @@
+import os
+import threading
+import numpy as np
+
+# sklearn trees evaluate splits on float32 inputs
+INPUT_DTYPE = np.float32
+
+def tree_mean(per_tree):
+    """Averages (n_estimators, n_rows) tree outputs in estimator order, like sklearn."""
+    out = np.zeros(per_tree.shape[1])
+    for tree_pred in per_tree:
+        out += tree_pred
+    out /= len(per_tree)
+    return out
+
+def forest_quantiles(model, X, quantiles):
+    """
+    (point predictions, per-tree quantiles with shape (len(quantiles), n_rows)) for a
+    FlatForest, HybridForest or fitted RandomForestRegressor, from one pass over the trees.
+    """
+    if hasattr(model, "predict_quantiles"):
+        return model.predict_quantiles(X, quantiles)
+    per_tree = np.stack([tree.predict(X) for tree in model.estimators_])
+    return tree_mean(per_tree), np.quantile(per_tree, quantiles, axis=0)
+
+class FlatForest:
+    """
+    A fitted RandomForestRegressor flattened into contiguous arrays.
+    All trees share one node table; roots[t] is the first node of tree t. Leaves point
+    to themselves, so every row can be advanced max_depth steps without leaf checks.
+    Predictions are bit-identical to RandomForestRegressor.predict.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        self.n_estimators = len(roots)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Flattens the fitted trees of a RandomForestRegressor."""
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            nodes = np.arange(n)
+            leaf = tree.children_left == -1
+            # Leaves loop back to themselves
+            lefts.append(np.where(leaf, nodes, tree.children_left) + offset)
+            rights.append(np.where(leaf, nodes, tree.children_right) + offset)
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(np.where(leaf, np.inf, tree.threshold))
+            values.append(tree.value[:, 0, 0])
+            roots.append(offset)
+            max_depth = max(max_depth, tree.max_depth)
+            offset += n
+        return cls(
+            feature=np.concatenate(features).astype(np.int16),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            left=np.concatenate(lefts).astype(np.int32),
+            right=np.concatenate(rights).astype(np.int32),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.array(roots, dtype=np.int32),
+            max_depth=max_depth,
+            n_features=model.n_features_in_,
+        )
+
+    def predict_trees(self, X):
+        """Returns the per-tree predictions, shape (n_estimators, n_rows)."""
+        X = np.asarray(X, dtype=INPUT_DTYPE)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[1]} features, but the forest expects {self.n_features}")
+        rows = np.arange(X.shape[0])
+        nodes = np.repeat(self.roots[:, None], X.shape[0], axis=1)
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.value[nodes]
+
+    def predict(self, X):
+        """Mean of the tree predictions, accumulated in the same order as sklearn."""
+        return tree_mean(self.predict_trees(X))
+
+    def predict_quantiles(self, X, quantiles):
+        """
+        Point predictions (identical to predict) and the given quantiles of the
+        per-tree predictions, shape (len(quantiles), n_rows), from one pass over the trees.
+        """
+        per_tree = self.predict_trees(X)
+        return tree_mean(per_tree), np.quantile(per_tree, quantiles, axis=0)
+
+    def arrays(self):
+        return {
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "left": self.left,
+            "right": self.right,
+            "value": self.value,
+            "roots": self.roots,
+            "meta": np.array([self.max_depth, self.n_features], dtype=np.int64),
+        }
+
+    def save(self, path):
+        """Writes the arrays to an uncompressed .npz file."""
+        np.savez(path, **self.arrays())
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            max_depth, n_features = data["meta"]
+            return cls(
+                feature=data["feature"],
+                threshold=data["threshold"],
+                left=data["left"],
+                right=data["right"],
+                value=data["value"],
+                roots=data["roots"],
+                max_depth=max_depth,
+                n_features=n_features,
+            )
+
+    def save_dir(self, path):
+        """Writes one .npy file per array into path, so the forest can be opened memory-mapped."""
+        os.makedirs(path, exist_ok=True)
+        for name, array in self.arrays().items():
+            np.save(os.path.join(path, f"{name}.npy"), array)
+
+    @classmethod
+    def load_dir(cls, path, mmap_mode="r"):
+        """
+        Opens a forest written by save_dir. With mmap_mode="r" the node arrays are
+        memory-mapped read-only, so processes opening the same files share their pages.
+        """
+        def load(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+        max_depth, n_features = np.load(os.path.join(path, "meta.npy"))
+        return cls(
+            feature=load("feature"),
+            threshold=load("threshold"),
+            left=load("left"),
+            right=load("right"),
+            value=load("value"),
+            roots=load("roots"),
+            max_depth=max_depth,
+            n_features=n_features,
+        )
+
+class HybridForest:
+    """
+    Serves a FlatForest for batches of up to max_rows rows, where it avoids sklearn's
+    per-call overhead, and the equivalent RandomForestRegressor for larger batches,
+    where sklearn's compiled traversal is several times faster. Both give identical
+    predictions. load_sklearn() returns the sklearn forest; it is called on the first
+    large batch, so small-batch serving never imports scikit-learn.
+    """
+
+    def __init__(self, flat, load_sklearn, max_rows):
+        self.flat = flat
+        self.max_rows = int(max_rows)
+        self._load_sklearn = load_sklearn
+        self._sklearn = None
+        self._lock = threading.Lock()
+        self.n_features = flat.n_features
+        self.n_estimators = flat.n_estimators
+
+    def sklearn_model(self):
+        if self._sklearn is None:
+            with self._lock:
+                if self._sklearn is None:
+                    self._sklearn = self._load_sklearn()
+        return self._sklearn
+
+    def _is_large(self, X):
+        return np.ndim(X) > 1 and len(X) > self.max_rows
+
+    def predict(self, X):
+        if self._is_large(X):
+            return self.sklearn_model().predict(X)
+        return self.flat.predict(X)
+
+    def predict_quantiles(self, X, quantiles):
+        """Point predictions and per-tree quantiles, as FlatForest.predict_quantiles."""
+        if self._is_large(X):
+            return forest_quantiles(self.sklearn_model(), np.asarray(X, dtype=INPUT_DTYPE), quantiles)
+        return self.flat.predict_quantiles(X, quantiles)
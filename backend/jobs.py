@@ -0,0 +1,103 @@
+import threading
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Finished jobs kept for the status endpoint
+MAX_JOB_HISTORY = 50
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="opd-job")
+_jobs = OrderedDict()
+_lock = threading.Lock()
+
+class Job:
+    """A background job whose stage and progress can be polled while it runs."""
+
+    def __init__(self, kind, params=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = dict(params or {})
+        self.status = "Queued"
+        self.stage = "Queued"
+        self.progress = 0.0
+        self.result = {}
+        self.message = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+
+    def report(self, stage, progress):
+        """Progress callback handed to the job function."""
+        with _lock:
+            self.stage = stage
+            self.progress = max(0.0, min(1.0, float(progress)))
+
+    def to_dict(self):
+        with _lock:
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "params": dict(self.params),
+                "status": self.status,
+                "stage": self.stage,
+                "progress": self.progress,
+                "result": dict(self.result),
+                "message": self.message,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+def _run(job, fn):
+    with _lock:
+        job.status = "Running"
+        job.started_at = datetime.now()
+    try:
+        result = fn(job.report) or {}
+        with _lock:
+            job.result = result
+            job.status = result.get("status", "Success")
+            job.message = result.get("message")
+            job.stage = "Done"
+            job.progress = 1.0
+    except Exception as e:
+        traceback.print_exc()
+        with _lock:
+            job.status = "Failed"
+            job.message = str(e)
+    finally:
+        with _lock:
+            job.finished_at = datetime.now()
+
+def submit_job(kind, fn, params=None):
+    """
+    Runs fn(report) on the background worker and returns the Job; params records the
+    settings fn runs with. Only one job per kind is active at a time: submitting while
+    one is queued or running returns the existing job, whose params may differ.
+    """
+    with _lock:
+        for job in _jobs.values():
+            if job.kind == kind and job.status in ("Queued", "Running"):
+                return job
+        job = Job(kind, params)
+        _jobs[job.id] = job
+        while len(_jobs) > MAX_JOB_HISTORY:
+            oldest_id, oldest = next(iter(_jobs.items()))
+            if oldest.status in ("Queued", "Running"):
+                break
+            del _jobs[oldest_id]
+    _executor.submit(_run, job, fn)
+    return job
+
+def get_job(job_id):
+    """Returns the job with this ID, or None."""
+    with _lock:
+        return _jobs.get(job_id)
+
+def list_jobs():
+    """Returns all known jobs, newest first."""
+    with _lock:
+        jobs = list(_jobs.values())
+    return [job.to_dict() for job in reversed(jobs)]
@@ -1,13 +1,35 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request, UploadFile, File
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from fastapi.routing import APIRoute
 from fastapi.staticfiles import StaticFiles
-import joblib
-import pandas as pd
+from starlette.concurrency import run_in_threadpool
 import numpy as np
 import os
+import time
+import functools
+import inspect
+import threading
 from datetime import datetime, timedelta
-from schemas import PatientBase, PredictionResponse, RetrainResponse
-from mlops import get_model_metrics, trigger_retraining, log_prediction
-from preprocessing import load_processors
+from typing import List, Optional
+from schemas import (
+    PatientBase, PredictionResponse, RetrainResponse,
+    BatchPredictionItem, BatchPredictionResponse,
+    QueueEntryResponse, QueueStatusResponse, SimulationRequest,
+)
+from mlops import (
+    get_model_metrics, trigger_retraining, log_prediction,
+    start_prediction_log, stop_prediction_log, get_prediction_log_stats,
+)
+from preprocessing import encode_features
+from serving import load_bundle, warm_up, MODEL_FILE
+from jobs import submit_job, get_job
+from queue_engine import QueueEngine, QueueEntry
+from token_store import TokenStore
+from events import EventBus, format_sse
+import bulk_scoring
+import telemetry
+import profiler
+import registry
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI(title="OPD Flow Optimizer API", version="1.0")
@@ -25,108 +47,721 @@ app.add_middleware(
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(BASE_DIR)
 FRONTEND_DIST = os.path.join(PROJECT_ROOT, "frontend", "dist")
-MODEL_PATH = os.path.join(BASE_DIR, "artifacts", "opd_model.pkl")
-LABEL_ENCODERS_PATH = os.path.join(BASE_DIR, "artifacts")
+ARTIFACTS_DIR = os.path.join(BASE_DIR, "artifacts")
+# "off" (default), "memory" or "mmap": precompute predictions for the whole feature grid
+PREDICTION_TABLE_MODE = os.environ.get("OPD_PREDICTION_TABLE", "off").lower()
+# Serve the array-backed forest (opd_model_flat.npz) instead of the sklearn pickle
+USE_FLAT_FOREST = os.environ.get("OPD_FLAT_FOREST", "1") != "0"
+# Open the forest memory-mapped so all uvicorn workers share one copy of its pages
+USE_MODEL_MMAP = os.environ.get("OPD_MODEL_MMAP", "0") == "1"
+# Run dummy predictions through a newly loaded model before serving it
+WARMUP = os.environ.get("OPD_WARMUP", "1") != "0"
+# Save a stack profile of one in every OPD_PROFILE_EVERY requests slower than this (0 = off)
+PROFILE_SLOW_MS = float(os.environ.get("OPD_PROFILE_SLOW_MS", "0"))
+PROFILE_EVERY = int(os.environ.get("OPD_PROFILE_EVERY", "10"))
+# Quantiles of the per-tree predictions returned with each prediction ("off" to disable);
+# requests can override them with ?quantiles=0.25,0.75
+DEFAULT_QUANTILES = os.environ.get("OPD_PREDICTION_QUANTILES", "0.1,0.9")
+# /admin endpoints require this value in the X-Admin-Token header (unset: they are disabled)
+ADMIN_TOKEN = os.environ.get("OPD_ADMIN_TOKEN")
+# SQLite file with issued tokens and visits, shared by all workers ("off" for in-memory tokens)
+TOKEN_STORE_PATH = os.environ.get("OPD_TOKEN_STORE", os.path.join(ARTIFACTS_DIR, "visits.db"))
+# Previous model versions kept loaded and warmed up next to the active one, for instant rollback
+KEEP_LOADED_VERSIONS = int(os.environ.get("OPD_KEEP_LOADED_VERSIONS", "2"))
+# Seconds between checks of the registry history, so every worker follows promotions, rollbacks
+# and retrains done by another worker (0 disables)
+REGISTRY_POLL_SECONDS = float(os.environ.get("OPD_REGISTRY_POLL_SECONDS", "1"))
+
+# Persistent visits and the token sequence shared by all workers
+token_store = TokenStore(TOKEN_STORE_PATH) if TOKEN_STORE_PATH.lower() != "off" else None
+# Live per-doctor queues; issues the token numbers (from the token store when enabled)
+queue_engine = QueueEngine(store=token_store)
+# Server-sent events for live dashboards (see /events)
+event_bus = EventBus()
+queue_engine.add_listener(
+    lambda action, entry, row: event_bus.publish(f"token_{action}", {"token": entry.to_dict(), "queue": row})
+)
+# Samples routing candidates (numpy Generators serialize calls internally)
+routing_rng = np.random.default_rng()
+
+# The active ModelBundle. Replaced in a single assignment; handlers read it once per request.
+bundle = None
+# True once a model is loaded (and warmed up, if enabled); see /health/ready
+ready = False
+# Loaded bundles by version: the active one and up to KEEP_LOADED_VERSIONS previous ones
+loaded_bundles = {}
+# Serializes promotions, rollbacks and post-retrain swaps
+_swap_lock = threading.Lock()
+# Last registry history stamp followed by this worker (under _follow_lock), and the signal
+# stopping its watcher thread
+_registry_stamp = None
+_follow_lock = threading.Lock()
+_registry_watch_stop = threading.Event()
 
-model = None
-label_encoders = None
+def _memory_usage():
+    """Resident memory of this process in MB: total, private (anon) and file-backed (shareable)."""
+    usage = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "RssAnon", "RssFile"):
+                    usage[key] = int(value.split()[0]) / 1024
+    except OSError:
+        import resource
+        # ru_maxrss is peak RSS (kB on Linux, bytes on macOS)
+        usage["VmRSS"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return usage
+
+def _load_version(version):
+    """Loads and warms up one registered version and keeps it in loaded_bundles. Returns it or None."""
+    start = time.perf_counter()
+    new_bundle = load_bundle(registry.version_dir(version), PREDICTION_TABLE_MODE, USE_FLAT_FOREST, USE_MODEL_MMAP,
+                             table_quantiles=_parse_quantiles(None))
+    if new_bundle is None:
+        return None
+    load_s = time.perf_counter() - start
+    warmup = f", warm-up {warm_up(new_bundle):.3f}s" if WARMUP else ""
+    loaded_bundles[version] = new_bundle
+    mem = _memory_usage()
+    print(
+        f"[pid {os.getpid()}] Model {version} loaded in {load_s:.3f}s{warmup} "
+        f"({type(new_bundle.model).__name__}{', mmap' if USE_MODEL_MMAP else ''}); "
+        f"RSS {mem.get('VmRSS', 0):.1f} MB"
+        + (f" (private {mem['RssAnon']:.1f} MB, shared/file {mem['RssFile']:.1f} MB)" if "RssAnon" in mem else "")
+    )
+    return new_bundle
+
+def _swap(new_bundle):
+    """Makes new_bundle the serving bundle (one assignment) and returns the previous one."""
+    global bundle, ready
+    previous, bundle = bundle, new_bundle
+    ready = True
+    event_bus.publish("model_version", {
+        "version": new_bundle.version,
+        "previous_version": previous.version if previous else None,
+        "loaded_at": new_bundle.loaded_at,
+    })
+    return previous
+
+def _trim_loaded():
+    """Drops loaded bundles that are neither active nor among the recent previous versions."""
+    keep = set(registry.recent_versions(KEEP_LOADED_VERSIONS + 1))
+    for version in list(loaded_bundles):
+        if version not in keep:
+            del loaded_bundles[version]
 
 def load_model_artifacts():
-    global model, label_encoders
-    if os.path.exists(MODEL_PATH):
-        model = joblib.load(MODEL_PATH)
-        label_encoders = load_processors(LABEL_ENCODERS_PATH)
-    else:
-        print("Model not found. Please train the model first.")
+    """
+    Loads the active registry version, swaps it in and preloads the previous versions.
+    On first start a model trained into the plain artifacts directory is imported
+    into the registry. Returns the new bundle or None.
+    """
+    with _swap_lock:
+        version = registry.active_version()
+        if version is None:
+            if not os.path.exists(os.path.join(ARTIFACTS_DIR, MODEL_FILE)):
+                print("Model not found. Please train the model first.")
+                return None
+            version = registry.import_dir(ARTIFACTS_DIR)
+            registry.activate(version)
+        new_bundle = loaded_bundles.get(version) or _load_version(version)
+        if new_bundle is None:
+            print(f"Model {version} could not be loaded.")
+            return None
+        _swap(new_bundle)
+        for previous in registry.recent_versions(KEEP_LOADED_VERSIONS + 1)[1:]:
+            if previous not in loaded_bundles:
+                _load_version(previous)
+        _trim_loaded()
+    return new_bundle
+
+def _promote(version, persist):
+    """
+    Swaps a registered version in. Versions that are still loaded are swapped in with no
+    disk I/O or warm-up; others are loaded first. persist() records the change in the
+    registry once the new bundle is serving. Returns a summary dict.
+    """
+    start = time.perf_counter()
+    with _swap_lock:
+        new_bundle = loaded_bundles.get(version)
+        from_disk = new_bundle is None
+        if from_disk:
+            new_bundle = _load_version(version)
+            if new_bundle is None:
+                raise HTTPException(status_code=500, detail=f"Model {version} could not be loaded")
+        previous = _swap(new_bundle)
+        swap_s = time.perf_counter() - start
+        persist()
+        _trim_loaded()
+    print(f"[pid {os.getpid()}] Model {version} active ({'loaded from disk' if from_disk else 'swapped in memory'})")
+    return {
+        "model_version": version,
+        "previous_version": previous.version if previous else None,
+        "loaded_from_disk": from_disk,
+        "swap_seconds": swap_s,
+    }
+
+def _follow_registry():
+    """
+    Swaps in the registry's active version if it changed since the last check (another
+    worker promoted, rolled back or retrained). Only stats the history file when nothing
+    changed. Returns True if a new bundle was swapped in.
+    """
+    global _registry_stamp
+    with _follow_lock:
+        stamp = registry.history_stamp()
+        if stamp is None or stamp == _registry_stamp:
+            return False
+        _registry_stamp = stamp
+        current = bundle
+        version = registry.active_version()
+        if current is not None and current.version == version:
+            return False
+        print(f"[pid {os.getpid()}] Registry active version is now {version}; following")
+        return load_model_artifacts() is not None
+
+def _watch_registry():
+    while not _registry_watch_stop.wait(REGISTRY_POLL_SECONDS):
+        try:
+            _follow_registry()
+        except Exception as e:
+            print(f"[pid {os.getpid()}] Registry check failed: {e}")
+
+if PROFILE_SLOW_MS > 0:
+    slow_profiler = profiler.SlowRequestProfiler(PROFILE_SLOW_MS, PROFILE_EVERY)
+
+    class ProfiledRoute(APIRoute):
+        """Routes whose sync handlers tell a running slow-request sampler which thread they run in."""
+
+        def __init__(self, path, endpoint, **kwargs):
+            if not inspect.iscoroutinefunction(endpoint):
+                endpoint = profiler.in_request_thread(endpoint)
+            super().__init__(path, endpoint, **kwargs)
+
+    # Must be set before the routes below are declared
+    app.router.route_class = ProfiledRoute
+
+    @app.middleware("http")
+    async def profile_slow_requests(request: Request, call_next):
+        if request.url.path.startswith(("/events", "/admin")):
+            return await call_next(request)
+        sampler = slow_profiler.begin()
+        start = time.perf_counter()
+        try:
+            return await call_next(request)
+        finally:
+            name = slow_profiler.end(sampler, time.perf_counter() - start, request.url.path.strip("/").replace("/", "_"))
+            if name:
+                print(f"Slow request profile saved: {name}")
 
 @app.on_event("startup")
 async def startup_event():
     load_model_artifacts()
+    start_prediction_log()
+    profiler.install_signal_handler()
+    if REGISTRY_POLL_SECONDS > 0:
+        _registry_watch_stop.clear()
+        threading.Thread(target=_watch_registry, name="registry-watcher", daemon=True).start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    _registry_watch_stop.set()
+    stop_prediction_log()
 
 @app.get("/")
 def read_root():
     return {"message": "OPD Flow Optimizer API is running"}
 
+@app.get("/health/live")
+def liveness():
+    """The process is up and serving HTTP (it may still have no model)."""
+    return {"status": "alive", "pid": os.getpid()}
+
+@app.get("/health/ready")
+def readiness():
+    """200 once a model is loaded and warmed up, 503 before; use for load balancer checks."""
+    current = bundle
+    if not ready or current is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    return {"status": "ready", "model_version": current.version, "warmed_up": WARMUP}
+
+def _parse_quantiles(text):
+    """"0.1,0.9" -> (0.1, 0.9); "off" or "" -> ()."""
+    text = DEFAULT_QUANTILES if text is None else text
+    if text.strip().lower() in ("", "off", "none"):
+        return ()
+    try:
+        quantiles = tuple(sorted({float(q) for q in text.split(",")}))
+    except ValueError:
+        quantiles = (-1.0,)
+    if not all(0.0 <= q <= 1.0 for q in quantiles):
+        raise HTTPException(status_code=422, detail=f"Quantiles must be numbers between 0 and 1: {text}")
+    return quantiles
+
+def _interval_fields(quantiles, values):
+    """Response fields for one row's quantile values (empty without quantiles)."""
+    if not quantiles:
+        return {}
+    values = [float(v) for v in values]
+    return {
+        "WaitTime_Low_Minutes": values[0],
+        "WaitTime_High_Minutes": values[-1],
+        "WaitTime_Quantiles": {f"{q:g}": v for q, v in zip(quantiles, values)},
+    }
+
 @app.post("/predict", response_model=PredictionResponse)
-def predict_wait_time(patient: PatientBase):
-    if not model or not label_encoders:
+def predict_wait_time(patient: PatientBase, quantiles: Optional[str] = None):
+    """
+    Predicts the wait and issues a token. The response includes the spread of the
+    forest's tree predictions (quantiles, default OPD_PREDICTION_QUANTILES) from the
+    same pass over the trees as the point prediction.
+    """
+    quantiles = _parse_quantiles(quantiles)
+    telemetry.inc("opd_requests_total", endpoint="predict")
+    current = bundle
+    if current is None:
+        telemetry.inc("opd_request_errors_total", endpoint="predict")
         raise HTTPException(status_code=503, detail="Model not loaded")
     
-    # Preprocess Input
     try:
-        # Prepare DataFrame
-        data = {
-            'Department': [patient.Department],
-            'PriorityFlag': [patient.PriorityFlag],
-            'DayOfWeek': [patient.ScheduledTime.weekday()],
-            'HourOfDay': [patient.ScheduledTime.hour],
-            'DoctorID': [patient.DoctorID] if patient.DoctorID else ["UNKNOWN"] 
-        }
-        
-        # Simple Routing Logic if DoctorID is missing
-        if not patient.DoctorID or patient.DoctorID == "UNKNOWN":
-            # Assign a doctor if one isn't specified.
-            # In a real system, this would check availability.
-            # For MVP, pick a random doctor from the known doctors.
-            if label_encoders and 'DoctorID' in label_encoders:
-                # Pick a random doctor from trained classes
-                known_doctors = label_encoders['DoctorID'].classes_
-                # Filter out 'UNKNOWN' if it exists in classes
-                valid_doctors = [d for d in known_doctors if d != 'UNKNOWN']
-                if valid_doctors:
-                    data['DoctorID'] = [np.random.choice(valid_doctors)]
-                else:
-                    data['DoctorID'] = ["DOC_001"]
-            else:
-                data['DoctorID'] = ["DOC_001"] # Fallback
-        
-        df = pd.DataFrame(data)
-        
-        # Encode inputs
-        for col, le in label_encoders.items():
-            if col in df.columns:
-                # Handle unseen labels by assigning a default or mode
-                try:
-                    df[col] = le.transform(df[col].astype(str))
-                except ValueError:
-                    # If unseen label, use the first class (0)
-                    df[col] = 0
-
-        # Predict
-        predicted_wait = model.predict(df[['Department', 'PriorityFlag', 'DayOfWeek', 'HourOfDay', 'DoctorID']])[0]
-        
-        # Post-process
-        token_num = np.random.randint(100, 999) # Simulated token
-        predicted_consult_time = patient.ScheduledTime + timedelta(minutes=float(predicted_wait))
+        with telemetry.timer("opd_request_seconds", endpoint="predict"):
+            # Route to the least-loaded doctor if DoctorID is missing; routing already scores the winner
+            with telemetry.stage("predict", "route"):
+                [doctor_id], [predicted_wait], [spread] = _assign_doctors([patient], current, quantiles)
+
+            if predicted_wait is None:
+                # Encode inputs straight from the request; unseen labels fall back to code 0
+                with telemetry.stage("predict", "encode"):
+                    X, unknown = encode_features(
+                        [(patient.Department, patient.PriorityFlag, patient.ScheduledTime, doctor_id)],
+                        current.category_lookups
+                    )
+                telemetry.count_unknown("predict", unknown)
+                with telemetry.stage("predict", "model"):
+                    point, spreads = current.score_quantiles(X, quantiles)
+                predicted_wait = point[0]
+                spread = spreads[:, 0] if spreads is not None else None
+            elif patient.Department not in current.category_lookups["Department"]:
+                telemetry.count_unknown("predict", [["Department"]])
+            
+            # Post-process: issue a token and join the doctor's queue
+            with telemetry.stage("predict", "enqueue"):
+                entry = queue_engine.enqueue(
+                    patient.Department, doctor_id, patient.PriorityFlag, float(predicted_wait),
+                    scheduled_time=patient.ScheduledTime,
+                )
+            predicted_consult_time = patient.ScheduledTime + timedelta(minutes=float(predicted_wait))
+            
+            with telemetry.stage("predict", "response"):
+                response = PredictionResponse(
+                    TokenNumber=entry.token,
+                    DoctorID=doctor_id,
+                    WaitTime_Minutes=float(predicted_wait),
+                    PredictedConsultTime=predicted_consult_time,
+                    **_interval_fields(quantiles, spread),
+                )
+            
+            with telemetry.stage("predict", "drift"):
+                current.drift.observe(
+                    [(patient.Department, patient.PriorityFlag, patient.ScheduledTime, doctor_id)], [predicted_wait]
+                )
+
+            with telemetry.stage("predict", "log"):
+                log_prediction(patient.dict(), response.dict())
+            return response
         
-        response = PredictionResponse(
-            TokenNumber=token_num,
-            DoctorID=data['DoctorID'][0] if isinstance(data['DoctorID'][0], str) else "DOC_ASSIGNED", # Simplified
-            WaitTime_Minutes=float(predicted_wait),
-            PredictedConsultTime=predicted_consult_time
+    except Exception as e:
+        telemetry.inc("opd_request_errors_total", endpoint="predict")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _assign_doctors(patients, current, quantiles=()):
+    """
+    Returns (doctor_ids, predicted_waits, spreads) for the patients. A given DoctorID
+    is kept (predicted wait and spread None, scored by the caller). Otherwise the
+    bundle's router picks between two doctors of the department by live queue depth
+    plus the predicted wait, scoring all candidates (with quantiles) in one model call.
+    """
+    doctors = [p.DoctorID if p.DoctorID and p.DoctorID != "UNKNOWN" else None for p in patients]
+    waits = [None] * len(patients)
+    spreads = [None] * len(patients)
+    unrouted = [i for i, d in enumerate(doctors) if d is None]
+    if not unrouted:
+        return doctors, waits, spreads
+
+    scored = {}
+    def predict(pairs):
+        X, _ = encode_features(
+            ((patients[unrouted[i]].Department, patients[unrouted[i]].PriorityFlag,
+              patients[unrouted[i]].ScheduledTime, doc) for i, doc in pairs),
+            current.category_lookups
         )
-        
-        log_prediction(patient.dict(), response.dict())
-        return response
-        
+        point, scored["quantiles"] = current.score_quantiles(X, quantiles)
+        return point
+
+    # Each candidate's queue depth is read once per call (a COUNT query with the token store)
+    queue_depth = functools.lru_cache(maxsize=None)(queue_engine.queue_length)
+    routed, routed_waits, picks = current.router.choose_many(
+        [patients[i].Department for i in unrouted], predict, queue_depth, routing_rng
+    )
+    for i, doctor, wait, k in zip(unrouted, routed, routed_waits, picks):
+        if doctor is None:
+            doctors[i] = "DOC_001" # Fallback
+            continue
+        doctors[i], waits[i] = doctor, wait
+        if scored.get("quantiles") is not None:
+            spreads[i] = scored["quantiles"][:, k]
+    return doctors, waits, spreads
+
+@app.post("/predict/batch", response_model=BatchPredictionResponse)
+def predict_wait_time_batch(patients: List[PatientBase], quantiles: Optional[str] = None):
+    """
+    Scores a list of patients with a single model call (plus one to route the
+    patients without a DoctorID). Rows with unknown categories are reported
+    individually instead of failing the batch. Quantiles work as for /predict.
+    """
+    quantiles = _parse_quantiles(quantiles)
+    telemetry.inc("opd_requests_total", endpoint="batch")
+    current = bundle
+    if current is None:
+        telemetry.inc("opd_request_errors_total", endpoint="batch")
+        raise HTTPException(status_code=503, detail="Model not loaded")
+
+    try:
+        with telemetry.timer("opd_request_seconds", endpoint="batch"):
+            n = len(patients)
+            with telemetry.stage("batch", "route"):
+                doctors, _, _ = _assign_doctors(patients, current)
+            with telemetry.stage("batch", "encode"):
+                X, unknown = encode_features(
+                    ((p.Department, p.PriorityFlag, p.ScheduledTime, d) for p, d in zip(patients, doctors)),
+                    current.category_lookups
+                )
+            telemetry.count_unknown("batch", unknown)
+
+            errors = [None] * n
+            for i, cols in enumerate(unknown):
+                if cols:
+                    labels = {'Department': patients[i].Department, 'DoctorID': doctors[i]}
+                    errors[i] = "; ".join(f"Unknown {col}: {labels[col]}" for col in cols)
+
+            ok = np.array([e is None for e in errors], dtype=bool)
+            predicted = np.zeros(n)
+            spread = np.zeros((len(quantiles), n))
+            if ok.any():
+                with telemetry.stage("batch", "model"):
+                    point, spreads = current.score_quantiles(X[ok], quantiles)
+                predicted[ok] = point
+                if spreads is not None:
+                    spread[:, ok] = spreads
+
+            # Queueing (one token store transaction), response building and logging, for all rows
+            results = []
+            with telemetry.stage("batch", "enqueue"):
+                entries = iter(queue_engine.enqueue_many(
+                    (p.Department, doctors[i], p.PriorityFlag, float(predicted[i]), p.ScheduledTime)
+                    for i, p in enumerate(patients) if ok[i]
+                ))
+            with telemetry.stage("batch", "respond"):
+                for i, patient in enumerate(patients):
+                    if errors[i] is not None:
+                        results.append(BatchPredictionItem(index=i, error=errors[i]))
+                        continue
+                    wait = float(predicted[i])
+                    entry = next(entries)
+                    response = PredictionResponse(
+                        TokenNumber=entry.token,
+                        DoctorID=doctors[i],
+                        WaitTime_Minutes=wait,
+                        PredictedConsultTime=patient.ScheduledTime + timedelta(minutes=wait),
+                        **_interval_fields(quantiles, spread[:, i]),
+                    )
+                    log_prediction(patient.dict(), response.dict())
+                    results.append(BatchPredictionItem(index=i, prediction=response))
+            with telemetry.stage("batch", "drift"):
+                current.drift.observe(
+                    ((p.Department, p.PriorityFlag, p.ScheduledTime, d) for p, d in zip(patients, doctors)),
+                    [float(w) if good else None for w, good in zip(predicted, ok)],
+                )
+
+        n_success = int(ok.sum())
+        return BatchPredictionResponse(results=results, n_success=n_success, n_failed=n - n_success)
+
     except Exception as e:
+        telemetry.inc("opd_request_errors_total", endpoint="batch")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/predict/file")
+def score_schedule_file(file: UploadFile = File(...), output: str = "ndjson",
+                        chunk_rows: int = bulk_scoring.CHUNK_ROWS, quantiles: Optional[str] = None):
+    """
+    Scores an uploaded schedule file (CSV or Parquet, by file name) in chunks of
+    chunk_rows rows, one model call per chunk, and streams the rows back as NDJSON or
+    CSV (output) while the file is still being read. Rows are not routed, queued or
+    logged; rows that cannot be scored carry an Error. Quantiles work as for /predict.
+    If a later chunk cannot be read, the stream ends with a trailer row (see write_frames).
+    """
+    quantiles = _parse_quantiles(quantiles)
+    telemetry.inc("opd_requests_total", endpoint="file")
+    current = bundle
+    if current is None:
+        telemetry.inc("opd_request_errors_total", endpoint="file")
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    if output not in bulk_scoring.OUTPUT_FORMATS:
+        raise HTTPException(status_code=422, detail=f"output must be one of {', '.join(bulk_scoring.OUTPUT_FORMATS)}")
+
+    try:
+        fmt = bulk_scoring.input_format(file.filename)
+        # Reads and checks the first chunk, so a bad file fails here and not mid-stream
+        chunks = bulk_scoring.open_chunks(file.file, fmt, chunk_rows)
+    except (ValueError, ImportError) as e:
+        telemetry.inc("opd_request_errors_total", endpoint="file")
+        raise HTTPException(status_code=422, detail=str(e))
+
+    def failed(e):
+        # The response has started: the client sees the trailer row, the error counter sees this
+        telemetry.inc("opd_request_errors_total", endpoint="file")
+        print(f"Schedule file scoring stopped mid-file: {e}")
+
+    stage = lambda name: telemetry.stage("file", name)
+    frames = bulk_scoring.score_frames(chunks, current, quantiles, stage)
+    return StreamingResponse(
+        bulk_scoring.write_frames(frames, output, stage, on_error=failed),
+        media_type=bulk_scoring.OUTPUT_FORMATS[output],
+        headers={"X-Model-Version": current.version},
+    )
+
+@app.get("/queue/status", response_model=QueueStatusResponse)
+def queue_status():
+    """Queue length and average waits for every doctor/department queue."""
+    queues = queue_engine.status()
+    return QueueStatusResponse(queues=queues, total_waiting=sum(q["QueueLength"] for q in queues))
+
+@app.post("/queue/doctors/{doctor_id}/next", response_model=QueueEntryResponse)
+def call_next_patient(doctor_id: str, department: Optional[str] = None):
+    """Calls the next patient for a doctor: highest priority first, then earliest arrival."""
+    entry = queue_engine.call_next(doctor_id, department)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No patients waiting")
+    return QueueEntryResponse(**entry.to_dict())
+
+@app.get("/queue/doctors/{doctor_id}/today", response_model=List[QueueEntryResponse])
+def doctor_queue_today(doctor_id: str, department: Optional[str] = None, status: str = "waiting"):
+    """
+    The doctor's visits of today with the given status (waiting, called or cancelled)
+    in call order, across all workers. Needs the token store.
+    """
+    if token_store is None:
+        raise HTTPException(status_code=404, detail="Token store is disabled (OPD_TOKEN_STORE=off)")
+    return [QueueEntryResponse(**QueueEntry.from_row(row).to_dict())
+            for row in token_store.doctor_queue(doctor_id, department=department, status=status)]
+
+@app.delete("/queue/tokens/{token}", response_model=QueueEntryResponse)
+def cancel_token(token: int):
+    entry = queue_engine.cancel(token)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Token is not waiting")
+    return QueueEntryResponse(**entry.to_dict())
+
+def _build_event_snapshot():
+    current = bundle
+    queues = queue_engine.status()
+    return {
+        "queues": queues,
+        "total_waiting": sum(q["QueueLength"] for q in queues),
+        "model_version": current.version if current else None,
+    }
+
+async def _event_snapshot():
+    # The queue totals are an SQLite query; keep it off the event loop
+    return await run_in_threadpool(_build_event_snapshot)
+
+@app.get("/events")
+async def stream_events(last_event_id: Optional[str] = Header(None)):
+    """
+    Server-Sent Events for live displays. The first event is a "snapshot" of all queues
+    and the model version; after that, token_issued / token_called / token_cancelled
+    carry the token and the updated row of its (department, doctor) queue, and
+    model_version is sent when a new model is swapped in. Reconnecting clients resume
+    from Last-Event-ID when those events are still buffered.
+    """
+    after = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+
+    async def body():
+        async for seq, event, payload in event_bus.stream(_event_snapshot, after):
+            yield format_sse(seq, event, payload)
+
+    return StreamingResponse(
+        body(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Request counters and per-stage latency histograms in Prometheus text format."""
+    if not telemetry.ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (OPD_METRICS=0)")
+    return PlainTextResponse(telemetry.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/simulate")
+def simulate_day(request: SimulationRequest):
+    """
+    Monte Carlo simulation of one OPD day for a roster: wait distributions, per-doctor
+    utilization and throughput over n_replications days.
+    """
+    if not 0 <= request.DayOfWeek <= 6 or not 1 <= request.n_replications <= 100_000:
+        raise HTTPException(status_code=422, detail="DayOfWeek must be 0-6 and n_replications 1-100000")
+    import simulation  # pulls in pandas; not needed by prediction-only workers
+    current = bundle
+    params = simulation.load_params(current.artifacts_dir if current else ARTIFACTS_DIR)
+    roster = [s.dict() for s in request.roster] if request.roster is not None \
+        else simulation.default_roster(params, request.DayOfWeek)
+    for i, shift in enumerate(s.dict() for s in request.add_shifts):
+        roster.append({**shift, "DoctorID": shift["DoctorID"] or f"EXTRA-{i + 1}"})
+    for i, shift in enumerate(roster):
+        shift["DoctorID"] = shift["DoctorID"] or f"{shift['Department']}-{i + 1}"
+    try:
+        return simulation.simulate(
+            params, roster, request.DayOfWeek, request.n_replications, seed=request.seed,
+            service_minutes=request.service_minutes, arrival_scale=request.arrival_scale,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+def _check_admin(token):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled (set OPD_ADMIN_TOKEN)")
+    if token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+def profile_worker(seconds: float = 10.0, interval_ms: float = 5.0, x_admin_token: Optional[str] = Header(None)):
+    """
+    Samples every thread of this worker (request handlers, event loop, retrain job) for
+    `seconds` and returns collapsed stacks for flamegraph.pl / speedscope.
+    """
+    _check_admin(x_admin_token)
+    try:
+        return PlainTextResponse(profiler.profile_for(seconds, max(interval_ms, 0.5) / 1000))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/admin/profiles")
+def saved_profiles(x_admin_token: Optional[str] = Header(None)):
+    """Profiles saved by the slow-request middleware and the SIGUSR2 handler, newest first."""
+    _check_admin(x_admin_token)
+    return {"profiles": profiler.list_profiles()}
+
+@app.get("/admin/profiles/{name}", response_class=PlainTextResponse)
+def saved_profile(name: str, x_admin_token: Optional[str] = Header(None)):
+    _check_admin(x_admin_token)
+    text = profiler.read_profile(name)
+    if text is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(text)
+
 @app.get("/mlops/metrics")
 def get_metrics():
-    return get_model_metrics()
+    current = bundle
+    return get_model_metrics(current.artifacts_dir if current else None)
 
-@app.post("/mlops/retrain", response_model=RetrainResponse)
-def retrain_model_endpoint():
-    result = trigger_retraining()
-    # Reload model after retraining
-    load_model_artifacts()
+@app.get("/mlops/drift")
+def drift_report(retrain: bool = False):
+    """
+    Drift of the features and predicted waits served by the active model against its
+    training data: PSI per feature (KS as well for ordinal ones) over the last
+    OPD_DRIFT_WINDOW to 2x OPD_DRIFT_WINDOW rows, from in-memory histograms. With
+    retrain=true a background retrain is started if any feature drifted.
+    """
+    current = bundle
+    if current is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    report = current.drift.report()
+    report["model_version"] = current.version
+    if retrain and report["drifted"]:
+        job = submit_job("retrain", _retrain_and_swap)
+        report["retrain_job_id"] = job.id
+    return report
+
+@app.get("/mlops/models")
+def list_models():
+    """Registered model versions, newest first, with which one is active and which are loaded."""
+    current = bundle
+    versions = registry.list_versions()
+    for v in versions:
+        v["loaded"] = v["version"] in loaded_bundles
+    return {
+        "active": current.version if current else None,
+        "rollback_to": registry.previous_version(),
+        "versions": versions,
+    }
+
+@app.post("/mlops/models/{version}/promote")
+def promote_model(version: str):
+    """Makes a registered version active; instant if it is still loaded."""
+    if not registry.exists(version):
+        raise HTTPException(status_code=404, detail="Model version not found")
+    return _promote(version, lambda: registry.activate(version))
+
+@app.post("/mlops/models/rollback")
+def rollback_model():
+    """Returns to the version that was active before the current one."""
+    version = registry.previous_version()
+    if version is None:
+        raise HTTPException(status_code=409, detail="No previous model version to roll back to")
+    return _promote(version, registry.rollback)
+
+def _retrain_and_swap(report, **train_kwargs):
+    """Job body: retrain, then load, activate and swap in the new version."""
+    result = trigger_retraining(progress=report, **train_kwargs)
+    if result["status"] == "Success":
+        report("Loading new model", 0.95)
+        try:
+            _promote(result["model_version"], lambda: registry.activate(result["model_version"]))
+        except HTTPException:
+            result = {"status": "Failed", "message": "Retrained model could not be loaded"}
+    telemetry.inc("opd_retrains_total", status=result["status"])
+    return result
+
+def _retrain_response(job):
+    data = job.to_dict()
+    result = data.pop("result")
     return RetrainResponse(
-        status=result["status"],
-        model_version="v1.1" if result["status"] == "Success" else "v1.0", # Mock version increment
-        metrics=result.get("new_metrics", {})
+        **data,
+        model_version=result.get("model_version"),
+        metrics=result.get("new_metrics", {}),
     )
 
+@app.get("/mlops/prediction-log")
+def prediction_log_stats():
+    return get_prediction_log_stats()
+
+@app.post("/mlops/retrain", response_model=RetrainResponse, status_code=202)
+def retrain_model_endpoint(tune: bool = False, budget: float = 300.0):
+    """
+    Starts retraining in the background and returns the job.
+    Poll /mlops/retrain/{job_id}; the new model is swapped in when the job succeeds.
+    With tune=true a parallel hyperparameter search runs first, limited to budget seconds.
+    While a retrain is running, the same request returns that job; one with other
+    parameters gets 409 with the running job's parameters.
+    """
+    params = {"tune": tune, "budget": budget}
+    job = submit_job("retrain", lambda report: _retrain_and_swap(report, tune=tune, time_budget=budget), params)
+    if job.params != params:
+        raise HTTPException(status_code=409, detail={
+            "message": "A retrain with different parameters is already running",
+            "job_id": job.id,
+            "params": job.params,
+        })
+    return _retrain_response(job)
+
+@app.get("/mlops/retrain/{job_id}", response_model=RetrainResponse)
+def retrain_status(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _retrain_response(job)
+
 # Serve Frontend disabled - use separate dev server or build
 # if os.path.exists(FRONTEND_DIST):
 #     app.mount("/", StaticFiles(directory=FRONTEND_DIST, html=True), name="static")
@@ -1,28 +1,45 @@
 import os
 import json
-import joblib
 from datetime import datetime
-from model import train_model
+from prediction_log import PredictionLog, make_record
+import registry
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 METRICS_PATH = os.path.join(BASE_DIR, "artifacts", "model_metrics.json")
 
-def get_model_metrics():
-    """Returns the latest model metrics."""
-    if not os.path.exists(METRICS_PATH):
+# Prediction log settings; set OPD_PREDICTION_LOG=off to disable logging
+PREDICTION_LOG_PATH = os.environ.get("OPD_PREDICTION_LOG", os.path.join(BASE_DIR, "artifacts", "predictions.db"))
+PREDICTION_LOG_CAPACITY = int(os.environ.get("OPD_PREDICTION_LOG_CAPACITY", "10000"))
+PREDICTION_LOG_BATCH_SIZE = int(os.environ.get("OPD_PREDICTION_LOG_BATCH_SIZE", "500"))
+PREDICTION_LOG_POLICY = os.environ.get("OPD_PREDICTION_LOG_POLICY", "drop_newest")
+
+_prediction_log = None
+
+def get_model_metrics(artifacts_dir=None):
+    """Returns the metrics of the model in artifacts_dir (default: the active registry version)."""
+    artifacts_dir = artifacts_dir or registry.active_dir(os.path.dirname(METRICS_PATH))
+    path = os.path.join(artifacts_dir, os.path.basename(METRICS_PATH))
+    if not os.path.exists(path):
         return {"error": "No metrics found. Model might not be trained."}
     
-    with open(METRICS_PATH, "r") as f:
+    with open(path, "r") as f:
         return json.load(f)
 
-def trigger_retraining():
-    """Triggers model retraining and returns status."""
+def trigger_retraining(progress=None, **train_kwargs):
+    """
+    Triggers model retraining and returns status. progress(stage, fraction) is optional;
+    train_kwargs (e.g. tune, time_budget) are passed to train_model.
+    The new model is registered as a new version but not activated.
+    The training stack (model, scikit-learn, pandas) is only imported here.
+    """
     try:
-        train_model()
-        metrics = get_model_metrics()
+        from model import train_model
+        version = train_model(progress=progress, **train_kwargs)
+        metrics = get_model_metrics(registry.version_dir(version))
         return {
             "status": "Success",
             "message": "Model retrained successfully.",
+            "model_version": version,
             "new_metrics": metrics,
             "timestamp": datetime.now().isoformat()
         }
@@ -33,8 +50,35 @@ def trigger_retraining():
             "timestamp": datetime.now().isoformat()
         }
 
+def start_prediction_log():
+    """Starts the background prediction log writer (no-op if disabled or already running)."""
+    global _prediction_log
+    if _prediction_log is not None or PREDICTION_LOG_PATH.lower() == "off":
+        return
+    log = PredictionLog(
+        PREDICTION_LOG_PATH,
+        capacity=PREDICTION_LOG_CAPACITY,
+        batch_size=PREDICTION_LOG_BATCH_SIZE,
+        policy=PREDICTION_LOG_POLICY,
+    )
+    log.start()
+    _prediction_log = log
+
+def stop_prediction_log():
+    """Flushes buffered records and stops the writer."""
+    global _prediction_log
+    if _prediction_log is not None:
+        _prediction_log.stop()
+        _prediction_log = None
+
+def get_prediction_log_stats():
+    """Returns queued/written/dropped counters of the prediction log."""
+    if _prediction_log is None:
+        return {"enabled": False}
+    return {"enabled": True, **_prediction_log.stats()}
+
 def log_prediction(input_data, prediction):
-    """Logs prediction for monitoring (mock implementation)."""
-    # In a real system, this would write to a database or a file.
-    # For MVP, we'll just print or pass.
-    pass
+    """Buffers a prediction for the background log writer; never blocks on disk."""
+    log = _prediction_log
+    if log is not None:
+        log.enqueue(make_record(input_data, prediction))
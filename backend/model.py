@@ -5,7 +5,17 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error, mean_absolute_error
 import os
 import json
+import time
+import shutil
+from datetime import datetime
 from preprocessing import load_data, preprocess_data, save_processors
+from evaluation import rolling_origin_cv, CV_FOLDS
+from forest import FlatForest
+from serving import export_mmap_artifacts
+from routing import save_routing
+import simulation
+import registry
+import drift
 
 # Configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -13,46 +23,167 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Assuming data file is in project root, backend is in backend/
 PROJECT_ROOT = os.path.dirname(BASE_DIR)
 DATA_PATH = os.path.join(PROJECT_ROOT, "opd_flow_optimizer_synthetic_fixed.xlsx")
+# Additional visit exports (e.g. one file per month) appended to the base dataset
+EXTRA_DATA_DIR = os.path.join(PROJECT_ROOT, "data")
+DATA_EXTENSIONS = (".xlsx", ".csv", ".parquet")
 MODEL_DIR = os.path.join(BASE_DIR, "artifacts")
 MODEL_PATH = os.path.join(MODEL_DIR, "opd_model.pkl")
+# Array-backed copy of the forest used for inference (see forest.FlatForest)
+FLAT_MODEL_PATH = os.path.join(MODEL_DIR, "opd_model_flat.npz")
 METRICS_PATH = os.path.join(MODEL_DIR, "model_metrics.json")
+N_ESTIMATORS = 100
+# Trees are grown in this many warm-start rounds so progress can be reported.
+# With a fixed random_state the result is identical to a single fit.
+FIT_ROUNDS = 10
+
+def _fit_forest(X_train, y_train, report, estimator_cls=RandomForestRegressor, params=None):
+    params = dict(params or {})
+    n_estimators = params.pop("n_estimators", N_ESTIMATORS)
+    model = estimator_cls(n_estimators=0, random_state=42, warm_start=True, **params)
+    step = max(1, n_estimators // FIT_ROUNDS)
+    while model.n_estimators < n_estimators:
+        model.n_estimators = min(n_estimators, model.n_estimators + step)
+        model.fit(X_train, y_train)
+        report(f"Training model ({model.n_estimators}/{n_estimators} trees)",
+               0.2 + 0.6 * model.n_estimators / n_estimators)
+    model.warm_start = False
+    return model
+
+def data_sources():
+    """Returns the base dataset followed by any extra exports in EXTRA_DATA_DIR, in name order."""
+    paths = [DATA_PATH]
+    if os.path.isdir(EXTRA_DATA_DIR):
+        paths += [
+            os.path.join(EXTRA_DATA_DIR, name)
+            for name in sorted(os.listdir(EXTRA_DATA_DIR))
+            if name.lower().endswith(DATA_EXTENSIONS)
+        ]
+    return paths
+
+def train_model(progress=None, output_dir=None, df=None, tune=False, time_budget=300.0, n_workers=None,
+                cv_folds=CV_FOLDS):
+    """
+    Trains the wait-time model and writes model, encoders and metrics to output_dir.
+    Without output_dir the bundle is added to the model registry as a new version
+    (not activated). Returns the content version of the bundle.
+    progress, if given, is called as progress(stage, fraction) as training advances.
+    df overrides the training data from data_sources().
+    With tune, hyperparameters are searched in parallel (see tuning.search) within
+    time_budget seconds before the winner is fitted on the full training set.
+    With cv_folds > 0 the configuration is also evaluated with rolling-origin folds on
+    ScheduledTime (see evaluation.py); the report is stored under "time_cv" in the metrics.
+    """
+    if output_dir is not None:
+        return _train(progress, output_dir, df, tune, time_budget, n_workers, cv_folds)
+    staging = registry.staging_dir()
+    try:
+        _train(progress, staging, df, tune, time_budget, n_workers, cv_folds)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return registry.register(staging)
+
+def _train(progress, output_dir, df, tune, time_budget, n_workers, cv_folds):
+    report = progress or (lambda stage, fraction: None)
 
-def train_model():
     print("Loading data...")
-    df = load_data(DATA_PATH)
+    report("Loading data", 0.0)
+    if df is None:
+        df = load_data(data_sources())
     
     print("Preprocessing data...")
+    report("Preprocessing data", 0.1)
     X_train, X_test, y_train, y_test, label_encoders = preprocess_data(df)
     
+    search_summary = None
+    estimator_cls, params = RandomForestRegressor, None
+    if tune:
+        from tuning import search, MODEL_CLASSES
+        print(f"Tuning hyperparameters (budget {time_budget:.0f}s)...")
+        search_start = time.perf_counter()
+        best, log = search(
+            X_train, y_train, time_budget=time_budget, n_workers=n_workers,
+            report=lambda stage, fraction: report(stage, 0.1 + 0.1 * fraction),
+        )
+        estimator_cls, params = MODEL_CLASSES[best["model"]], best["params"]
+        print(f"Best: {best['model']} {best['params']} (validation RMSE {best['rmse']:.2f})")
+        search_summary = {
+            "best": best,
+            "time_budget_s": time_budget,
+            "elapsed_s": time.perf_counter() - search_start,
+            "n_evaluations": len(log),
+            "log": log,
+        }
+
     print("Training model...")
-    model = RandomForestRegressor(n_estimators=100, random_state=42)
-    model.fit(X_train, y_train)
+    report("Training model", 0.2)
+    model = _fit_forest(X_train, y_train, report, estimator_cls, params)
     
     print("Evaluating model...")
+    report("Evaluating model", 0.8)
     y_pred = model.predict(X_test)
     rmse = np.sqrt(mean_squared_error(y_test, y_pred))
     mae = mean_absolute_error(y_test, y_pred)
     
     print(f"RMSE: {rmse:.2f}")
     print(f"MAE: {mae:.2f}")
+
+    time_cv = None
+    if cv_folds > 0:
+        print(f"Rolling-origin cross-validation ({cv_folds} folds)...")
+        X_all, y_all = pd.concat([X_train, X_test]), pd.concat([y_train, y_test])
+        time_cv = rolling_origin_cv(
+            X_all, y_all, df.loc[X_all.index, "ScheduledTime"], label_encoders, estimator_cls,
+            {"n_estimators": N_ESTIMATORS, **(params or {})}, n_folds=cv_folds, n_workers=n_workers,
+            report=lambda stage, fraction: report(stage, 0.8 + 0.08 * fraction),
+        )
+        print(f"Time-ordered RMSE: {time_cv['rmse']:.2f} over {time_cv['n_folds']} folds "
+              f"(fold std {time_cv['rmse_fold_std']:.2f}, {time_cv['elapsed_s']:.1f}s)")
     
     # Save Artifacts
     print("Saving artifacts...")
-    os.makedirs(MODEL_DIR, exist_ok=True)
-    joblib.dump(model, MODEL_PATH)
-    save_processors(label_encoders, MODEL_DIR)
+    report("Saving artifacts", 0.9)
+    os.makedirs(output_dir, exist_ok=True)
+    joblib.dump(model, os.path.join(output_dir, os.path.basename(MODEL_PATH)))
+    flat = FlatForest.from_sklearn(model)
+    flat.save(os.path.join(output_dir, os.path.basename(FLAT_MODEL_PATH)))
+    save_processors(label_encoders, output_dir)
+    export_mmap_artifacts(flat, label_encoders, output_dir)
+    save_routing(df, output_dir)
+    simulation.save_params(df, output_dir)
+    drift.save_reference(X_train, label_encoders, model.predict(X_train), output_dir)
     
     # Save Metrics
+    version = registry.content_version(output_dir)
     metrics = {
         "rmse": rmse,
         "mae": mae,
-        "model_version": "v1.0",
-        "description": "RandomForestRegressor trained on synthetic data"
+        "model_version": version,
+        "trained_at": datetime.now().isoformat(),
+        "description": f"{type(model).__name__} trained on synthetic data"
     }
-    with open(METRICS_PATH, "w") as f:
+    if time_cv is not None:
+        metrics["time_cv"] = time_cv
+    if search_summary is not None:
+        metrics["hyperparameters"] = {"model": type(model).__name__, **(params or {})}
+        metrics["tuning"] = search_summary
+    with open(os.path.join(output_dir, os.path.basename(METRICS_PATH)), "w") as f:
         json.dump(metrics, f, indent=4)
         
-    print("Training complete.")
+    print(f"Training complete (version {version}).")
+    report("Training complete", 1.0)
+    return version
 
 if __name__ == "__main__":
-    train_model()
+    import argparse
+    parser = argparse.ArgumentParser(description="Train the OPD wait-time model.")
+    parser.add_argument("--tune", action="store_true", help="search hyperparameters before training")
+    parser.add_argument("--budget", type=float, default=300.0, help="tuning wall-clock budget in seconds")
+    parser.add_argument("--workers", type=int, default=None, help="tuning and cross-validation worker processes (default: all cores)")
+    parser.add_argument("--cv-folds", type=int, default=CV_FOLDS, help="rolling-origin folds (0 to skip)")
+    parser.add_argument("--no-activate", action="store_true", help="register the new version without activating it")
+    args = parser.parse_args()
+    version = train_model(tune=args.tune, time_budget=args.budget, n_workers=args.workers, cv_folds=args.cv_folds)
+    if not args.no_activate:
+        registry.activate(version)
+        print(f"Activated {version}; running servers switch to it within OPD_REGISTRY_POLL_SECONDS")
@@ -0,0 +1,162 @@
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# What to do with a new record when the buffer is full
+DROP_NEWEST = "drop_newest"   # reject the new record
+DROP_OLDEST = "drop_oldest"   # evict the oldest buffered record
+BLOCK = "block"               # wait up to block_timeout for space, then reject
+POLICIES = (DROP_NEWEST, DROP_OLDEST, BLOCK)
+
+COLUMNS = (
+    "logged_at", "department", "priority_flag", "scheduled_time", "requested_doctor_id",
+    "doctor_id", "token_number", "wait_time_minutes", "predicted_consult_time",
+)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    logged_at TEXT NOT NULL,
+    department TEXT,
+    priority_flag INTEGER,
+    scheduled_time TEXT,
+    requested_doctor_id TEXT,
+    doctor_id TEXT,
+    token_number INTEGER,
+    wait_time_minutes REAL,
+    predicted_consult_time TEXT
+)
+"""
+
+class PredictionLog:
+    """
+    Append-only prediction log. enqueue() only appends to a bounded in-memory buffer;
+    a background thread drains it in batches into SQLite (WAL mode).
+    """
+
+    def __init__(self, path, capacity=10000, batch_size=500, flush_interval=1.0,
+                 policy=DROP_NEWEST, block_timeout=0.01):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown drop policy {policy!r}; expected one of {POLICIES}")
+        self.path = path
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+
+    def start(self):
+        conn = self._connect()
+        conn.close()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="prediction-log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stops the writer after flushing what is buffered."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def enqueue(self, record):
+        """Buffers one record (a tuple in COLUMNS order). Returns False if it was dropped."""
+        with self._cond:
+            if len(self._buffer) >= self.capacity:
+                if self.policy == DROP_OLDEST:
+                    self._buffer.popleft()
+                    self.dropped += 1
+                elif self.policy == BLOCK:
+                    self._cond.wait_for(lambda: len(self._buffer) < self.capacity, self.block_timeout)
+                if len(self._buffer) >= self.capacity:
+                    self.dropped += 1
+                    return False
+            self._buffer.append(record)
+            self.queued += 1
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+            return True
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": self.queued,
+                "written": self.written,
+                "dropped": self.dropped,
+                "write_errors": self.write_errors,
+                "pending": len(self._buffer),
+                "capacity": self.capacity,
+                "policy": self.policy,
+                "path": self.path,
+            }
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(SCHEMA)
+        conn.commit()
+        return conn
+
+    def _take_batch(self):
+        with self._cond:
+            if not self._stopping and len(self._buffer) < self.batch_size:
+                self._cond.wait(self.flush_interval)
+            n = min(len(self._buffer), self.batch_size)
+            batch = [self._buffer.popleft() for _ in range(n)]
+            # Wake producers waiting under the BLOCK policy
+            self._cond.notify_all()
+            return batch, self._stopping and not self._buffer
+
+    def _run(self):
+        conn = self._connect()
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        sql = f"INSERT INTO predictions ({', '.join(COLUMNS)}) VALUES ({placeholders})"
+        try:
+            while True:
+                batch, done = self._take_batch()
+                if batch:
+                    try:
+                        with conn:
+                            conn.executemany(sql, batch)
+                        with self._cond:
+                            self.written += len(batch)
+                    except sqlite3.Error as e:
+                        print(f"Prediction log write failed: {e}")
+                        with self._cond:
+                            self.write_errors += 1
+                            self.dropped += len(batch)
+                        time.sleep(self.flush_interval)
+                if done:
+                    break
+        finally:
+            conn.close()
+
+def make_record(input_data, prediction):
+    """Flattens the /predict input and response dicts into a row in COLUMNS order."""
+    def iso(value):
+        return value.isoformat() if isinstance(value, datetime) else value
+    return (
+        datetime.now().isoformat(),
+        input_data.get("Department"),
+        input_data.get("PriorityFlag"),
+        iso(input_data.get("ScheduledTime")),
+        input_data.get("DoctorID"),
+        prediction.get("DoctorID"),
+        prediction.get("TokenNumber"),
+        prediction.get("WaitTime_Minutes"),
+        iso(prediction.get("PredictedConsultTime")),
+    )
@@ -0,0 +1,91 @@
+import os
+import time
+import numpy as np
+from preprocessing import FEATURES
+from forest import forest_quantiles
+
+# PriorityFlag values covered by the table (0 = normal, 1 = high priority)
+N_PRIORITY_LEVELS = 2
+DAYS_PER_WEEK = 7
+HOURS_PER_DAY = 24
+
+class PredictionTable:
+    """
+    Dense array of model outputs over the whole feature grid, indexed in FEATURES order:
+    [Department, PriorityFlag, DayOfWeek, HourOfDay, DoctorID]. With quantiles, the
+    per-tree quantiles of every cell are stored too (quantile_values, one grid per
+    quantile), so requests for those quantiles are lookups as well.
+    """
+
+    def __init__(self, values, quantiles=(), quantile_values=None):
+        self.values = values
+        self.shape = np.array(values.shape)
+        self.quantiles = tuple(quantiles)
+        self.quantile_values = quantile_values
+
+    def predict(self, X, model):
+        """
+        Looks up predictions for an encoded feature matrix.
+        Rows outside the grid (e.g. an unusual PriorityFlag) are scored by the model.
+        """
+        codes = X.astype(np.intp)
+        in_grid = np.all((codes >= 0) & (codes < self.shape), axis=1)
+        if in_grid.all():
+            return self.values[tuple(codes.T)]
+        out = np.empty(len(X))
+        out[in_grid] = self.values[tuple(codes[in_grid].T)]
+        out[~in_grid] = model.predict(X[~in_grid])
+        return out
+
+    def predict_quantiles(self, X, model):
+        """
+        Looks up (point predictions, quantiles with shape (len(self.quantiles), n_rows)).
+        Rows outside the grid are scored by the model.
+        """
+        codes = X.astype(np.intp)
+        in_grid = np.all((codes >= 0) & (codes < self.shape), axis=1)
+        if in_grid.all():
+            index = tuple(codes.T)
+            return self.values[index], self.quantile_values[(slice(None),) + index]
+        point = np.empty(len(X))
+        spread = np.empty((len(self.quantiles), len(X)))
+        index = tuple(codes[in_grid].T)
+        point[in_grid] = self.values[index]
+        spread[:, in_grid] = self.quantile_values[(slice(None),) + index]
+        point[~in_grid], spread[:, ~in_grid] = forest_quantiles(model, X[~in_grid], self.quantiles)
+        return point, spread
+
+def build_prediction_table(model, lookups, path=None, quantiles=()):
+    """
+    Evaluates the model once over the Cartesian product of all features, with the
+    given per-tree quantiles in the same pass.
+    If path is given the table is written there (via a temp file and an atomic rename)
+    and opened memory-mapped, otherwise it is kept in memory. The point grid and the
+    quantile grids are stored stacked in one array.
+    """
+    start = time.perf_counter()
+    shape = (
+        len(lookups['Department']),
+        N_PRIORITY_LEVELS,
+        DAYS_PER_WEEK,
+        HOURS_PER_DAY,
+        len(lookups['DoctorID']),
+    )
+    grid = np.indices(shape).reshape(len(FEATURES), -1).T.astype(np.float64)
+    if quantiles:
+        point, spread = forest_quantiles(model, grid, quantiles)
+        values = np.concatenate([point[None], spread]).reshape((1 + len(quantiles),) + shape)
+    else:
+        values = model.predict(grid).reshape((1,) + shape)
+    values = np.ascontiguousarray(values)
+
+    if path:
+        # Per-process temp name: workers building the table at startup never share one
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            np.save(f, values)
+        os.replace(tmp_path, path)
+        values = np.load(path, mmap_mode="r")
+
+    print(f"Prediction table built: {grid.shape[0]} cells in {time.perf_counter() - start:.2f}s")
+    return PredictionTable(values[0], quantiles, values[1:])
@@ -1,28 +1,46 @@
-import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder, StandardScaler
-import joblib
 import os
 
-def load_data(file_path):
-    """Loads dataset from Excel file."""
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"File not found: {file_path}")
-    return pd.read_excel(file_path)
+# pandas, scikit-learn and joblib are imported inside the training/IO functions, so
+# serving processes that only call encode_features never load them.
 
-def preprocess_data(df):
+FEATURES = ['Department', 'PriorityFlag', 'DayOfWeek', 'HourOfDay', 'DoctorID']
+CATEGORICAL_FEATURES = ['Department', 'DoctorID']
+# Code used for categories never seen in training (matches the old "first class" fallback)
+UNKNOWN_CATEGORY_CODE = 0
+
+def load_data(file_path, use_cache=True):
     """
-    Cleans and processes data for training.
-    Returns X_train, X_test, y_train, y_test, label_encoders, scaler
+    Loads dataset from one file or a list of files (Excel, CSV or Parquet).
+    With use_cache, each file is parsed once and then read from the columnar cache.
+    """
+    paths = [file_path] if isinstance(file_path, (str, os.PathLike)) else list(file_path)
+    for path in paths:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"File not found: {path}")
+    from data_cache import load_many, read_source
+    if use_cache:
+        return load_many(paths)
+    import pandas as pd
+    if len(paths) == 1:
+        return read_source(paths[0])
+    return pd.concat([read_source(p) for p in paths], ignore_index=True)
+
+def build_features(df):
+    """
+    Adds the time features, drops incomplete rows and label-encodes the categoricals.
+    Returns X (FEATURES columns, indexed like df), y and the fitted label encoders.
     """
+    import pandas as pd
+    from sklearn.preprocessing import LabelEncoder
+
     # Feature Engineering
     df['ScheduledTime'] = pd.to_datetime(df['ScheduledTime'])
     df['DayOfWeek'] = df['ScheduledTime'].dt.dayofweek
     df['HourOfDay'] = df['ScheduledTime'].dt.hour
     
     # Select Features and Target
-    features = ['Department', 'PriorityFlag', 'DayOfWeek', 'HourOfDay', 'DoctorID']
+    features = FEATURES
     target = 'WaitTime_Minutes'
     
     # Drop rows with missing target or features
@@ -33,10 +51,21 @@ def preprocess_data(df):
     
     # Encoding Categorical Variables
     label_encoders = {}
-    for col in ['Department', 'DoctorID']:
+    for col in CATEGORICAL_FEATURES:
         le = LabelEncoder()
         X[col] = le.fit_transform(X[col].astype(str))
         label_encoders[col] = le
+    return X, y, label_encoders
+
+def preprocess_data(df):
+    """
+    Cleans and processes data for training.
+    Returns X_train, X_test, y_train, y_test, label_encoders, scaler
+    """
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+
+    X, y, label_encoders = build_features(df)
         
     # Splitting Data
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
@@ -60,6 +89,7 @@ def save_processors(label_encoders, output_dir=None):
     if output_dir is None:
         output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts")
     os.makedirs(output_dir, exist_ok=True)
+    import joblib
     joblib.dump(label_encoders, os.path.join(output_dir, "label_encoders.pkl"))
 
 def load_processors(input_dir=None):
@@ -69,4 +99,67 @@ def load_processors(input_dir=None):
     path = os.path.join(input_dir, "label_encoders.pkl")
     if not os.path.exists(path):
         return None
+    import joblib
     return joblib.load(path)
+
+def compile_lookups(label_encoders):
+    """
+    Compiles fitted LabelEncoders into plain {label: code} dicts.
+    Done once at load time so inference never calls LabelEncoder.transform.
+    """
+    if not label_encoders:
+        return None
+    return {
+        col: {str(label): code for code, label in enumerate(le.classes_)}
+        for col, le in label_encoders.items()
+    }
+
+def encode_features(rows, lookups):
+    """
+    Builds the model feature matrix without pandas.
+    rows: iterable of (Department, PriorityFlag, ScheduledTime, DoctorID) tuples.
+    Returns (X, unknown) where unknown[i] lists the categorical columns of row i
+    whose label was not seen in training; those are encoded as UNKNOWN_CATEGORY_CODE.
+    """
+    rows = list(rows)
+    X = np.empty((len(rows), len(FEATURES)), dtype=np.float64)
+    unknown = [[] for _ in rows]
+    dept_codes = lookups['Department']
+    doctor_codes = lookups['DoctorID']
+    for i, (department, priority, scheduled_time, doctor_id) in enumerate(rows):
+        dept = dept_codes.get(department)
+        if dept is None:
+            unknown[i].append('Department')
+            dept = UNKNOWN_CATEGORY_CODE
+        doctor = doctor_codes.get(doctor_id)
+        if doctor is None:
+            unknown[i].append('DoctorID')
+            doctor = UNKNOWN_CATEGORY_CODE
+        X[i] = (dept, priority, scheduled_time.weekday(), scheduled_time.hour, doctor)
+    return X, unknown
+
+def encode_frame(df, lookups):
+    """
+    Vectorized encode_features for a DataFrame with Department, PriorityFlag,
+    ScheduledTime and DoctorID columns (as read from a CSV or Parquet file).
+    Returns (X, unknown, invalid): unknown maps each categorical column to a mask of
+    rows with an unseen label (encoded as UNKNOWN_CATEGORY_CODE); invalid masks rows
+    whose ScheduledTime or PriorityFlag could not be parsed (their X rows are 0).
+    """
+    import pandas as pd
+
+    scheduled = pd.to_datetime(df['ScheduledTime'], errors='coerce')
+    priority = pd.to_numeric(df['PriorityFlag'], errors='coerce')
+    invalid = (scheduled.isna() | priority.isna()).to_numpy()
+    X = np.zeros((len(df), len(FEATURES)), dtype=np.float64)
+    unknown = {}
+    for j, col in enumerate(FEATURES):
+        if col in CATEGORICAL_FEATURES:
+            codes = df[col].astype(str).map(lookups[col])
+            unknown[col] = codes.isna().to_numpy()
+            X[:, j] = codes.fillna(UNKNOWN_CATEGORY_CODE).to_numpy(dtype=np.float64)
+    X[:, FEATURES.index('PriorityFlag')] = priority.fillna(0).to_numpy(dtype=np.float64)
+    X[:, FEATURES.index('DayOfWeek')] = scheduled.dt.dayofweek.fillna(0).to_numpy(dtype=np.float64)
+    X[:, FEATURES.index('HourOfDay')] = scheduled.dt.hour.fillna(0).to_numpy(dtype=np.float64)
+    X[invalid] = 0.0
+    return X, unknown, invalid
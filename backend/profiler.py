@@ -0,0 +1,197 @@
+import os
+import sys
+import time
+import signal
+import functools
+import threading
+import contextvars
+from collections import Counter
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Saved profiles (signal-triggered and slow-request captures)
+PROFILE_DIR = os.environ.get("OPD_PROFILE_DIR", os.path.join(BASE_DIR, "artifacts", "profiles"))
+DEFAULT_INTERVAL = 0.005
+MAX_PROFILE_SECONDS = 120.0
+SIGNAL_PROFILE_SECONDS = float(os.environ.get("OPD_PROFILE_SIGNAL_SECONDS", "30"))
+
+# Only one process-wide profile runs at a time
+_profile_lock = threading.Lock()
+# Sampler of the slow request being handled in this context, if it is being profiled
+_request_sampler = contextvars.ContextVar("request_sampler", default=None)
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+class StackSampler:
+    """
+    Samples the Python stack of every thread in the process every `interval` seconds
+    from a background thread and counts identical stacks. Covers request handlers in
+    the threadpool, the event loop and the retrain job thread without instrumenting
+    them; the cost is only paid while a sampler is running.
+    `threads` limits sampling to those thread idents (threads may be added while it runs).
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, threads=None):
+        self.interval = interval
+        self.threads = threads
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.counts
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            frames = sys._current_frames()
+            if self.threads is not None:
+                frames = {ident: frames[ident] for ident in list(self.threads) if ident in frames}
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}").replace(";", ","))
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+def collapse(counts):
+    """Collapsed-stack text ("root;caller;callee count" per line), as read by flamegraph.pl or speedscope."""
+    return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+
+def profile_for(seconds, interval=DEFAULT_INTERVAL):
+    """
+    Samples all threads for `seconds` and returns the collapsed stacks.
+    Raises RuntimeError if another profile is already running.
+    """
+    seconds = min(float(seconds), MAX_PROFILE_SECONDS)
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    try:
+        sampler = StackSampler(interval).start()
+        time.sleep(seconds)
+        return collapse(sampler.stop())
+    finally:
+        _profile_lock.release()
+
+def save_profile(text, label):
+    """Writes a collapsed profile to PROFILE_DIR and returns its file name."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}-{label}.collapsed"
+    with open(os.path.join(PROFILE_DIR, name), "w") as f:
+        f.write(text)
+    return name
+
+def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted((n for n in os.listdir(PROFILE_DIR) if n.endswith(".collapsed")), reverse=True)
+
+def read_profile(name):
+    """Contents of a saved profile, or None. Only plain file names inside PROFILE_DIR are served."""
+    if os.path.basename(name) != name or not name.endswith(".collapsed"):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read()
+
+def install_signal_handler(signum=getattr(signal, "SIGUSR2", None), seconds=SIGNAL_PROFILE_SECONDS):
+    """
+    `kill -USR2 <worker pid>` profiles that worker for `seconds` in the background and
+    saves the result to PROFILE_DIR. Must be called from the main thread.
+    """
+    if signum is None:
+        return False
+
+    def run():
+        try:
+            name = save_profile(profile_for(seconds), "signal")
+            print(f"[pid {os.getpid()}] Profile written to {os.path.join(PROFILE_DIR, name)}")
+        except RuntimeError as e:
+            print(f"[pid {os.getpid()}] Profile not started: {e}")
+
+    try:
+        signal.signal(signum, lambda *_: threading.Thread(target=run, name="profile-signal", daemon=True).start())
+    except ValueError:
+        return False  # not in the main thread
+    return True
+
+def in_request_thread(handler):
+    """
+    Wraps a synchronous request handler so that, when its request is being profiled,
+    the threadpool thread running it is sampled too (see SlowRequestProfiler).
+    """
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        sampler = _request_sampler.get()
+        if sampler is None:
+            return handler(*args, **kwargs)
+        ident = threading.get_ident()
+        sampler.threads.add(ident)
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            sampler.threads.discard(ident)
+    return wrapper
+
+class SlowRequestProfiler:
+    """
+    Keeps stack profiles of slow requests. Requests are only timed until every
+    `every`-th slow one; then requests are sampled one at a time until one of them
+    is slow again, and that profile is saved. The sampler never runs otherwise.
+    Only the request's own threads are sampled: the event loop thread that calls
+    begin() and the threadpool thread of a handler wrapped with in_request_thread().
+    """
+
+    def __init__(self, threshold_ms, every=10, interval=0.001):
+        self.threshold = threshold_ms / 1000
+        self.every = max(1, int(every))
+        self.interval = interval
+        self.slow = 0
+        self.armed = False
+        self._lock = threading.Lock()
+
+    def begin(self):
+        """Returns a running sampler if this request should be profiled, else None."""
+        with self._lock:
+            if not self.armed or not _profile_lock.acquire(blocking=False):
+                return None
+            self.armed = False
+        sampler = StackSampler(self.interval, threads={threading.get_ident()}).start()
+        _request_sampler.set(sampler)
+        return sampler
+
+    def end(self, sampler, elapsed, label):
+        """Records the request duration; saves the profile if it was sampled and slow."""
+        slow = elapsed >= self.threshold
+        if sampler is not None:
+            _request_sampler.set(None)
+            counts = sampler.stop()
+            _profile_lock.release()
+            if slow and counts:
+                return save_profile(collapse(counts), f"slow-{label}")
+            with self._lock:
+                self.armed = True  # not slow (or too short to sample): try the next request
+            return None
+        if slow:
+            with self._lock:
+                self.slow += 1
+                if self.slow % self.every == 0:
+                    self.armed = True
+        return None
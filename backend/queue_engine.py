@@ -0,0 +1,293 @@
+import heapq
+import itertools
+import threading
+from datetime import datetime
+
+class QueueEntry:
+    """One issued token waiting in (or called from) a doctor's queue."""
+
+    __slots__ = ("token", "department", "doctor_id", "priority", "seq", "arrival_time",
+                 "predicted_wait", "status", "called_time")
+
+    def __init__(self, token, department, doctor_id, priority, seq, arrival_time, predicted_wait):
+        self.token = token
+        self.department = department
+        self.doctor_id = doctor_id
+        self.priority = priority
+        self.seq = seq
+        self.arrival_time = arrival_time
+        self.predicted_wait = predicted_wait
+        self.status = "waiting"
+        self.called_time = None
+
+    def to_dict(self):
+        return {
+            "TokenNumber": self.token,
+            "Department": self.department,
+            "DoctorID": self.doctor_id,
+            "PriorityFlag": self.priority,
+            "ArrivalTime": self.arrival_time,
+            "PredictedWait_Minutes": self.predicted_wait,
+            "Status": self.status,
+            "CalledTime": self.called_time,
+        }
+
+    @classmethod
+    def from_row(cls, row):
+        """Entry for a visit row of the token store (e.g. one issued by another worker)."""
+        entry = cls(
+            row["token"], row["department"], row["doctor_id"], row["priority_flag"], -1,
+            datetime.fromisoformat(row["arrival_time"]), row["predicted_wait_minutes"] or 0.0,
+        )
+        entry.status = row["status"]
+        entry.called_time = datetime.fromisoformat(row["called_time"]) if row["called_time"] else None
+        return entry
+
+def _stats(waiting, predicted_wait_sum, served, actual_wait_sum):
+    return {
+        "QueueLength": waiting,
+        "AvgPredictedWait_Minutes": predicted_wait_sum / waiting if waiting else 0.0,
+        "Served": served,
+        "AvgActualWait_Minutes": actual_wait_sum / served if served else 0.0,
+    }
+
+class _DoctorQueue:
+    """Heap of entries for one (department, doctor) plus running totals for O(1) stats."""
+
+    __slots__ = ("heap", "waiting", "predicted_wait_sum", "served", "actual_wait_sum", "stale")
+
+    def __init__(self):
+        self.heap = []
+        self.waiting = 0
+        self.predicted_wait_sum = 0.0
+        self.served = 0
+        self.actual_wait_sum = 0.0
+        self.stale = 0  # cancelled entries still in the heap
+
+    def stats(self):
+        return _stats(self.waiting, self.predicted_wait_sum, self.served, self.actual_wait_sum)
+
+class QueueEngine:
+    """
+    In-memory OPD queues, one priority queue per (department, doctor).
+    Higher PriorityFlag is called first, then earlier arrival. Enqueue and call-next
+    are O(log n); cancel is O(1) (the entry is skipped when it reaches the heap top).
+    Token numbers are issued from one monotonic counter and never repeat.
+
+    With a TokenStore, the store is the only copy of the queues, shared by every worker
+    process: tokens come from its sequence, call-next and cancel are single UPDATEs, and
+    queue_length and status are COUNT/SUM queries over today's visits, so they include
+    patients enqueued, called or cancelled by other workers and survive restarts. No
+    heaps are kept in memory then.
+    """
+
+    def __init__(self, first_token=1, store=None):
+        self._lock = threading.Lock()
+        self._store = store
+        self._tokens = itertools.count(first_token)
+        self._seq = itertools.count()
+        self._queues = {}        # (department, doctor_id) -> _DoctorQueue
+        self._doctor_depts = {}  # doctor_id -> set of departments with a queue
+        self._entries = {}       # token -> waiting QueueEntry
+        self._doctor_waiting = {}  # doctor_id -> waiting patients across departments
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """
+        Registers listener(action, entry, queue_row), called after every enqueue ("issued"),
+        call ("called") and cancel ("cancelled") with the updated (department, doctor) stats.
+        It runs under the engine lock, so events arrive in order; it must not block or
+        call back into the engine.
+        """
+        self._listeners.append(listener)
+
+    def _emit(self, action, entry, stats):
+        row = {"Department": entry.department, "DoctorID": entry.doctor_id, **stats}
+        for listener in self._listeners:
+            try:
+                listener(action, entry, row)
+            except Exception as e:
+                print(f"Queue listener failed: {e}")
+
+    def _emit_stored(self, action, entries):
+        """Emits events for entries changed in the store, with their queues' totals read back (lock held)."""
+        if not self._listeners:
+            return
+        stats = {}
+        for entry in entries:
+            key = (entry.department, entry.doctor_id)
+            if key not in stats:
+                totals = self._store.queue_totals(department=entry.department, doctor_id=entry.doctor_id)
+                stats[key] = _stats(*totals[0][2:]) if totals else _stats(0, 0.0, 0, 0.0)
+            self._emit(action, entry, stats[key])
+
+    def _queue(self, key):
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = _DoctorQueue()
+            self._doctor_depts.setdefault(key[1], set()).add(key[0])
+        return queue
+
+    def enqueue(self, department, doctor_id, priority_flag=0, predicted_wait=0.0, arrival_time=None,
+                scheduled_time=None):
+        """Adds a patient to the doctor's queue and returns the new entry."""
+        return self.enqueue_many([(department, doctor_id, priority_flag, predicted_wait, scheduled_time)],
+                                 arrival_time)[0]
+
+    def enqueue_many(self, patients, arrival_time=None):
+        """
+        Adds (department, doctor_id, priority_flag, predicted_wait, scheduled_time) patients
+        in order and returns their entries. With a store, all of them are persisted in one
+        transaction.
+        """
+        arrival_time = arrival_time or datetime.now()
+        patients = [(dept, doctor, int(priority), float(wait or 0.0), scheduled)
+                    for dept, doctor, priority, wait, scheduled in patients]
+        if self._store is not None:
+            tokens = self._store.issue(
+                (dept, doctor, priority, arrival_time, scheduled, wait)
+                for dept, doctor, priority, wait, scheduled in patients
+            )
+            entries = [
+                QueueEntry(token, department, doctor_id, priority, -1, arrival_time, wait)
+                for token, (department, doctor_id, priority, wait, _) in zip(tokens, patients)
+            ]
+            with self._lock:
+                self._emit_stored("issued", entries)
+            return entries
+
+        entries = []
+        with self._lock:
+            for department, doctor_id, priority, wait, _ in patients:
+                entry = QueueEntry(
+                    token=next(self._tokens),
+                    department=department,
+                    doctor_id=doctor_id,
+                    priority=priority,
+                    seq=next(self._seq),
+                    arrival_time=arrival_time,
+                    predicted_wait=wait,
+                )
+                queue = self._queue((department, doctor_id))
+                heapq.heappush(queue.heap, (-entry.priority, entry.seq, entry))
+                queue.waiting += 1
+                queue.predicted_wait_sum += entry.predicted_wait
+                self._doctor_waiting[doctor_id] = self._doctor_waiting.get(doctor_id, 0) + 1
+                self._entries[entry.token] = entry
+                if self._listeners:
+                    self._emit("issued", entry, queue.stats())
+                entries.append(entry)
+        return entries
+
+    def _peek(self, queue):
+        """Drops cancelled entries from the top of the heap and returns the head, or None."""
+        heap = queue.heap
+        while heap and heap[0][2].status != "waiting":
+            heapq.heappop(heap)
+            queue.stale -= 1
+        return heap[0][2] if heap else None
+
+    def call_next(self, doctor_id, department=None, now=None):
+        """
+        Removes and returns the next patient for the doctor (across all of the doctor's
+        departments unless one is given), or None if nobody is waiting.
+        """
+        now = now or datetime.now()
+        if self._store is not None:
+            row = self._store.call_next(doctor_id, department, now)
+            if row is None:
+                return None
+            entry = QueueEntry.from_row(row)
+            with self._lock:
+                self._emit_stored("called", [entry])
+            return entry
+
+        with self._lock:
+            departments = [department] if department else self._doctor_depts.get(doctor_id, ())
+            best = None
+            for dept in departments:
+                queue = self._queues.get((dept, doctor_id))
+                head = self._peek(queue) if queue else None
+                if head and (best is None or (-head.priority, head.seq) < (-best.priority, best.seq)):
+                    best = head
+            if best is None:
+                return None
+            return self._remove(best.token, "called", now)
+
+    def cancel(self, token):
+        """Cancels a waiting token. Returns the entry, or None if it is not waiting."""
+        if self._store is not None:
+            row = self._store.cancel(token)
+            if row is None:
+                return None
+            entry = QueueEntry.from_row(row)
+            with self._lock:
+                self._emit_stored("cancelled", [entry])
+            return entry
+        with self._lock:
+            return self._remove(token, "cancelled")
+
+    def _remove(self, token, status, now=None):
+        """
+        Takes a waiting entry out of its queue as "called" or "cancelled" (lock held).
+        The heap item stays behind and is skipped when it reaches the top. Returns the
+        entry, or None if the token is not waiting in this engine.
+        """
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return None
+        entry.status = status
+        queue = self._queues[(entry.department, entry.doctor_id)]
+        queue.waiting -= 1
+        queue.predicted_wait_sum -= entry.predicted_wait
+        queue.stale += 1
+        self._doctor_waiting[entry.doctor_id] -= 1
+        if status == "called":
+            entry.called_time = now
+            queue.served += 1
+            queue.actual_wait_sum += max(0.0, (now - entry.arrival_time).total_seconds() / 60)
+        # Rebuild once removed entries dominate so the heap does not grow unbounded
+        if queue.stale > 64 and queue.stale > queue.waiting:
+            queue.heap = [item for item in queue.heap if item[2].status == "waiting"]
+            heapq.heapify(queue.heap)
+            queue.stale = 0
+        if self._listeners:
+            self._emit(status, entry, queue.stats())
+        return entry
+
+    def get(self, token):
+        """Returns the waiting entry for a token, or None."""
+        if self._store is not None:
+            row = self._store.visit(token)
+            return QueueEntry.from_row(row) if row and row["status"] == "waiting" else None
+        with self._lock:
+            return self._entries.get(token)
+
+    def queue_length(self, doctor_id, department=None):
+        """
+        Patients waiting for the doctor, in one department or in all of them: O(1) from
+        running totals, or an indexed COUNT of today's waiting visits with a store.
+        """
+        if self._store is not None:
+            return self._store.queue_length(doctor_id, department=department)
+        with self._lock:
+            if department is None:
+                return self._doctor_waiting.get(doctor_id, 0)
+            queue = self._queues.get((department, doctor_id))
+            return queue.waiting if queue else 0
+
+    def status(self):
+        """
+        Per-(department, doctor) queue stats, computed from running totals, or with a store
+        from today's visits of all workers.
+        """
+        if self._store is not None:
+            return [
+                {"Department": dept, "DoctorID": doctor_id, **_stats(*totals)}
+                for dept, doctor_id, *totals in self._store.queue_totals()
+            ]
+        with self._lock:
+            return [
+                {"Department": dept, "DoctorID": doctor_id, **queue.stats()}
+                for (dept, doctor_id), queue in sorted(self._queues.items())
+            ]
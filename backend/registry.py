@@ -0,0 +1,202 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+try:
+    import fcntl
+except ImportError:  # Windows: history writes are only serialized within one process
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# One sub-directory per model version, named by the hash of its contents
+REGISTRY_DIR = os.environ.get("OPD_REGISTRY_DIR", os.path.join(BASE_DIR, "artifacts", "registry"))
+# Activation history; the last entry is the active version
+HISTORY_FILE = "history.json"
+# Held (flock) while the history is read, changed and rewritten, across processes
+HISTORY_LOCK_FILE = ".history.lock"
+HISTORY_LIMIT = 100
+METRICS_FILE = "model_metrics.json"
+# Files that define a version; their bytes make up the version id
+VERSIONED_FILES = (
+    "opd_model.pkl", "label_encoders.pkl", "routing.json", "simulation_params.json", "drift_reference.json",
+)
+# Derived files copied along when importing a bundle directory (rebuilt on load if missing)
+DERIVED_FILES = ("opd_model_flat.npz", METRICS_FILE)
+DERIVED_DIRS = ("opd_model_mmap",)
+VERSION_LENGTH = 12
+
+_lock = threading.Lock()
+
+def content_version(bundle_dir):
+    """Version id of a bundle directory: a SHA-256 prefix over its VERSIONED_FILES."""
+    digest = hashlib.sha256()
+    for name in VERSIONED_FILES:
+        path = os.path.join(bundle_dir, name)
+        if not os.path.exists(path):
+            continue
+        digest.update(name.encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:VERSION_LENGTH]
+
+def version_dir(version, registry_dir=REGISTRY_DIR):
+    return os.path.join(registry_dir, version)
+
+def exists(version, registry_dir=REGISTRY_DIR):
+    """True if version is a well-formed id of a registered bundle."""
+    return len(version) == VERSION_LENGTH and all(c in "0123456789abcdef" for c in version) \
+        and os.path.isdir(version_dir(version, registry_dir))
+
+def staging_dir(registry_dir=REGISTRY_DIR):
+    """A fresh directory inside the registry to write a new bundle into before register()."""
+    os.makedirs(registry_dir, exist_ok=True)
+    return tempfile.mkdtemp(prefix=".staging-", dir=registry_dir)
+
+def _read_metrics(bundle_dir):
+    path = os.path.join(bundle_dir, METRICS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def register(bundle_dir, registry_dir=REGISTRY_DIR):
+    """
+    Moves a bundle written to staging_dir() into the registry under its content
+    version and returns the version. Registering identical contents again keeps the
+    existing copy. Versions are never modified once registered.
+    """
+    metrics = _read_metrics(bundle_dir)
+    version = content_version(bundle_dir)
+    metrics["model_version"] = version
+    metrics.setdefault("registered_at", datetime.now().isoformat())
+    with open(os.path.join(bundle_dir, METRICS_FILE), "w") as f:
+        json.dump(metrics, f, indent=4)
+
+    target = version_dir(version, registry_dir)
+    try:
+        os.rename(bundle_dir, target)
+    except OSError:
+        if not os.path.isdir(target):
+            raise
+        shutil.rmtree(bundle_dir, ignore_errors=True)  # already registered
+    return version
+
+def import_dir(source_dir, registry_dir=REGISTRY_DIR):
+    """Copies a bundle from a plain artifacts directory into the registry. Returns its version."""
+    staging = staging_dir(registry_dir)
+    for name in VERSIONED_FILES + DERIVED_FILES:
+        path = os.path.join(source_dir, name)
+        if os.path.exists(path):
+            shutil.copy2(path, staging)
+    for name in DERIVED_DIRS:
+        path = os.path.join(source_dir, name)
+        if os.path.isdir(path):
+            shutil.copytree(path, os.path.join(staging, name))
+    return register(staging, registry_dir)
+
+def history(registry_dir=REGISTRY_DIR):
+    path = os.path.join(registry_dir, HISTORY_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+@contextmanager
+def _history_lock(registry_dir):
+    """
+    Serializes history read-modify-writes between threads and between processes (API
+    workers, model.py) with an exclusive flock on HISTORY_LOCK_FILE.
+    """
+    with _lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(registry_dir, exist_ok=True)
+        with open(os.path.join(registry_dir, HISTORY_LOCK_FILE), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def _write_history(versions, registry_dir):
+    path = os.path.join(registry_dir, HISTORY_FILE)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(versions[-HISTORY_LIMIT:], f)
+    os.replace(tmp, path)
+
+def history_stamp(registry_dir=REGISTRY_DIR):
+    """Cheap change marker for the history file (inode, mtime, size), or None while there is none."""
+    try:
+        st = os.stat(os.path.join(registry_dir, HISTORY_FILE))
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+def active_version(registry_dir=REGISTRY_DIR):
+    versions = history(registry_dir)
+    return versions[-1] if versions else None
+
+def active_dir(default=None, registry_dir=REGISTRY_DIR):
+    """Directory of the active version, or default while nothing is registered."""
+    version = active_version(registry_dir)
+    return version_dir(version, registry_dir) if version else default
+
+def recent_versions(n, registry_dir=REGISTRY_DIR):
+    """Up to n distinct versions from the history, the active one first."""
+    recent = []
+    for version in reversed(history(registry_dir)):
+        if version not in recent:
+            recent.append(version)
+            if len(recent) == n:
+                break
+    return recent
+
+def previous_version(registry_dir=REGISTRY_DIR):
+    """The version a rollback would return to, or None."""
+    versions = history(registry_dir)
+    return versions[-2] if len(versions) > 1 else None
+
+def activate(version, registry_dir=REGISTRY_DIR):
+    """Makes version the active one (appends it to the history)."""
+    if not exists(version, registry_dir):
+        raise KeyError(version)
+    with _history_lock(registry_dir):
+        versions = history(registry_dir)
+        if not versions or versions[-1] != version:
+            _write_history(versions + [version], registry_dir)
+
+def rollback(registry_dir=REGISTRY_DIR):
+    """Drops the active version from the history and returns the new active one, or None."""
+    with _history_lock(registry_dir):
+        versions = history(registry_dir)
+        if len(versions) < 2:
+            return None
+        _write_history(versions[:-1], registry_dir)
+        return versions[-2]
+
+def list_versions(registry_dir=REGISTRY_DIR):
+    """Registered versions with their metrics, newest first."""
+    if not os.path.isdir(registry_dir):
+        return []
+    active = active_version(registry_dir)
+    versions = []
+    for name in os.listdir(registry_dir):
+        if not exists(name, registry_dir):
+            continue
+        metrics = _read_metrics(version_dir(name, registry_dir))
+        versions.append({
+            "version": name,
+            "active": name == active,
+            "registered_at": metrics.get("registered_at"),
+            "rmse": metrics.get("rmse"),
+            "mae": metrics.get("mae"),
+            "description": metrics.get("description"),
+        })
+    return sorted(versions, key=lambda v: v["registered_at"] or "", reverse=True)
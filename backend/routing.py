@@ -0,0 +1,80 @@
+import os
+import json
+import numpy as np
+
+ROUTING_FILE = "routing.json"
+# Candidates compared per patient ("power of two choices")
+N_CHOICES = 2
+# Minutes of extra wait assumed per patient already queued for a doctor
+MINUTES_PER_QUEUED_PATIENT = float(os.environ.get("OPD_ROUTING_MINUTES_PER_PATIENT", "10"))
+
+def save_routing(df, output_dir):
+    """Writes the department -> doctors map seen in the training data."""
+    pairs = df[["Department", "DoctorID"]].dropna().astype(str).drop_duplicates()
+    mapping = {
+        dept: sorted(group["DoctorID"].tolist())
+        for dept, group in pairs.groupby("Department")
+    }
+    with open(os.path.join(output_dir, ROUTING_FILE), "w") as f:
+        json.dump({"departments": mapping}, f, indent=2)
+
+class DoctorRouter:
+    """
+    Picks a doctor for patients without one. Built once per model load: each department
+    maps to a fixed array of its doctors, and choose_many() applies a power-of-two-choices
+    policy on live queue depth plus the model's predicted wait, so routing costs one
+    small batched model call and no scans.
+    """
+
+    def __init__(self, department_doctors, all_doctors):
+        self.department_doctors = {dept: tuple(docs) for dept, docs in department_doctors.items() if docs}
+        self.all_doctors = tuple(all_doctors)
+
+    @classmethod
+    def load(cls, artifacts_dir, known_doctors):
+        """Reads routing.json; without it every known doctor serves every department."""
+        mapping = {}
+        path = os.path.join(artifacts_dir, ROUTING_FILE)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                mapping = json.load(f).get("departments", {})
+        known = set(known_doctors)
+        mapping = {dept: [d for d in docs if d in known] for dept, docs in mapping.items()}
+        return cls(mapping, known_doctors)
+
+    def candidates(self, department, rng, n_choices=N_CHOICES):
+        """Up to n_choices distinct doctors of the department, sampled uniformly."""
+        doctors = self.department_doctors.get(department, self.all_doctors)
+        if len(doctors) <= n_choices:
+            return list(doctors)
+        return [doctors[i] for i in rng.choice(len(doctors), size=n_choices, replace=False)]
+
+    def choose_many(self, departments, predict, queue_depth, rng):
+        """
+        Assigns a doctor to each department in one pass.
+        predict(rows) scores [(row_index, doctor_id), ...] in one call and returns the
+        predicted waits; queue_depth(doctor_id) is the doctor's current queue length.
+        Patients routed earlier in the same call count towards the queue depth.
+        Returns (doctors, predicted_waits, picks), where picks[i] is the index of the
+        winning pair passed to predict; doctor and pick are None if no candidate exists.
+        """
+        candidates = [self.candidates(dept, rng) for dept in departments]
+        pairs = [(i, doc) for i, docs in enumerate(candidates) for doc in docs]
+        waits = predict(pairs) if pairs else np.empty(0)
+
+        added = {}
+        doctors = [None] * len(departments)
+        picks = [None] * len(departments)
+        predicted = [0.0] * len(departments)
+        best_cost = [np.inf] * len(departments)
+        k = 0
+        for i, docs in enumerate(candidates):
+            for doc in docs:
+                depth = queue_depth(doc) + added.get(doc, 0)
+                cost = waits[k] + depth * MINUTES_PER_QUEUED_PATIENT
+                if cost < best_cost[i]:
+                    best_cost[i], doctors[i], predicted[i], picks[i] = cost, doc, float(waits[k]), k
+                k += 1
+            if doctors[i] is not None:
+                added[doctors[i]] = added.get(doctors[i], 0) + 1
+        return doctors, predicted, picks
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, List, Dict
 from datetime import datetime
 
 class PatientBase(BaseModel):
@@ -18,8 +18,74 @@ class PredictionResponse(BaseModel):
     DoctorID: str
     WaitTime_Minutes: float
     PredictedConsultTime: datetime
+    # Spread of the forest's tree predictions: lowest and highest requested quantile
+    WaitTime_Low_Minutes: Optional[float] = None
+    WaitTime_High_Minutes: Optional[float] = None
+    WaitTime_Quantiles: Optional[Dict[str, float]] = None
+
+class BatchPredictionItem(BaseModel):
+    index: int
+    prediction: Optional[PredictionResponse] = None
+    error: Optional[str] = None
+
+class BatchPredictionResponse(BaseModel):
+    results: List[BatchPredictionItem]
+    n_success: int
+    n_failed: int
+
+class QueueEntryResponse(BaseModel):
+    TokenNumber: int
+    Department: str
+    DoctorID: str
+    PriorityFlag: int
+    ArrivalTime: datetime
+    PredictedWait_Minutes: float
+    Status: str
+    CalledTime: Optional[datetime] = None
+
+class DoctorQueueStatus(BaseModel):
+    Department: str
+    DoctorID: str
+    QueueLength: int
+    AvgPredictedWait_Minutes: float
+    Served: int
+    AvgActualWait_Minutes: float
+
+class QueueStatusResponse(BaseModel):
+    queues: List[DoctorQueueStatus]
+    total_waiting: int
 
 class RetrainResponse(BaseModel):
-    status: str
-    model_version: str
-    metrics: dict
+    job_id: str
+    kind: str
+    params: dict = {}
+    status: str  # Queued, Running, Success or Failed
+    stage: str
+    progress: float
+    model_version: Optional[str] = None
+    metrics: dict = {}
+    message: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class RosterShift(BaseModel):
+    Department: str
+    DoctorID: Optional[str] = None
+    StartHour: int = Field(ge=0, le=24)
+    EndHour: int = Field(ge=0, le=24)
+
+    @model_validator(mode="after")
+    def check_hours(self):
+        if self.StartHour >= self.EndHour:
+            raise ValueError("StartHour must be before EndHour")
+        return self
+
+class SimulationRequest(BaseModel):
+    DayOfWeek: int = 0  # 0 = Monday
+    roster: Optional[List[RosterShift]] = None  # default: staffing seen in the training data
+    add_shifts: List[RosterShift] = []  # extra shifts on top of the roster
+    n_replications: int = 1000
+    service_minutes: Optional[Dict[str, float]] = None
+    arrival_scale: float = 1.0
+    seed: int = 42
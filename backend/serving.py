@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import shutil
+import numpy as np
+from datetime import datetime
+from typing import NamedTuple, Optional
+from preprocessing import load_processors, compile_lookups, FEATURES, CATEGORICAL_FEATURES
+from prediction_table import build_prediction_table
+from forest import FlatForest, HybridForest, forest_quantiles
+from routing import DoctorRouter
+from drift import DriftMonitor
+
+MODEL_FILE = "opd_model.pkl"
+FLAT_MODEL_FILE = "opd_model_flat.npz"
+# Directory of plain .npy files (forest arrays + encoder classes) opened with mmap
+MMAP_MODEL_DIR = "opd_model_mmap"
+METRICS_FILE = "model_metrics.json"
+PREDICTION_TABLE_FILE = "prediction_table.npy"
+WARMUP_ROWS = 256
+# Batches with more rows than this are scored by the sklearn forest instead of the flat
+# evaluator, which is faster on small batches but several times slower on large ones
+# (0 serves every batch from the flat evaluator)
+FLAT_MAX_ROWS = int(os.environ.get("OPD_FLAT_FOREST_MAX_ROWS", "256"))
+
+class ModelBundle(NamedTuple):
+    """
+    Everything needed to serve predictions. A bundle is never mutated; the API swaps
+    the whole bundle in one assignment, so a request always sees a matching model and encoders.
+    """
+    model: object
+    label_encoders: dict
+    category_lookups: dict
+    known_doctors: tuple
+    router: DoctorRouter
+    drift: DriftMonitor
+    prediction_table: Optional[object]
+    version: str
+    loaded_at: datetime
+    artifacts_dir: str
+
+    def score(self, X):
+        """Scores an encoded feature matrix, using the precomputed table when enabled."""
+        if self.prediction_table is not None:
+            return self.prediction_table.predict(X, self.model)
+        return self.model.predict(X)
+
+    def score_quantiles(self, X, quantiles):
+        """
+        Returns (point predictions, quantiles of the per-tree predictions with shape
+        (len(quantiles), n_rows)) from a single pass over the trees. The prediction
+        table answers when it was built with exactly these quantiles. Without
+        quantiles this is score(X) and None.
+        """
+        if not quantiles:
+            return self.score(X), None
+        table = self.prediction_table
+        if table is not None and table.quantiles == tuple(quantiles):
+            return table.predict_quantiles(X, self.model)
+        return forest_quantiles(self.model, X, quantiles)
+
+def _drop_feature_names(model):
+    """
+    The forest is fitted on a DataFrame, so sklearn warns (and does extra work) when
+    predicting on a bare array. Inference builds arrays in FEATURES order, so after
+    checking that order we drop the stored names.
+    """
+    names = getattr(model, 'feature_names_in_', None)
+    if names is not None:
+        if list(names) != FEATURES:
+            raise ValueError(f"Model features {list(names)} do not match {FEATURES}")
+        del model.feature_names_in_
+    return model
+
+def _read_version(artifacts_dir):
+    path = os.path.join(artifacts_dir, METRICS_FILE)
+    if not os.path.exists(path):
+        return "unknown"
+    with open(path, "r") as f:
+        return json.load(f).get("model_version", "unknown")
+
+def _load_model(artifacts_dir, use_flat):
+    """
+    Loads the flattened forest if it is at least as new as the pickled model.
+    A missing or stale flat artifact is exported from the pickle first.
+    Without use_flat the sklearn model itself is returned.
+    """
+    model_path = os.path.join(artifacts_dir, MODEL_FILE)
+    flat_path = os.path.join(artifacts_dir, FLAT_MODEL_FILE)
+    if use_flat and os.path.exists(flat_path) and os.path.getmtime(flat_path) >= os.path.getmtime(model_path):
+        return FlatForest.load(flat_path)
+    # Unpickling the forest imports scikit-learn; the fresh flat path above does not
+    import joblib
+    if not use_flat:
+        return _drop_feature_names(joblib.load(model_path))
+    flat = FlatForest.from_sklearn(joblib.load(model_path))
+    try:
+        flat.save(flat_path)
+    except OSError as e:
+        print(f"Could not write {flat_path}: {e}")
+    return flat
+
+def export_mmap_artifacts(flat, label_encoders, artifacts_dir):
+    """
+    Writes the flat forest and the encoder classes as .npy files into MMAP_MODEL_DIR.
+    The directory is built under a temporary name and renamed into place, so workers
+    never open a half-written layout; processes that mapped the old files keep them.
+    """
+    final_dir = os.path.join(artifacts_dir, MMAP_MODEL_DIR)
+    tmp_dir = f"{final_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    flat.save_dir(tmp_dir)
+    for col in CATEGORICAL_FEATURES:
+        classes = np.asarray(label_encoders[col].classes_).astype(str)
+        np.save(os.path.join(tmp_dir, f"classes_{col}.npy"), classes)
+
+    old_dir = f"{final_dir}.old-{os.getpid()}"
+    try:
+        if os.path.exists(final_dir):
+            os.rename(final_dir, old_dir)
+        os.rename(tmp_dir, final_dir)
+    except OSError as e:
+        # Another worker replaced it concurrently; its copy is just as good
+        print(f"Could not publish {final_dir}: {e}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def _mmap_is_fresh(artifacts_dir):
+    meta_path = os.path.join(artifacts_dir, MMAP_MODEL_DIR, "meta.npy")
+    return os.path.exists(meta_path) and \
+        os.path.getmtime(meta_path) >= os.path.getmtime(os.path.join(artifacts_dir, MODEL_FILE))
+
+def _load_class_lookups(mmap_dir):
+    """{col: {label: code}} from the classes_<col>.npy files (no unpickling, no scikit-learn)."""
+    return {
+        col: {str(label): code for code, label in enumerate(np.load(os.path.join(mmap_dir, f"classes_{col}.npy")))}
+        for col in CATEGORICAL_FEATURES
+    }
+
+def _load_mmap(artifacts_dir):
+    """
+    Opens the memory-mapped layout, exporting it first if it is missing or older
+    than the pickled model. Returns (FlatForest, category_lookups).
+    """
+    mmap_dir = os.path.join(artifacts_dir, MMAP_MODEL_DIR)
+    if not _mmap_is_fresh(artifacts_dir):
+        export_mmap_artifacts(_load_model(artifacts_dir, True), load_processors(artifacts_dir), artifacts_dir)
+    return FlatForest.load_dir(mmap_dir, mmap_mode="r"), _load_class_lookups(mmap_dir)
+
+def warm_up(bundle, n_rows=WARMUP_ROWS, quantiles=(0.1, 0.9)):
+    """
+    Runs dummy predictions through every scoring path (single row, batch, quantiles)
+    so the first real requests do not pay for page faults on the model arrays or
+    first-call setup. Returns the time taken in seconds.
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(0)
+    highs = [len(bundle.category_lookups["Department"]), 2, 7, 24, len(bundle.category_lookups["DoctorID"])]
+    X = rng.integers(0, np.maximum(highs, 1), size=(max(1, n_rows), len(FEATURES))).astype(np.float64)
+    for i in range(min(len(X), 10)):
+        bundle.score(X[i:i + 1])
+    bundle.score(X)
+    bundle.score_quantiles(X, quantiles)
+    if isinstance(bundle.model, HybridForest):
+        # Loads the sklearn forest that large batches are sent to
+        large = np.resize(X, (bundle.model.max_rows + 1, X.shape[1]))
+        bundle.score(large)
+        bundle.score_quantiles(large, quantiles)
+    return time.perf_counter() - start
+
+def load_bundle(artifacts_dir, table_mode="off", use_flat=True, use_mmap=False, flat_max_rows=FLAT_MAX_ROWS,
+                table_quantiles=()):
+    """
+    Loads model, encoders and (optionally) the prediction table into a new ModelBundle.
+    table_mode is "off", "memory" or "mmap"; the table also holds table_quantiles. With use_flat, the array-backed
+    FlatForest is served instead of the sklearn model when available, for batches of
+    up to flat_max_rows rows (a HybridForest; 0 for every batch). use_mmap opens
+    the forest memory-mapped from MMAP_MODEL_DIR. label_encoders is None whenever
+    the encoder classes could be read from MMAP_MODEL_DIR instead of the pickle.
+    Returns None if no trained model exists.
+    """
+    if not os.path.exists(os.path.join(artifacts_dir, MODEL_FILE)):
+        return None
+
+    if use_mmap:
+        model, lookups = _load_mmap(artifacts_dir)
+        label_encoders = None
+    elif use_flat and _mmap_is_fresh(artifacts_dir):
+        # Encoder classes as plain arrays, so serving never imports scikit-learn
+        model = _load_model(artifacts_dir, use_flat)
+        label_encoders = None
+        lookups = _load_class_lookups(os.path.join(artifacts_dir, MMAP_MODEL_DIR))
+    else:
+        model = _load_model(artifacts_dir, use_flat)
+        label_encoders = load_processors(artifacts_dir)
+        lookups = compile_lookups(label_encoders)
+    if not lookups:
+        return None
+    if isinstance(model, FlatForest) and flat_max_rows > 0:
+        model = HybridForest(model, lambda: _load_model(artifacts_dir, False), flat_max_rows)
+
+    table = None
+    if table_mode in ("memory", "mmap"):
+        table_path = os.path.join(artifacts_dir, PREDICTION_TABLE_FILE) if table_mode == "mmap" else None
+        table = build_prediction_table(model, lookups, table_path, table_quantiles)
+
+    known_doctors = tuple(d for d in lookups.get('DoctorID', {}) if d != 'UNKNOWN')
+    return ModelBundle(
+        model=model,
+        label_encoders=label_encoders,
+        category_lookups=lookups,
+        known_doctors=known_doctors,
+        router=DoctorRouter.load(artifacts_dir, known_doctors),
+        drift=DriftMonitor.load(artifacts_dir, lookups),
+        prediction_table=table,
+        version=_read_version(artifacts_dir),
+        loaded_at=datetime.now(),
+        artifacts_dir=artifacts_dir,
+    )
@@ -0,0 +1,340 @@
+"""
+Monte Carlo simulation of an OPD day for staffing scenarios.
+
+    python simulation.py --day 0 --replications 2000 --add Cardiology:8-12
+
+Arrivals per department and hour, the share of high-priority patients and the mean
+consultation time are fitted from the training data (see fit_params). Each replication
+plays out one day minute by minute: patients join their department's queue, free
+doctors on shift take the next patient (PriorityFlag 1 first, then first come first
+served) and consultation times are lognormal. Replications run in lockstep as NumPy
+arrays, in chunks spread over a process pool.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+import registry
+
+# Worker processes come from a fork server, never from forking the multi-threaded API process
+POOL_CONTEXT = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+SIM_PARAMS_FILE = "simulation_params.json"
+# Share of their active time doctors are assumed to be consulting when the mean
+# consultation time is estimated from the training data
+ASSUMED_UTILIZATION = 0.85
+DEFAULT_SERVICE_CV = 0.5
+MINUTES_PER_DAY = 24 * 60
+WAIT_PERCENTILES = (50, 90, 95, 99)
+WAIT_HISTOGRAM_BINS = (0, 5, 10, 15, 20, 30, 45, 60, 90, 120)
+REPLICATIONS_PER_CHUNK = 250
+
+def fit_params(df):
+    """
+    Fits the simulation inputs from visit records (training schema). Weekdays absent
+    from the data get the average observed day. A doctor's patients in one hour count
+    as one doctor-hour, split across departments by patient share; the mean
+    consultation time is doctor-hours * ASSUMED_UTILIZATION per patient.
+    """
+    df = df.dropna(subset=["Department", "DoctorID", "ScheduledTime"])
+    times = pd.to_datetime(df["ScheduledTime"])
+    departments = sorted(df["Department"].astype(str).unique())
+    dept = df["Department"].astype(str).map({d: i for i, d in enumerate(departments)}).to_numpy()
+    dates = times.dt.normalize()
+    dow = times.dt.dayofweek.to_numpy()
+    hour = times.dt.hour.to_numpy()
+    n_dept = len(departments)
+
+    days_per_dow = np.bincount(pd.DatetimeIndex(dates.unique()).dayofweek, minlength=7)
+    n_days = max(1, int(days_per_dow.sum()))
+    counts = np.zeros((n_dept, 7, 24))
+    np.add.at(counts, (dept, dow, hour), 1)
+    arrivals = counts / np.maximum(days_per_dow, 1)[None, :, None]
+    arrivals[:, days_per_dow == 0, :] = (counts.sum(axis=1) / n_days)[:, None, :]
+
+    slot_size = df.groupby([df["DoctorID"].astype(str), dates, hour])["Department"].transform("size").to_numpy()
+    doctor_hours = np.zeros((n_dept, 24))
+    np.add.at(doctor_hours, (dept, hour), 1.0 / slot_size)
+    patients = np.maximum(np.bincount(dept, minlength=n_dept), 1)
+    service_minutes = doctor_hours.sum(axis=1) * 60 * ASSUMED_UTILIZATION / patients
+
+    priority = df["PriorityFlag"].fillna(0).to_numpy(dtype=float)
+    doctors = df["DoctorID"].astype(str).groupby(df["Department"].astype(str)).agg(lambda s: sorted(s.unique()))
+    return {
+        "departments": departments,
+        "arrivals_per_hour": arrivals.round(4).tolist(),
+        "high_priority_share": (np.bincount(dept, weights=priority, minlength=n_dept) / patients).tolist(),
+        "service_minutes": service_minutes.round(3).tolist(),
+        "doctors_per_hour": (doctor_hours / n_days).round(3).tolist(),
+        "doctors": {d: doctors.get(d, []) for d in departments},
+        "n_days": n_days,
+    }
+
+def save_params(df, output_dir):
+    with open(os.path.join(output_dir, SIM_PARAMS_FILE), "w") as f:
+        json.dump(fit_params(df), f)
+
+def load_params(artifacts_dir):
+    """Reads the fitted parameters, fitting them from the training data if missing."""
+    path = os.path.join(artifacts_dir, SIM_PARAMS_FILE)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    from preprocessing import load_data
+    from model import data_sources
+    return fit_params(load_data(data_sources()))
+
+def default_roster(params, day_of_week=0):
+    """
+    One shift per doctor covering the department's opening hours, with as many doctors
+    per department as the data shows on average. Each doctor works in one department.
+    """
+    arrivals = np.asarray(params["arrivals_per_hour"])[:, day_of_week, :]
+    per_hour = np.asarray(params["doctors_per_hour"])
+    used, roster = set(), []
+    for k, dept in enumerate(params["departments"]):
+        open_hours = np.flatnonzero(arrivals[k] > 0)
+        if len(open_hours) == 0:
+            continue
+        start, end = int(open_hours[0]), int(open_hours[-1]) + 1
+        n_doctors = max(1, int(round(per_hour[k, start:end].mean())))
+        names = [d for d in params["doctors"].get(dept, []) if d not in used][:n_doctors]
+        names += [f"{dept}-{i + 1}" for i in range(len(names), n_doctors)]
+        used.update(names)
+        roster += [{"Department": dept, "DoctorID": d, "StartHour": start, "EndHour": end} for d in names]
+    return roster
+
+def _setup(params, roster, day_of_week, service_minutes=None, service_cv=DEFAULT_SERVICE_CV, arrival_scale=1.0):
+    """Turns parameters and a roster into the arrays used by _simulate_chunk."""
+    departments = params["departments"]
+    index = {d: k for k, d in enumerate(departments)}
+    unknown = sorted({s["Department"] for s in roster} - set(index))
+    if unknown:
+        raise ValueError(f"Unknown department(s) in roster: {', '.join(unknown)}")
+    unknown = sorted(set(service_minutes or {}) - set(index))
+    if unknown:
+        raise ValueError(f"Unknown department(s) in service_minutes: {', '.join(unknown)}")
+    # Doctors sorted by department so each department's doctors are contiguous
+    shifts = sorted(roster, key=lambda s: index[s["Department"]])
+    doctor_dept = np.array([index[s["Department"]] for s in shifts], dtype=np.int64)
+
+    arrivals = np.asarray(params["arrivals_per_hour"], dtype=float)[:, day_of_week, :] * arrival_scale
+    mean_service = np.asarray(params["service_minutes"], dtype=float)
+    for dept, minutes in (service_minutes or {}).items():
+        mean_service[index[dept]] = minutes
+    # Lognormal with the requested mean and coefficient of variation
+    sigma = np.sqrt(np.log1p(service_cv ** 2))
+    mu = np.log(np.maximum(mean_service, 1e-6)) - sigma ** 2 / 2
+
+    minutes = np.arange(MINUTES_PER_DAY)
+    on_shift = np.stack([(minutes >= s["StartHour"] * 60) & (minutes < s["EndHour"] * 60) for s in shifts], axis=1) \
+        if shifts else np.zeros((MINUTES_PER_DAY, 0), dtype=bool)
+    active = np.flatnonzero(np.repeat(arrivals.sum(axis=0) > 0, 60) | on_shift.any(axis=1))
+    return {
+        "shifts": shifts,
+        "departments": departments,
+        "doctor_dept": doctor_dept,
+        "dept_start": np.searchsorted(doctor_dept, np.arange(len(departments))),
+        "rate_per_minute": arrivals / 60,
+        "high_share": np.asarray(params["high_priority_share"], dtype=float),
+        "mu": mu[doctor_dept],
+        "sigma": sigma,
+        "on_shift": on_shift,
+        "first_minute": int(active[0]) if len(active) else 0,
+        "last_minute": int(active[-1]) + 1 if len(active) else 0,
+    }
+
+def _simulate_chunk(setup, n_reps, seed):
+    """
+    Simulates n_reps replications in lockstep. Returns per-patient waits (served
+    patients only) with their department and priority, per-doctor busy minutes and
+    patients seen, and per-replication served / unserved counts.
+    """
+    rng = np.random.default_rng(seed)
+    doctor_dept = setup["doctor_dept"]
+    n_dept = len(setup["departments"])
+    n_doc = len(doctor_dept)
+    t0, t1 = setup["first_minute"], setup["last_minute"]
+    n_steps = t1 - t0
+    one_hot = np.zeros((n_doc, n_dept), dtype=np.int64)
+    one_hot[np.arange(n_doc), doctor_dept] = 1
+    before_dept = setup["dept_start"]  # free doctors before each department = cumsum at dept_start - 1
+
+    queue = np.zeros((n_reps, n_dept, 2), dtype=np.int64)  # [..., 0] normal, [..., 1] high priority
+    remaining = np.zeros((n_reps, n_doc))
+    busy = np.zeros((n_reps, n_doc))
+    seen = np.zeros((n_reps, n_doc), dtype=np.int64)
+    arrived = np.zeros((n_steps, n_reps, n_dept, 2), dtype=np.int32)
+    started = np.zeros((n_steps, n_reps, n_dept, 2), dtype=np.int32)
+    lam_high = setup["rate_per_minute"] * setup["high_share"][:, None]
+    lam_low = setup["rate_per_minute"] - lam_high
+
+    for step in range(n_steps):
+        t = t0 + step
+        hour = t // 60
+        new = np.stack([rng.poisson(lam_low[:, hour], (n_reps, n_dept)),
+                        rng.poisson(lam_high[:, hour], (n_reps, n_dept))], axis=-1)
+        arrived[step] = new
+        queue += new
+        if n_doc == 0:
+            continue
+
+        free = (remaining <= 0) & setup["on_shift"][t]
+        n_free = free @ one_hot
+        take = np.minimum(n_free, queue.sum(axis=-1))
+        take_high = np.minimum(take, queue[..., 1])
+        started[step, ..., 1] = take_high
+        started[step, ..., 0] = take - take_high
+        queue -= started[step]
+
+        # The first `take` free doctors of each department start a consultation
+        cum_free = np.cumsum(free, axis=1)
+        offset = np.where(before_dept > 0, cum_free[:, np.maximum(before_dept - 1, 0)], 0)
+        rank = cum_free - offset[:, doctor_dept]
+        pick = free & (rank <= take[:, doctor_dept])
+        duration = rng.lognormal(setup["mu"], setup["sigma"], (n_reps, n_doc))
+        remaining = np.where(pick, duration, remaining)
+        seen += pick
+        busy += np.clip(remaining, 0, 1)
+        remaining -= 1
+
+    # Pair the j-th start with the j-th arrival of each (replication, department, priority)
+    n_series = n_reps * n_dept * 2
+    a = arrived.reshape(n_steps, n_series).T
+    s = started.reshape(n_steps, n_series).T
+    minutes = np.tile(np.arange(t0, t1), n_series)
+    arrival_times = np.repeat(minutes, a.ravel())
+    start_times = np.repeat(minutes, s.ravel())
+    n_arrived, n_started = a.sum(axis=1), s.sum(axis=1)
+    series = np.repeat(np.arange(n_series), n_started)
+    first_arrival = np.cumsum(n_arrived) - n_arrived
+    first_start = np.cumsum(n_started) - n_started
+    idx = first_arrival[series] + np.arange(len(series)) - first_start[series]
+    waits = (start_times - arrival_times[idx]).astype(np.float32)
+
+    per_rep = lambda x: x.reshape(n_reps, -1).sum(axis=1)
+    return {
+        "waits": waits,
+        "dept": ((series // 2) % n_dept).astype(np.int16),
+        "priority": (series % 2).astype(np.int8),
+        "busy": busy.sum(axis=0),
+        "seen": seen.sum(axis=0),
+        "served": per_rep(n_started),
+        "unserved": per_rep(n_arrived - n_started),
+        "served_by_hour": np.bincount(start_times // 60, minlength=24)[:24],
+    }
+
+def _wait_summary(waits):
+    if len(waits) == 0:
+        return {"patients": 0}
+    summary = {"patients": int(len(waits)), "mean": float(waits.mean())}
+    for p, v in zip(WAIT_PERCENTILES, np.percentile(waits, WAIT_PERCENTILES)):
+        summary[f"p{p}"] = float(v)
+    return summary
+
+def _summarize(setup, chunks, n_replications):
+    waits = np.concatenate([c["waits"] for c in chunks])
+    dept = np.concatenate([c["dept"] for c in chunks])
+    priority = np.concatenate([c["priority"] for c in chunks])
+    served = np.concatenate([c["served"] for c in chunks])
+    unserved = np.concatenate([c["unserved"] for c in chunks])
+    busy = sum(c["busy"] for c in chunks) / n_replications
+    seen = sum(c["seen"] for c in chunks) / n_replications
+    bins = np.append(WAIT_HISTOGRAM_BINS, np.inf)
+    histogram = np.histogram(waits, bins=bins)[0] / max(1, len(waits))
+
+    doctors = []
+    for d, shift in enumerate(setup["shifts"]):
+        shift_minutes = max(1, (shift["EndHour"] - shift["StartHour"]) * 60)
+        doctors.append({**shift, "Utilization": float(busy[d] / shift_minutes), "PatientsSeen": float(seen[d])})
+    return {
+        "n_replications": n_replications,
+        "waits": {
+            **_wait_summary(waits),
+            "histogram": {"bins_minutes": list(WAIT_HISTOGRAM_BINS), "share": histogram.round(4).tolist()},
+            "by_priority": {str(p): _wait_summary(waits[priority == p]) for p in (0, 1)},
+            "by_department": {name: _wait_summary(waits[dept == k]) for k, name in enumerate(setup["departments"])},
+        },
+        "throughput": {
+            "served_mean": float(served.mean()),
+            "served_p5": float(np.percentile(served, 5)),
+            "served_p95": float(np.percentile(served, 95)),
+            "unserved_mean": float(unserved.mean()),
+            "served_by_hour": (sum(c["served_by_hour"] for c in chunks) / n_replications).round(2).tolist(),
+        },
+        "doctors": doctors,
+    }
+
+def simulate(params, roster=None, day_of_week=0, n_replications=1000, n_workers=None, seed=42,
+             service_minutes=None, service_cv=DEFAULT_SERVICE_CV, arrival_scale=1.0):
+    """
+    Runs n_replications simulated days for the roster (a list of {"Department",
+    "DoctorID", "StartHour", "EndHour"} shifts; default_roster() if None) and returns
+    wait distributions, per-doctor utilization and throughput. service_minutes
+    overrides the fitted mean consultation time per department; arrival_scale scales
+    all arrival rates. Chunks of replications run on n_workers processes.
+    """
+    if roster is None:
+        roster = default_roster(params, day_of_week)
+    setup = _setup(params, roster, day_of_week, service_minutes, service_cv, arrival_scale)
+    sizes = [REPLICATIONS_PER_CHUNK] * (n_replications // REPLICATIONS_PER_CHUNK)
+    if n_replications % REPLICATIONS_PER_CHUNK:
+        sizes.append(n_replications % REPLICATIONS_PER_CHUNK)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    n_workers = min(n_workers or os.cpu_count() or 1, len(sizes))
+    if n_workers <= 1:
+        chunks = [_simulate_chunk(setup, n, s) for n, s in zip(sizes, seeds)]
+    else:
+        context = multiprocessing.get_context(POOL_CONTEXT)
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as executor:
+            chunks = list(executor.map(_simulate_chunk, [setup] * len(sizes), sizes, seeds))
+    return {"day_of_week": day_of_week, **_summarize(setup, chunks, n_replications)}
+
+def _parse_shift(text, params):
+    """"Cardiology:8-12" -> one extra doctor in Cardiology from 08:00 to 12:00."""
+    dept, _, hours = text.rpartition(":")
+    start, end = (int(h) for h in hours.split("-"))
+    if dept not in params["departments"]:
+        raise argparse.ArgumentTypeError(f"Unknown department: {dept}")
+    if not 0 <= start < end <= 24:
+        raise argparse.ArgumentTypeError(f"Shift hours must satisfy 0 <= START < END <= 24: {text}")
+    return {"Department": dept, "DoctorID": f"EXTRA-{dept}-{start}-{end}", "StartHour": start, "EndHour": end}
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate OPD days for a staffing scenario.")
+    parser.add_argument("--day", type=int, default=0, help="day of week, 0 = Monday")
+    parser.add_argument("--replications", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--add", action="append", default=[], metavar="DEPT:START-END",
+                        help="extra doctor shift compared against the default roster (repeatable)")
+    parser.add_argument("--artifacts", default=None, help="model bundle directory (default: the active version)")
+    args = parser.parse_args()
+    if args.artifacts is None:
+        args.artifacts = registry.active_dir(os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts"))
+
+    params = load_params(args.artifacts)
+    baseline = default_roster(params, args.day)
+    scenarios = {"baseline": baseline}
+    if args.add:
+        try:
+            scenarios["scenario"] = baseline + [_parse_shift(s, params) for s in args.add]
+        except argparse.ArgumentTypeError as e:
+            parser.error(str(e))
+    results = {
+        name: simulate(params, roster, args.day, args.replications, args.workers, args.seed)
+        for name, roster in scenarios.items()
+    }
+    for name, result in results.items():
+        w, tp = result["waits"], result["throughput"]
+        print(f"{name}: {len(scenarios[name])} doctors, wait mean {w['mean']:.1f} min, p90 {w['p90']:.1f}, "
+              f"p99 {w['p99']:.1f}; served {tp['served_mean']:.0f}/day, unserved {tp['unserved_mean']:.1f}")
+        for dept, s in w["by_department"].items():
+            print(f"  {dept:<18} mean {s.get('mean', 0):6.1f}  p90 {s.get('p90', 0):6.1f}")
+
+if __name__ == "__main__":
+    main()
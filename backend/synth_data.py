@@ -0,0 +1,163 @@
+"""
+Synthetic OPD visit generator for load and training tests.
+
+    python synth_data.py visits.csv --rows 5000000 --departments 8 --doctors 60 --seed 7
+
+Rows have the training schema (PatientID, Department, DoctorID, PriorityFlag,
+ScheduledTime, WaitTime_Minutes), are ordered by ScheduledTime and are produced in
+chunks, so memory use depends on --chunk-size, not on --rows.
+"""
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+DEFAULT_DEPARTMENTS = ["Cardiology", "Orthopedics", "Dermatology", "Pediatrics", "General Medicine"]
+# Relative visit volume Monday..Sunday
+DAY_OF_WEEK_WEIGHTS = np.array([1.25, 1.1, 1.05, 1.0, 0.95, 0.6, 0.15])
+# Relative visit volume per hour of day: morning peak, lunch dip, smaller afternoon peak
+HOUR_OF_DAY_WEIGHTS = np.array([
+    0, 0, 0, 0, 0, 0, 0, 0.2,       # 00-07
+    1.0, 1.6, 1.7, 1.4, 0.8, 0.6,   # 08-13
+    1.0, 1.1, 0.9, 0.5, 0.2,        # 14-18
+    0, 0, 0, 0, 0,                  # 19-23
+])
+HIGH_PRIORITY_RATE = 0.15
+
+def _department_names(n_departments):
+    if n_departments <= len(DEFAULT_DEPARTMENTS):
+        return DEFAULT_DEPARTMENTS[:n_departments]
+    extra = [f"Department_{i}" for i in range(len(DEFAULT_DEPARTMENTS) + 1, n_departments + 1)]
+    return DEFAULT_DEPARTMENTS + extra
+
+def generate_visits(n_rows, seed=42, n_departments=5, n_doctors=15, start_date="2026-01-01",
+                    visits_per_day=400, chunk_size=100_000):
+    """
+    Yields DataFrames of synthetic visits, in ScheduledTime order, of about chunk_size
+    rows each (whole days are never split) and n_rows rows in total.
+    Each doctor belongs to one department; wait times grow with the hour's load,
+    vary per department and doctor, and are shorter for high-priority patients.
+    """
+    if n_doctors < n_departments:
+        raise ValueError("Need at least one doctor per department")
+    rng = np.random.default_rng(seed)
+
+    departments = np.array(_department_names(n_departments))
+    dept_popularity = rng.dirichlet(np.full(n_departments, 5.0))
+    dept_base_wait = rng.uniform(10, 30, n_departments)
+    doctor_dept = np.arange(n_doctors) % n_departments
+    doctor_ids = np.array([f"DOC_{i + 1}" for i in range(n_doctors)])
+    doctor_speed = rng.lognormal(0.0, 0.2, n_doctors)
+    doctors_by_dept = [np.flatnonzero(doctor_dept == d) for d in range(n_departments)]
+
+    # Spread rows over enough calendar days, weighted by day of week
+    n_days = max(1, int(np.ceil(n_rows / visits_per_day * 7 / DAY_OF_WEEK_WEIGHTS.sum())))
+    days = pd.date_range(start_date, periods=n_days, freq="D")
+    day_weights = DAY_OF_WEEK_WEIGHTS[days.dayofweek]
+    rows_per_day = rng.multinomial(n_rows, day_weights / day_weights.sum())
+    hour_p = HOUR_OF_DAY_WEIGHTS / HOUR_OF_DAY_WEIGHTS.sum()
+    load_index = HOUR_OF_DAY_WEIGHTS / HOUR_OF_DAY_WEIGHTS.max()
+
+    day_start = 0
+    patient_offset = 0
+    while day_start < n_days:
+        # Take whole days until the chunk is full
+        day_end = day_start + 1
+        total = rows_per_day[day_start]
+        while day_end < n_days and total + rows_per_day[day_end] <= chunk_size:
+            total += rows_per_day[day_end]
+            day_end += 1
+        counts = rows_per_day[day_start:day_end]
+        n = int(counts.sum())
+        day_idx = np.repeat(np.arange(day_start, day_end), counts)
+        day_start = day_end
+        if n == 0:
+            continue
+
+        hours = rng.choice(24, size=n, p=hour_p)
+        minutes = rng.integers(0, 60, size=n)
+        scheduled = (
+            days.values[day_idx]
+            + hours.astype("timedelta64[h]")
+            + minutes.astype("timedelta64[m]")
+        )
+        dept = rng.choice(n_departments, size=n, p=dept_popularity)
+        # Uniform doctor within the department
+        doctor = np.empty(n, dtype=np.int64)
+        for d in range(n_departments):
+            mask = dept == d
+            doctor[mask] = rng.choice(doctors_by_dept[d], size=int(mask.sum()))
+        priority = (rng.random(n) < HIGH_PRIORITY_RATE).astype(np.int64)
+        day_load = DAY_OF_WEEK_WEIGHTS[pd.DatetimeIndex(scheduled).dayofweek] / DAY_OF_WEEK_WEIGHTS.max()
+
+        mean_wait = (
+            dept_base_wait[dept]
+            * doctor_speed[doctor]
+            * (0.4 + load_index[hours] * day_load)
+            * np.where(priority == 1, 0.4, 1.0)
+        )
+        wait = np.rint(rng.gamma(4.0, mean_wait / 4.0)).astype(np.int64)
+
+        order = np.argsort(scheduled, kind="stable")
+        yield pd.DataFrame({
+            "PatientID": [f"PAT_{i}" for i in range(patient_offset, patient_offset + n)],
+            "Department": departments[dept[order]],
+            "DoctorID": doctor_ids[doctor[order]],
+            "PriorityFlag": priority[order],
+            "ScheduledTime": scheduled[order],
+            "WaitTime_Minutes": wait[order],
+        })
+        patient_offset += n
+
+def write_visits(path, n_rows, **kwargs):
+    """
+    Streams generate_visits() chunks to a .csv or .parquet file (Parquet needs pyarrow).
+    Returns the number of rows written.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in (".csv", ".parquet"):
+        raise ValueError(f"Unsupported output type: {path} (use .csv or .parquet)")
+
+    written = 0
+    writer = None
+    try:
+        for i, chunk in enumerate(generate_visits(n_rows, **kwargs)):
+            if ext == ".csv":
+                chunk.to_csv(path, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+            else:
+                try:
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+                except ImportError:
+                    raise ImportError("Writing Parquet requires pyarrow: pip install pyarrow")
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+            written += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic OPD visit records.")
+    parser.add_argument("output", help="output file (.csv or .parquet)")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--departments", type=int, default=5)
+    parser.add_argument("--doctors", type=int, default=15)
+    parser.add_argument("--start-date", default="2026-01-01")
+    parser.add_argument("--visits-per-day", type=int, default=400)
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    args = parser.parse_args()
+
+    n = write_visits(
+        args.output, args.rows, seed=args.seed, n_departments=args.departments,
+        n_doctors=args.doctors, start_date=args.start_date,
+        visits_per_day=args.visits_per_day, chunk_size=args.chunk_size,
+    )
+    print(f"Wrote {n} visits to {args.output}")
+
+if __name__ == "__main__":
+    main()
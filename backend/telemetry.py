@@ -0,0 +1,116 @@
+import os
+import time
+import bisect
+import threading
+from contextlib import nullcontext
+
+# OPD_METRICS=0 turns every call below into a no-op and /metrics into a 404
+ENABLED = os.environ.get("OPD_METRICS", "1") != "0"
+# Histogram bucket upper bounds in seconds (50 µs .. 5 s)
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+           0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+HELP = {
+    "opd_stage_seconds": ("histogram", "Time spent in each stage of a prediction request"),
+    "opd_request_seconds": ("histogram", "Total handler time per prediction request"),
+    "opd_requests_total": ("counter", "Prediction requests received"),
+    "opd_request_errors_total": ("counter", "Prediction requests that failed"),
+    "opd_unknown_category_total": ("counter", "Rows with a category not seen in training"),
+    "opd_retrains_total": ("counter", "Finished retraining jobs by status"),
+}
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+_NOOP = nullcontext()
+
+def inc(name, value=1, **labels):
+    """Adds value to a counter."""
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, seconds, **labels):
+    """Records one duration in a histogram."""
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    i = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        h[i] += 1
+        h[-1] += seconds
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+def timer(name, **labels):
+    """Context manager recording the duration of its block in histogram `name`."""
+    return _Timer(name, labels) if ENABLED else _NOOP
+
+def stage(endpoint, stage_name):
+    """Times one stage of a request: `with stage("predict", "encode"): ...`."""
+    return _Timer("opd_stage_seconds", {"endpoint": endpoint, "stage": stage_name}) if ENABLED else _NOOP
+
+def count_unknown(endpoint, unknown):
+    """Counts unknown categories per feature from encode_features' unknown lists."""
+    if not ENABLED:
+        return
+    for cols in unknown:
+        for col in cols:
+            inc("opd_unknown_category_total", endpoint=endpoint, feature=col)
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(h) for key, h in _histograms.items()}
+
+    lines = []
+    for name, (kind, help_text) in HELP.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            continue
+        for (n, labels), h in sorted(histograms.items()):
+            if n != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, h):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            cumulative += h[len(BUCKETS)]
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {h[-1]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
@@ -1,7 +1,18 @@
+import os
+import tempfile
+# A fresh token store per run, so queue tests do not see visits from earlier runs; the
+# registry (seeded from backend/artifacts at startup), prediction log, data cache and saved
+# profiles are scratch copies too, so retraining and promotions never touch the live ones
+SCRATCH_DIR = tempfile.mkdtemp(prefix="opd-test-")
+os.environ.setdefault("OPD_TOKEN_STORE", os.path.join(SCRATCH_DIR, "visits.db"))
+os.environ.setdefault("OPD_REGISTRY_DIR", os.path.join(SCRATCH_DIR, "registry"))
+os.environ.setdefault("OPD_PREDICTION_LOG", os.path.join(SCRATCH_DIR, "predictions.db"))
+os.environ.setdefault("OPD_DATA_CACHE_DIR", os.path.join(SCRATCH_DIR, "data_cache"))
+os.environ.setdefault("OPD_PROFILE_DIR", os.path.join(SCRATCH_DIR, "profiles"))
 from fastapi.testclient import TestClient
 from main import app
-import os
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 
 
 def run_tests():
@@ -11,6 +22,12 @@ def run_tests():
             assert response.status_code == 200
             assert response.json() == {"message": "OPD Flow Optimizer API is running"}
 
+        def test_health():
+            assert client.get("/health/live").status_code == 200
+            response = client.get("/health/ready")
+            assert response.status_code == 200
+            assert response.json()["status"] == "ready"
+
         def test_predict():
             payload = {
                 "Department": "Cardiology",
@@ -26,6 +43,616 @@ def run_tests():
             assert "TokenNumber" in data
             assert "WaitTime_Minutes" in data
             assert "DoctorID" in data
+            assert data["WaitTime_Low_Minutes"] <= data["WaitTime_High_Minutes"]
+
+        def test_predict_quantiles():
+            now = datetime.now().isoformat()
+            payload = {"Department": "Cardiology", "PriorityFlag": 0, "ScheduledTime": now}
+            data = client.post("/predict", json=payload, params={"quantiles": "0.25,0.5,0.75"}).json()
+            q = data["WaitTime_Quantiles"]
+            assert list(q) == ["0.25", "0.5", "0.75"]
+            assert q["0.25"] <= q["0.5"] <= q["0.75"]
+            assert data["WaitTime_Low_Minutes"] == q["0.25"]
+            batch = client.post("/predict/batch", json=[payload], params={"quantiles": "off"}).json()
+            assert batch["results"][0]["prediction"]["WaitTime_Quantiles"] is None
+            assert client.post("/predict", json=payload, params={"quantiles": "1.5"}).status_code == 422
+
+        def test_flat_forest():
+            import numpy as np
+            import registry
+            from forest import HybridForest
+            from serving import load_bundle
+
+            artifacts_dir = registry.active_dir()
+            sklearn_model = load_bundle(artifacts_dir, use_flat=False).model
+            flat = load_bundle(artifacts_dir, flat_max_rows=0).model
+            hybrid = load_bundle(artifacts_dir, flat_max_rows=50).model
+            assert isinstance(hybrid, HybridForest)
+            rng = np.random.default_rng(1)
+            lookups = load_bundle(artifacts_dir).category_lookups
+            highs = [len(lookups["Department"]), 2, 7, 24, len(lookups["DoctorID"])]
+            X = rng.integers(0, highs, size=(2000, 5)).astype(np.float64)
+            expected = sklearn_model.predict(X)
+            # Bit-identical to sklearn, on both sides of the row threshold
+            assert np.array_equal(flat.predict(X), expected)
+            assert np.array_equal(hybrid.predict(X), expected) and hybrid._sklearn is not None
+            assert np.array_equal(hybrid.predict(X[:50]), expected[:50])
+            point, spread = flat.predict_quantiles(X, (0.1, 0.9))
+            hybrid_point, hybrid_spread = hybrid.predict_quantiles(X, (0.1, 0.9))
+            assert np.array_equal(point, expected) and np.array_equal(hybrid_point, expected)
+            assert np.array_equal(spread, hybrid_spread)
+
+        def test_mmap_model():
+            import numpy as np
+            import registry
+            from forest import FlatForest
+            from preprocessing import compile_lookups, load_processors
+            from serving import load_bundle
+
+            artifacts_dir = registry.active_dir()
+            sklearn_model = load_bundle(artifacts_dir, use_flat=False).model
+            X = np.random.default_rng(3).integers(0, [5, 2, 7, 24, 15], size=(300, 5)).astype(np.float64)
+            with tempfile.TemporaryDirectory() as tmp:
+                original = FlatForest.from_sklearn(sklearn_model)
+                original.save_dir(tmp)
+                loaded = FlatForest.load_dir(tmp)
+                assert isinstance(loaded.threshold, np.memmap) and not loaded.threshold.flags.writeable
+                assert np.array_equal(loaded.predict(X), original.predict(X))
+            bundle = load_bundle(artifacts_dir, use_mmap=True, flat_max_rows=0)
+            assert isinstance(bundle.model.value, np.memmap)
+            assert np.array_equal(bundle.model.predict(X), sklearn_model.predict(X))
+            assert bundle.category_lookups == compile_lookups(load_processors(artifacts_dir))
+
+        def test_prediction_table():
+            import numpy as np
+            import registry
+            from forest import forest_quantiles
+            from serving import load_bundle
+
+            # Every cell of the grid matches the model, from memory and memory-mapped
+            for mode in ("memory", "mmap"):
+                bundle = load_bundle(registry.active_dir(), table_mode=mode)
+                shape = tuple(bundle.prediction_table.shape)
+                grid = np.indices(shape).reshape(len(shape), -1).T.astype(np.float64)
+                assert np.array_equal(bundle.score(grid), bundle.model.predict(grid))
+                assert isinstance(bundle.prediction_table.values, np.memmap) == (mode == "mmap")
+            # Rows off the grid (PriorityFlag 2, an unseen doctor code) fall back to the model
+            off_grid = np.vstack([grid[:5], [[0, 2, 3, 10, 1], [1, 0, 3, 10, shape[4]]]])
+            assert np.array_equal(bundle.score(off_grid), bundle.model.predict(off_grid))
+
+            quantiles = (0.1, 0.9)
+            bundle = load_bundle(registry.active_dir(), table_mode="memory", table_quantiles=quantiles)
+            highs = bundle.prediction_table.shape
+            X = np.random.default_rng(2).integers(0, highs, size=(500, 5)).astype(np.float64)
+            # With the table's quantiles, intervals are lookups too (no model call)
+            point, spread = bundle._replace(model=None).score_quantiles(X, quantiles)
+            expected_point, expected_spread = forest_quantiles(bundle.model, X, quantiles)
+            assert np.array_equal(point, expected_point) and np.array_equal(spread, expected_spread)
+            outside = np.vstack([X[:3], [[0, 3, 0, 9, 0]]])  # PriorityFlag 3 is off the grid
+            point, spread = bundle.score_quantiles(outside, quantiles)
+            expected_point, expected_spread = forest_quantiles(bundle.model, outside, quantiles)
+            assert np.array_equal(point, expected_point) and np.array_equal(spread, expected_spread)
+
+        def test_predict_batch():
+            now = datetime.now().isoformat()
+            payload = [
+                {"Department": "Cardiology", "PriorityFlag": 0, "ScheduledTime": now, "DoctorID": "DOC_1"},
+                {"Department": "Astrology", "PriorityFlag": 1, "ScheduledTime": now},
+                {"Department": "Pediatrics", "PriorityFlag": 1, "ScheduledTime": now},
+            ]
+            response = client.post("/predict/batch", json=payload)
+            assert response.status_code == 200
+            data = response.json()
+            assert [r["index"] for r in data["results"]] == [0, 1, 2]
+            assert data["n_success"] == 2
+            assert data["n_failed"] == 1
+            assert data["results"][1]["error"]
+            assert data["results"][0]["prediction"]["DoctorID"] == "DOC_1"
+
+        def test_encoding():
+            import registry
+            from preprocessing import load_processors, compile_lookups, encode_features, UNKNOWN_CATEGORY_CODE
+
+            encoders = load_processors(registry.active_dir())
+            lookups = compile_lookups(encoders)
+            # The compiled dicts give the same codes as LabelEncoder.transform
+            for col, encoder in encoders.items():
+                labels = list(encoder.classes_)
+                assert [lookups[col][str(label)] for label in labels] == list(encoder.transform(labels))
+            department, doctor = encoders["Department"].classes_[1], encoders["DoctorID"].classes_[2]
+            when = datetime(2024, 3, 6, 14, 30)  # a Wednesday
+            X, unknown = encode_features([(department, 1, when, doctor), ("Astrology", 0, when, "DOC_999")], lookups)
+            assert X[0].tolist() == [1, 1, 2, 14, 2] and unknown[0] == []
+            assert unknown[1] == ["Department", "DoctorID"]
+            assert X[1, 0] == X[1, 4] == UNKNOWN_CATEGORY_CODE
+
+        def test_score_file():
+            import io
+            import json
+            import pandas as pd
+
+            rows = ["Department,PriorityFlag,ScheduledTime,DoctorID"]
+            rows += [f"Cardiology,{i % 2},2024-01-01 {8 + i % 8:02d}:15:00,DOC_1" for i in range(25)]
+            rows += ["Unknown Dept,0,2024-01-01 09:00:00,DOC_1", "Cardiology,0,not a time,DOC_1"]
+            upload = "\n".join(rows).encode()
+            response = client.post("/predict/file?output=ndjson&chunk_rows=10&quantiles=off",
+                                    files={"file": ("schedule.csv", upload, "text/csv")})
+            assert response.status_code == 200 and response.headers["x-model-version"]
+            results = [json.loads(line) for line in response.text.splitlines()]
+            assert len(results) == 27
+            assert all(r["Error"] is None and r["WaitTime_Minutes"] > 0 for r in results[:25])
+            assert results[25]["Error"] == "Unknown Department: Unknown Dept" and results[25]["WaitTime_Minutes"] is None
+            assert results[26]["Error"].startswith("Invalid ScheduledTime")
+
+            # Same encoding as /predict: the chunked scores match single predictions
+            single = client.post("/predict?quantiles=off", json={
+                "Department": "Cardiology", "PriorityFlag": 1, "ScheduledTime": "2024-01-01T09:15:00",
+                "DoctorID": "DOC_1"}).json()
+            assert abs(results[1]["WaitTime_Minutes"] - single["WaitTime_Minutes"]) < 1e-9
+
+            response = client.post("/predict/file?output=csv&chunk_rows=10",
+                                   files={"file": ("schedule.csv", upload, "text/csv")})
+            scored = pd.read_csv(io.StringIO(response.text))
+            assert len(scored) == 27 and {"WaitTime_Minutes", "WaitTime_Low_Minutes", "Error"} <= set(scored.columns)
+
+            # A malformed line after the first chunk: the stream ends with a trailer, not silently
+            bad = rows[:15] + ["Cardiology,0,2024-01-01 09:00:00,DOC_1,extra"] + rows[15:]
+            bad_upload = "\n".join(bad).encode()
+            response = client.post("/predict/file?output=ndjson&chunk_rows=10&quantiles=off",
+                                   files={"file": ("schedule.csv", bad_upload, "text/csv")})
+            lines = [json.loads(line) for line in response.text.splitlines()]
+            assert len(lines) == 11 and all(r["Error"] is None for r in lines[:10])
+            assert lines[-1]["Truncated"] is True and lines[-1]["RowsWritten"] == 10
+            assert lines[-1]["Error"].startswith("Scoring stopped after 10 rows")
+            response = client.post("/predict/file?output=csv&chunk_rows=10",
+                                   files={"file": ("schedule.csv", bad_upload, "text/csv")})
+            scored = pd.read_csv(io.StringIO(response.text))
+            assert len(scored) == 11 and scored["Error"].iloc[-1].startswith("Scoring stopped after 10 rows")
+            assert scored["Error"].iloc[:10].isna().all() and pd.isna(scored["Department"].iloc[-1])
+
+            response = client.post("/predict/file", files={"file": ("schedule.csv", b"a,b\n1,2\n", "text/csv")})
+            assert response.status_code == 422 and "missing columns" in response.json()["detail"]
+            response = client.post("/predict/file", files={"file": ("schedule.xlsx", upload, "text/csv")})
+            assert response.status_code == 422
+
+        def test_queue():
+            now = datetime.now().isoformat()
+            normal = client.post("/predict", json={
+                "Department": "Dermatology", "PriorityFlag": 0, "ScheduledTime": now, "DoctorID": "DOC_7"
+            }).json()
+            urgent = client.post("/predict", json={
+                "Department": "Dermatology", "PriorityFlag": 1, "ScheduledTime": now, "DoctorID": "DOC_7"
+            }).json()
+            assert urgent["TokenNumber"] > normal["TokenNumber"]
+            status = client.get("/queue/status").json()
+            queue = [q for q in status["queues"] if q["DoctorID"] == "DOC_7" and q["Department"] == "Dermatology"][0]
+            assert queue["QueueLength"] >= 2
+            # High priority is called first even though it arrived later
+            called = client.post("/queue/doctors/DOC_7/next", params={"department": "Dermatology"}).json()
+            assert called["TokenNumber"] == urgent["TokenNumber"]
+            assert client.delete(f"/queue/tokens/{normal['TokenNumber']}").status_code == 200
+            assert client.delete(f"/queue/tokens/{normal['TokenNumber']}").status_code == 404
+
+        def test_token_store():
+            import tempfile
+            from concurrent.futures import ThreadPoolExecutor
+            from token_store import TokenStore
+
+            path = os.path.join(tempfile.mkdtemp(), "visits.db")
+            workers = [TokenStore(path), TokenStore(path)]  # two processes sharing the file
+            now = datetime.now()
+            visit = ("Cardiology", "DOC_1", 0, now, now, 5.0)
+            with ThreadPoolExecutor(8) as pool:
+                tokens = [t for ts in pool.map(lambda i: workers[i % 2].issue([visit] * 3), range(40)) for t in ts]
+            assert sorted(tokens) == list(range(1, 121))
+            assert workers[1].issue([visit, ("Cardiology", "DOC_1", 1, now, None, 2.0)]) == [121, 122]
+
+            # The urgent visit comes first, from either worker; cancelled visits are skipped
+            assert workers[0].call_next("DOC_1")["token"] == 122
+            assert workers[1].cancel(1)["status"] == "cancelled" and workers[0].cancel(1) is None
+            assert workers[1].call_next("DOC_1", "Cardiology")["token"] == 2
+            waiting = workers[0].doctor_queue("DOC_1", department="Cardiology")
+            assert len(waiting) == 119 and waiting[0]["token"] == 3
+            # Booked for tomorrow: in tomorrow's queue, not called today
+            tomorrow = now + timedelta(days=1)
+            (booked,) = workers[0].issue([("Dermatology", "DOC_2", 1, now, tomorrow, 5.0)])
+            assert workers[1].call_next("DOC_2") is None
+            assert [v["token"] for v in workers[1].doctor_queue("DOC_2", day=tomorrow.date())] == [booked]
+            for department in (None, "Cardiology"):
+                sql = "SELECT token FROM visits WHERE visit_date = ? AND doctor_id = ? AND status = 'waiting'" \
+                    " ORDER BY priority_flag DESC, token"
+                if department:
+                    sql = sql.replace("doctor_id = ?", "department = ? AND doctor_id = ?")
+                args = (now.date().isoformat(), department, "DOC_1") if department else (now.date().isoformat(), "DOC_1")
+                for query in (sql, sql.replace("token FROM", "COUNT(*) FROM").split(" ORDER BY")[0]):
+                    plan = " ".join(str(r) for r in workers[0]._conn().execute("EXPLAIN QUERY PLAN " + query, args))
+                    assert "USING COVERING INDEX" in plan and "TEMP B-TREE" not in plan, plan
+
+            # Queue lengths and stats come from the store, whichever worker changed it
+            from queue_engine import QueueEngine
+            engines = [QueueEngine(store=worker) for worker in workers]
+            engines[0].enqueue_many([("Cardiology", "DOC_3", 0, 4.0, now), ("Cardiology", "DOC_3", 1, 6.0, now)])
+            assert engines[1].queue_length("DOC_3") == 2 and engines[1].queue_length("DOC_3", "Cardiology") == 2
+            assert engines[1].call_next("DOC_3").priority == 1
+            row = [q for q in engines[0].status() if q["DoctorID"] == "DOC_3"][0]
+            assert (row["QueueLength"], row["Served"], row["AvgPredictedWait_Minutes"]) == (1, 1, 4.0)
+            assert QueueEngine(store=TokenStore(path)).queue_length("DOC_3") == 1  # after a restart
+
+            # SQLite without RETURNING is refused up front, not on the first token
+            import sqlite3
+            real_version = sqlite3.sqlite_version_info
+            sqlite3.sqlite_version_info = (3, 34, 1)
+            try:
+                TokenStore(path)
+                assert False, "old SQLite accepted"
+            except RuntimeError as e:
+                assert "3.35.0 or newer" in str(e)
+            finally:
+                sqlite3.sqlite_version_info = real_version
+
+            data = client.get("/queue/doctors/DOC_7/today", params={"department": "Dermatology", "status": "called"}).json()
+            assert data and all(v["Status"] == "called" and v["DoctorID"] == "DOC_7" for v in data)
+
+        def test_routing():
+            from main import bundle
+            now = datetime.now().isoformat()
+            payload = [{"Department": "Orthopedics", "PriorityFlag": 0, "ScheduledTime": now}] * 6
+            data = client.post("/predict/batch", json=payload).json()
+            doctors = bundle.router.department_doctors.get("Orthopedics", bundle.known_doctors)
+            assert all(r["prediction"]["DoctorID"] in doctors for r in data["results"])
+
+        def test_events():
+            import asyncio
+            from events import EventBus
+
+            async def snapshot():
+                return {"queues": []}
+
+            async def read(bus, n, after=None):
+                items = []
+                async for seq, event, payload in bus.stream(snapshot, after, keepalive=1):
+                    items.append((seq, event))
+                    if len(items) == n:
+                        return items
+
+            bus = EventBus(capacity=4)
+            for i in range(3):
+                bus.publish("token_issued", {"i": i})
+            # Resume after event 1: events 2 and 3, no snapshot
+            assert asyncio.run(read(bus, 2, after=1)) == [(2, "token_issued"), (3, "token_issued")]
+            # Fell too far behind: a new snapshot instead of the lost events
+            for i in range(5):
+                bus.publish("token_called", {"i": i})
+            assert asyncio.run(read(bus, 1, after=1)) == [(8, "snapshot")]
+
+            # The API's snapshot queries the store from a worker thread, not the event loop
+            import threading
+            import main
+            status, threads = main.queue_engine.status, []
+            main.queue_engine.status = lambda: threads.append(threading.current_thread()) or status()
+            try:
+                data = asyncio.run(main._event_snapshot())
+            finally:
+                main.queue_engine.status = status
+            assert threads and threads[0] is not threading.current_thread()
+            assert data["total_waiting"] == sum(q["QueueLength"] for q in data["queues"])
+
+        def test_prediction_log():
+            import sqlite3
+            from prediction_log import PredictionLog, COLUMNS
+
+            with tempfile.TemporaryDirectory() as tmp:
+                records = [(f"2024-01-01T08:0{i}",) + (None,) * (len(COLUMNS) - 1) for i in range(5)]
+                kept, accepted = {}, {}
+                for policy in ("drop_newest", "drop_oldest", "block"):
+                    # No writer running yet, so the buffer of 3 fills up
+                    log = PredictionLog(os.path.join(tmp, f"{policy}.db"), capacity=3, policy=policy,
+                                        flush_interval=0.05)
+                    accepted[policy] = [log.enqueue(r) for r in records]
+                    stats = log.stats()
+                    assert (stats["queued"], stats["dropped"], stats["pending"]) == (sum(accepted[policy]), 2, 3)
+                    log.start()
+                    log.stop()
+                    assert log.stats()["written"] == 3 and log.stats()["pending"] == 0
+                    with sqlite3.connect(log.path) as conn:
+                        kept[policy] = [r[0] for r in conn.execute("SELECT logged_at FROM predictions ORDER BY id")]
+                assert kept["drop_newest"] == kept["block"] == [r[0] for r in records[:3]]
+                assert kept["drop_oldest"] == [r[0] for r in records[2:]]
+                assert accepted["drop_newest"] == accepted["block"] == [True] * 3 + [False] * 2
+                assert accepted["drop_oldest"] == [True] * 5
+
+        def test_prometheus_metrics():
+            response = client.get("/metrics")
+            assert response.status_code == 200
+            text = response.text
+            assert 'opd_requests_total{endpoint="predict"}' in text
+            assert 'opd_stage_seconds_bucket{endpoint="predict",stage="model",le="+Inf"}' in text
+            assert 'opd_unknown_category_total{endpoint="batch",feature="Department"} 1' in text
+
+            # A failing batch shows up in the error counter, as /predict failures do
+            import main
+            def fail(patients):
+                raise RuntimeError("token store unavailable")
+            enqueue_many, main.queue_engine.enqueue_many = main.queue_engine.enqueue_many, fail
+            try:
+                response = client.post("/predict/batch", json=[
+                    {"Department": "Cardiology", "PriorityFlag": 0, "ScheduledTime": datetime.now().isoformat()}])
+            finally:
+                main.queue_engine.enqueue_many = enqueue_many
+            assert response.status_code == 500
+            assert 'opd_request_errors_total{endpoint="batch"} 1' in client.get("/metrics").text
+
+        def test_profiler():
+            import contextvars
+            import threading
+            import main
+            import profiler
+
+            # Disabled without an admin token, and the token is checked once set
+            assert client.get("/admin/profiles").status_code == 404
+            main.ADMIN_TOKEN = "test-token"
+            try:
+                assert client.get("/admin/profiles").status_code == 403
+                response = client.get("/admin/profile", params={"seconds": 0.2, "interval_ms": 2},
+                                      headers={"X-Admin-Token": "test-token"})
+                assert response.status_code == 200
+            finally:
+                main.ADMIN_TOKEN = None
+            # "thread;frame;frame count" lines
+            line = response.text.splitlines()[0]
+            assert ";" in line and line.rsplit(" ", 1)[1].isdigit()
+
+            # A slow-request profile covers the request's handler thread, not the others
+            def spin(until):
+                while time.perf_counter() < until:
+                    pass
+
+            def request_work():
+                spin(time.perf_counter() + 0.2)
+
+            def background_work():
+                spin(time.perf_counter() + 0.4)
+
+            slow = profiler.SlowRequestProfiler(threshold_ms=0, every=1)
+            slow.armed = True
+            background = threading.Thread(target=background_work)
+            background.start()
+            sampler = slow.begin()
+            handler = threading.Thread(target=contextvars.copy_context().run,
+                                       args=(profiler.in_request_thread(request_work),))
+            handler.start()
+            handler.join()
+            name = slow.end(sampler, 0.2, "test")
+            background.join()
+            text = profiler.read_profile(name)
+            assert "request_work" in text and "background_work" not in text
+
+        def test_simulation():
+            response = client.post("/simulate", json={
+                "DayOfWeek": 0, "n_replications": 50,
+                "add_shifts": [{"Department": "Cardiology", "StartHour": 8, "EndHour": 12}],
+            })
+            assert response.status_code == 200
+            data = response.json()
+            assert data["n_replications"] == 50
+            assert data["throughput"]["served_mean"] > 0
+            assert all(0 <= d["Utilization"] <= 1 for d in data["doctors"])
+            assert any(d["DoctorID"] == "EXTRA-1" and d["StartHour"] == 8 for d in data["doctors"])
+            for start, end in ((8, 30), (14, 9), (10, 10), (-1, 5)):
+                response = client.post("/simulate", json={
+                    "add_shifts": [{"Department": "Cardiology", "StartHour": start, "EndHour": end}]})
+                assert response.status_code == 422
+            response = client.post("/simulate", json={"n_replications": 10, "service_minutes": {"Astrology": 12}})
+            assert response.status_code == 422 and "Astrology" in response.json()["detail"]
+
+        def test_model_registry():
+            import json
+            import shutil
+            import tempfile
+            import registry
+            from main import ARTIFACTS_DIR
+
+            tmp = tempfile.mkdtemp()
+            try:
+                reg, source = os.path.join(tmp, "registry"), os.path.join(tmp, "source")
+                v1 = registry.import_dir(ARTIFACTS_DIR, reg)
+                assert registry.import_dir(ARTIFACTS_DIR, reg) == v1  # same contents, same version
+                shutil.copytree(ARTIFACTS_DIR, source, ignore=shutil.ignore_patterns("registry", "*.db*"))
+                with open(os.path.join(source, "routing.json"), "w") as f:
+                    json.dump({"departments": {}}, f)
+                v2 = registry.import_dir(source, reg)
+                assert v2 != v1 and len(registry.list_versions(reg)) == 2
+                registry.activate(v1, reg)
+                registry.activate(v2, reg)
+                assert registry.active_version(reg) == v2
+                assert registry.rollback(reg) == v1 and registry.active_version(reg) == v1
+                assert registry.rollback(reg) is None
+
+                # Activations from several processes at once: the file lock keeps every entry
+                import multiprocessing
+                versions = [f"{i:012x}" for i in range(80)]
+                many = os.path.join(tmp, "many")
+                for version in versions:
+                    os.makedirs(registry.version_dir(version, many))
+                with multiprocessing.get_context("forkserver").Pool(4) as pool:
+                    pool.starmap(registry.activate, [(version, many) for version in versions], chunksize=1)
+                assert sorted(registry.history(many)) == versions
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+
+            data = client.get("/mlops/models").json()
+            active = [v for v in data["versions"] if v["active"]]
+            assert active and active[0]["version"] == data["active"] and active[0]["loaded"]
+            # The active version is in memory: promoting it is a swap without loading
+            assert client.post(f"/mlops/models/{data['active']}/promote").json()["loaded_from_disk"] is False
+            assert client.post("/mlops/models/../promote").status_code == 404
+            assert client.get("/mlops/metrics").json()["model_version"] == data["active"]
+
+            # Another worker activating a version: this one follows the history file
+            import main
+            source = tempfile.mkdtemp()
+            other = None
+            try:
+                shutil.copytree(registry.version_dir(data["active"]), source, dirs_exist_ok=True)
+                with open(os.path.join(source, "routing.json"), "w") as f:
+                    json.dump({"departments": {}}, f)
+                other = registry.import_dir(source)
+                registry.activate(other)
+                try:
+                    main._follow_registry()
+                    assert main.bundle.version == other
+                    assert client.get("/mlops/metrics").json()["model_version"] == other
+                finally:
+                    registry.rollback()
+                main._follow_registry()
+                assert main.bundle.version == data["active"] and other not in main.loaded_bundles
+            finally:
+                shutil.rmtree(source, ignore_errors=True)
+                if other:
+                    shutil.rmtree(registry.version_dir(other), ignore_errors=True)
+
+        def test_drift():
+            from types import SimpleNamespace
+            from drift import DriftMonitor, build_reference
+
+            encoders = {"Department": SimpleNamespace(classes_=["A", "B"]), "DoctorID": SimpleNamespace(classes_=["D1", "D2"])}
+            hours = [9, 10, 11, 12] * 100
+            X = {"Department": [0, 1] * 200, "PriorityFlag": [0] * 400, "DayOfWeek": [0] * 400,
+                 "HourOfDay": hours, "DoctorID": [0, 1] * 200}
+            reference = build_reference(X, encoders, [float(h) for h in hours])
+            lookups = {"Department": {"A": 0, "B": 1}, "DoctorID": {"D1": 0, "D2": 1}}
+            monday = datetime(2024, 1, 1)
+
+            monitor = DriftMonitor(reference, lookups, window=300)
+            monitor.observe([("AB"[i % 2], 0, monday.replace(hour=hours[i]), ("D1", "D2")[i % 2]) for i in range(400)],
+                            [float(h) for h in hours])
+            report = monitor.report()
+            assert report["scored"] and report["drifted"] == []
+            assert report["recent_rows"] == 400 and report["features"]["HourOfDay"]["ks"] < 0.05
+            # Evening traffic from an unseen department, after two windows only the new traffic counts
+            monitor.observe([("C", 1, monday.replace(hour=18), "D1")] * 600, [30.0] * 600)
+            report = monitor.report()
+            assert {"Department", "HourOfDay", "PriorityFlag", "PredictedWait"} <= set(report["drifted"])
+            assert report["features"]["Department"]["top_shifts"][0]["bin"] == "(unseen)"
+            assert report["total_rows"] == 1000 and report["recent_rows"] <= 600
+
+            response = client.get("/mlops/drift")
+            assert response.status_code == 200
+            data = response.json()
+            assert data["model_version"] and data["total_rows"] > 0 and data["reference_rows"] > 0
+
+        def test_data_cache():
+            import pandas as pd
+            import data_cache
+
+            with tempfile.TemporaryDirectory() as tmp:
+                source = os.path.join(tmp, "visits.csv")
+                pd.DataFrame({
+                    "PatientID": [f"PAT_{i}" for i in range(6)],
+                    "Department": ["Cardiology", "Pediatrics", None, "Cardiology", "Pediatrics", "Cardiology"],
+                    "WaitTime_Minutes": [5, 10, 15, 20, 25, 30],
+                }).to_csv(source, index=False)
+                cache_dir = os.path.join(tmp, "cache")
+                data_cache.load_cached(source, cache_dir=cache_dir)
+                df = data_cache.load_cached(source, cache_dir=cache_dir)
+                # Repeated labels stay memory-mapped codes; unique ids are plain strings
+                assert isinstance(df["Department"].dtype, pd.CategoricalDtype)
+                assert not df["Department"].array.codes.flags.writeable
+                assert df["Department"].isna().tolist() == [False, False, True, False, False, False]
+                assert df["PatientID"].tolist()[-1] == "PAT_5" and df["WaitTime_Minutes"].sum() == 105
+                assert not [name for name in os.listdir(cache_dir) if ".tmp" in name]
+
+        def test_synth_data():
+            import pandas as pd
+            import synth_data
+
+            chunks = list(synth_data.generate_visits(5000, seed=7, n_departments=7, n_doctors=14, chunk_size=1000))
+            df = pd.concat(chunks, ignore_index=True)
+            again = pd.concat(synth_data.generate_visits(5000, seed=7, n_departments=7, n_doctors=14, chunk_size=1000),
+                              ignore_index=True)
+            # Same seed, same rows
+            assert len(chunks) > 1 and len(df) == 5000 and df.equals(again)
+            assert list(df.columns) == ["PatientID", "Department", "DoctorID", "PriorityFlag",
+                                        "ScheduledTime", "WaitTime_Minutes"]
+            assert df["PatientID"].is_unique and df["ScheduledTime"].is_monotonic_increasing
+            assert set(df["Department"]) == set(synth_data.DEFAULT_DEPARTMENTS) | {"Department_6", "Department_7"}
+            # Each doctor works in one department
+            assert (df.groupby("DoctorID")["Department"].nunique() == 1).all()
+            assert abs(df["PriorityFlag"].mean() - synth_data.HIGH_PRIORITY_RATE) < 0.03
+            assert (df["WaitTime_Minutes"] >= 0).all()
+            # Weekday-heavy, Sunday-light, and only during opening hours
+            by_day = df["ScheduledTime"].dt.dayofweek.value_counts()
+            assert by_day[0] > 4 * by_day.get(6, 0)
+            assert set(df["ScheduledTime"].dt.hour) <= set(synth_data.HOUR_OF_DAY_WEIGHTS.nonzero()[0])
+
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "visits.csv")
+                assert synth_data.write_visits(path, 300, seed=7, chunk_size=100) == 300
+                written = pd.read_csv(path)
+                assert len(written) == 300 and written["PatientID"].is_unique
+                try:
+                    synth_data.write_visits(os.path.join(tmp, "visits.txt"), 10)
+                    assert False, "unsupported extension accepted"
+                except ValueError:
+                    pass
+
+        def test_time_cv():
+            import numpy as np
+            from types import SimpleNamespace
+            from sklearn.ensemble import RandomForestRegressor
+            from evaluation import rolling_origin_cv, fold_bounds
+
+            rng = np.random.default_rng(0)
+            times = np.datetime64("2024-01-01T08:00") + rng.permutation(600).astype("timedelta64[h]")
+            X = np.column_stack([rng.integers(0, 3, 600), rng.integers(0, 2, 600), np.zeros(600),
+                                 times.astype("datetime64[h]").astype(np.int64) % 24, rng.integers(0, 4, 600)])
+            y = X[:, 0] * 5 + X[:, 3] + rng.normal(0, 1, 600)
+            encoders = {"Department": SimpleNamespace(classes_=["A", "B", "C"])}
+            with tempfile.TemporaryDirectory() as tmp:
+                result = rolling_origin_cv(X, y, times, encoders, RandomForestRegressor, {"n_estimators": 5},
+                                           n_folds=4, n_workers=1, max_train_rows=200, cache_dir=tmp)
+                assert len(os.listdir(tmp)) == 1
+                order, _ = fold_bounds(times.view(np.int64), 4, cache_dir=tmp)
+                assert (np.diff(times[order].view(np.int64)) >= 0).all()
+                # Same folds fitted in a worker pool (started from a fork server)
+                pooled = rolling_origin_cv(X, y, times, encoders, RandomForestRegressor, {"n_estimators": 5},
+                                           n_folds=4, n_workers=2, max_train_rows=200, cache_dir=tmp)
+                assert [f["rmse"] for f in pooled["folds"]] == [f["rmse"] for f in result["folds"]]
+            assert result["scheme"] == "rolling_origin" and result["n_folds"] == 4
+            for fold in result["folds"]:
+                # Never trained on the future, and the training window is capped
+                assert fold["train_from"] < fold["test_from"] <= fold["test_to"] and fold["n_train"] <= 200
+            assert set(result["by_department"]) == {"A", "B", "C"}
+            assert sum(d["n"] for d in result["by_hour"].values()) == sum(f["n_test"] for f in result["folds"])
+
+        def test_tuning():
+            import multiprocessing
+            import numpy as np
+            import tuning
+
+            rng = np.random.default_rng(5)
+            X = rng.integers(0, [3, 2, 7, 24, 6], size=(300, 5)).astype(np.float64)
+            y = X[:, 0] * 4 + X[:, 3] + rng.normal(0, 1, 300)
+            def shared_blocks():
+                # SharedMemory segments only (joblib keeps its own semaphores there too)
+                return {n for n in os.listdir("/dev/shm") if n.startswith("psm_")} if os.path.isdir("/dev/shm") else set()
+
+            blocks_before = shared_blocks()
+            stages = []
+            best, log = tuning.search(X, y, time_budget=120, n_workers=2, n_candidates=6, seed=1,
+                                      report=lambda stage, fraction: stages.append(fraction))
+            # Successive halving: 6 candidates, then the best 2, then the best 1 on all rows
+            assert [sum(r["rung"] == i for r in log) for i in range(3)] == [6, 2, 1]
+            assert best["fraction"] == 1.0 and best["model"] in tuning.MODEL_CLASSES
+            assert stages and all(0 < f <= 1 for f in stages)
+            # Out of time before any fit finishes: an error, and no workers or shared memory left behind
+            try:
+                tuning.search(X, y, time_budget=0.001, n_workers=2, n_candidates=6)
+                assert False, "search finished within 1 ms"
+            except RuntimeError:
+                pass
+            assert not multiprocessing.active_children()
+            assert shared_blocks() <= blocks_before
 
         def test_metrics():
             response = client.get("/mlops/metrics")
@@ -35,25 +662,83 @@ def run_tests():
             assert "rmse" in data
 
         def test_retrain():
-            # This might take a while, so we just check if endpoint exists and returns valid structure
-            # For smoke test, maybe skip actual training if it's heavy, but our model is small.
+            import main
             response = client.post("/mlops/retrain")
-            assert response.status_code == 200
-            data = response.json()
+            assert response.status_code == 202
+            job_id = response.json()["job_id"]
+            # While it runs, the same request joins the job and different parameters are refused
+            assert client.post("/mlops/retrain").json()["job_id"] == job_id
+            response = client.post("/mlops/retrain", params={"tune": "true"})
+            assert response.status_code == 409 and response.json()["detail"]["params"]["tune"] is False
+            for _ in range(600):
+                data = client.get(f"/mlops/retrain/{job_id}").json()
+                if data["status"] not in ("Queued", "Running"):
+                    break
+                time.sleep(0.5)
             assert data["status"] == "Success"
-            assert data["model_version"] == "v1.1"
+            assert data["progress"] == 1.0 and data["stage"] == "Done"
+            assert data["params"] == {"tune": False, "budget": 300.0}
+            # Hot-swapped: the new version is active and serving
+            assert data["model_version"] and main.bundle.version == data["model_version"]
+            assert client.get("/mlops/models").json()["active"] == data["model_version"]
+            assert client.get("/health/ready").json()["model_version"] == data["model_version"]
 
         test_read_root()
         print("Root endpoint: PASS")
+        test_health()
+        print("Health endpoints: PASS")
         test_predict()
         print("Prediction endpoint: PASS")
+        test_predict_quantiles()
+        print("Prediction quantiles: PASS")
+        test_flat_forest()
+        print("Flat forest: PASS")
+        test_mmap_model()
+        print("Memory-mapped model: PASS")
+        test_prediction_table()
+        print("Prediction table: PASS")
+        test_predict_batch()
+        print("Batch prediction endpoint: PASS")
+        test_encoding()
+        print("Feature encoding: PASS")
+        test_score_file()
+        print("Schedule file scoring: PASS")
+        test_queue()
+        print("Queue endpoints: PASS")
+        test_token_store()
+        print("Token store: PASS")
+        test_routing()
+        print("Doctor routing: PASS")
+        test_events()
+        print("Event stream: PASS")
         test_metrics()
         print("Metrics endpoint: PASS")
-        # test_retrain() # Skip retrain to avoid changing state during test or long wait
-        # print("Retraining endpoint: PASS")
+        test_prediction_log()
+        print("Prediction log: PASS")
+        test_prometheus_metrics()
+        print("Prometheus metrics endpoint: PASS")
+        test_profiler()
+        print("Profiler endpoint: PASS")
+        test_simulation()
+        print("Simulation endpoint: PASS")
+        test_model_registry()
+        print("Model registry: PASS")
+        test_drift()
+        print("Drift monitor: PASS")
+        test_data_cache()
+        print("Data cache: PASS")
+        test_synth_data()
+        print("Synthetic data: PASS")
+        test_time_cv()
+        print("Time-ordered cross-validation: PASS")
+        test_tuning()
+        print("Hyperparameter search: PASS")
+        test_retrain()
+        print("Retraining endpoint: PASS")
         print("All smoke tests passed!")
 
 if __name__ == "__main__":
+    import shutil
     try:
         run_tests()
     except Exception as e:
@@ -61,3 +746,5 @@ if __name__ == "__main__":
         import traceback
         traceback.print_exc()
         exit(1)
+    finally:
+        shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
@@ -0,0 +1,188 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+COLUMNS = (
+    "token", "visit_date", "department", "doctor_id", "priority_flag", "arrival_time",
+    "scheduled_time", "predicted_wait_minutes", "status", "called_time",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS token_sequence (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO token_sequence (name, value) VALUES ('token', 0);
+CREATE TABLE IF NOT EXISTS visits (
+    token INTEGER PRIMARY KEY,
+    visit_date TEXT NOT NULL,
+    department TEXT NOT NULL,
+    doctor_id TEXT NOT NULL,
+    priority_flag INTEGER NOT NULL,
+    arrival_time TEXT NOT NULL,
+    scheduled_time TEXT,
+    predicted_wait_minutes REAL,
+    status TEXT NOT NULL DEFAULT 'waiting',
+    called_time TEXT
+);
+-- A doctor's queue for a day, in call order, with or without the department
+CREATE INDEX IF NOT EXISTS idx_visits_day_dept_doctor
+    ON visits (visit_date, department, doctor_id, status, priority_flag DESC, token);
+CREATE INDEX IF NOT EXISTS idx_visits_day_doctor
+    ON visits (visit_date, doctor_id, status, priority_flag DESC, token);
+"""
+# UPDATE ... RETURNING, used to bump the sequence and to call/cancel a visit in one statement
+MIN_SQLITE_VERSION = (3, 35, 0)
+
+def _row_dict(row):
+    return dict(zip(COLUMNS, row)) if row else None
+
+class TokenStore:
+    """
+    Issued tokens and visits in SQLite (WAL mode), shared by every worker process.
+    Token numbers come from one sequence row that is bumped in the same transaction
+    that inserts the visits, so workers never hand out the same number. Queue reads,
+    queue lengths and call-next are index range lookups on (visit_date, [department,]
+    doctor_id, status), and per-queue totals are one grouped scan of the day's range.
+    """
+
+    def __init__(self, path, busy_timeout=30.0):
+        if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+            raise RuntimeError(
+                f"The token store needs SQLite {'.'.join(map(str, MIN_SQLITE_VERSION))} or newer"
+                f" (this Python links SQLite {sqlite3.sqlite_version}); upgrade SQLite"
+                " or set OPD_TOKEN_STORE=off"
+            )
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+
+    def _conn(self):
+        """One connection per thread, in autocommit mode with explicit transactions."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def issue(self, visits):
+        """
+        Persists visits and returns their new token numbers, consecutive and in order.
+        visits: (department, doctor_id, priority_flag, arrival_time, scheduled_time,
+        predicted_wait_minutes) tuples; all of them are written in one transaction.
+        A visit belongs to the day it is scheduled for, or the arrival day if unscheduled.
+        """
+        visits = list(visits)
+        if not visits:
+            return []
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            (last,) = conn.execute(
+                "UPDATE token_sequence SET value = value + ? WHERE name = 'token' RETURNING value", (len(visits),)
+            ).fetchone()
+            first = last - len(visits) + 1
+            conn.executemany(
+                "INSERT INTO visits (token, visit_date, department, doctor_id, priority_flag, arrival_time,"
+                " scheduled_time, predicted_wait_minutes) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (first + i, (scheduled or arrival).date().isoformat(), dept, doctor, int(priority), arrival.isoformat(),
+                     scheduled.isoformat() if scheduled else None, wait)
+                    for i, (dept, doctor, priority, arrival, scheduled, wait) in enumerate(visits)
+                ],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return list(range(first, last + 1))
+
+    def call_next(self, doctor_id, department=None, now=None):
+        """
+        Marks the doctor's next waiting visit of today as called and returns it (highest
+        priority, then lowest token), or None. A single UPDATE, so two workers never
+        call the same patient.
+        """
+        now = now or datetime.now()
+        where, params = "visit_date = ? AND doctor_id = ?", [now.date().isoformat(), doctor_id]
+        if department is not None:
+            where, params = "visit_date = ? AND department = ? AND doctor_id = ?", \
+                [now.date().isoformat(), department, doctor_id]
+        row = self._conn().execute(
+            f"UPDATE visits SET status = 'called', called_time = ? WHERE token = ("
+            f"SELECT token FROM visits WHERE {where} AND status = 'waiting'"
+            f" ORDER BY priority_flag DESC, token LIMIT 1) RETURNING {', '.join(COLUMNS)}",
+            [now.isoformat()] + params,
+        ).fetchone()
+        return _row_dict(row)
+
+    def cancel(self, token):
+        """Marks a waiting visit as cancelled and returns it, or None if it is not waiting."""
+        row = self._conn().execute(
+            f"UPDATE visits SET status = 'cancelled' WHERE token = ? AND status = 'waiting'"
+            f" RETURNING {', '.join(COLUMNS)}",
+            (token,),
+        ).fetchone()
+        return _row_dict(row)
+
+    def doctor_queue(self, doctor_id, day=None, department=None, status="waiting"):
+        """A doctor's visits of one day (default today) with the given status, in call order."""
+        day = (day or datetime.now().date()).isoformat()
+        where, params = "visit_date = ? AND doctor_id = ?", [day, doctor_id]
+        if department is not None:
+            where, params = "visit_date = ? AND department = ? AND doctor_id = ?", [day, department, doctor_id]
+        rows = self._conn().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM visits WHERE {where} AND status = ?"
+            f" ORDER BY priority_flag DESC, token",
+            params + [status],
+        ).fetchall()
+        return [_row_dict(row) for row in rows]
+
+    def visit(self, token):
+        """The visit row of a token, or None."""
+        row = self._conn().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM visits WHERE token = ?", (token,)
+        ).fetchone()
+        return _row_dict(row)
+
+    def queue_length(self, doctor_id, day=None, department=None):
+        """Waiting visits of a doctor for one day (default today): a COUNT over the covering index."""
+        day = (day or datetime.now().date()).isoformat()
+        where, params = "visit_date = ? AND doctor_id = ?", [day, doctor_id]
+        if department is not None:
+            where, params = "visit_date = ? AND department = ? AND doctor_id = ?", [day, department, doctor_id]
+        (count,) = self._conn().execute(
+            f"SELECT COUNT(*) FROM visits WHERE {where} AND status = 'waiting'", params
+        ).fetchone()
+        return count
+
+    def queue_totals(self, day=None, department=None, doctor_id=None):
+        """
+        Running totals of every (department, doctor) queue of one day (default today), or of
+        one queue: (department, doctor_id, waiting, predicted_wait_sum, served, actual_wait_sum)
+        tuples in (department, doctor) order, from one scan of the day's index range.
+        Actual waits are minutes from arrival to call.
+        """
+        day = (day or datetime.now().date()).isoformat()
+        where, params = "visit_date = ?", [day]
+        if department is not None and doctor_id is not None:
+            where, params = "visit_date = ? AND department = ? AND doctor_id = ?", [day, department, doctor_id]
+        return self._conn().execute(
+            "SELECT department, doctor_id, SUM(status = 'waiting'),"
+            " TOTAL(CASE WHEN status = 'waiting' THEN predicted_wait_minutes END),"
+            " SUM(status = 'called'),"
+            " TOTAL(CASE WHEN status = 'called'"
+            "  THEN MAX(0.0, julianday(called_time) - julianday(arrival_time)) * 1440 END)"
+            f" FROM visits WHERE {where} GROUP BY department, doctor_id ORDER BY department, doctor_id",
+            params,
+        ).fetchall()
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
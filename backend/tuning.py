@@ -0,0 +1,176 @@
+import os
+import time
+import itertools
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import shared_memory
+from sklearn.ensemble import RandomForestRegressor, ExtraTreesRegressor
+
+# Only tree ensembles that forest.FlatForest can flatten are searched, so the winner
+# can be served through the same fast path as the default model.
+MODEL_CLASSES = {
+    "RandomForestRegressor": RandomForestRegressor,
+    "ExtraTreesRegressor": ExtraTreesRegressor,
+}
+SEARCH_SPACE = {
+    "RandomForestRegressor": {
+        "n_estimators": [50, 100, 200],
+        "max_depth": [None, 8, 12, 16],
+        "min_samples_leaf": [1, 3, 10],
+        "max_features": [1.0, 0.6],
+    },
+    "ExtraTreesRegressor": {
+        "n_estimators": [100, 200],
+        "max_depth": [None, 10, 16],
+        "min_samples_leaf": [1, 5],
+        "max_features": [1.0, 0.6],
+    },
+}
+# Successive halving: every candidate is first fitted on a fraction of the rows and
+# only the best 1/ETA move on to the next, larger fraction.
+RUNG_FRACTIONS = (0.25, 0.5, 1.0)
+ETA = 3
+VALIDATION_FRACTION = 0.2
+
+# Pools start workers from a fork server, never by forking the (multi-threaded) API process
+# with its SQLite connections, writer thread and held locks
+POOL_CONTEXT = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Arrays attached in each worker process: name -> (SharedMemory, ndarray)
+_worker_arrays = {}
+
+def sample_candidates(n_candidates, seed=42):
+    """Draws up to n_candidates distinct configurations from SEARCH_SPACE."""
+    all_configs = []
+    for model_name, grid in SEARCH_SPACE.items():
+        keys = list(grid)
+        for values in itertools.product(*(grid[k] for k in keys)):
+            all_configs.append({"model": model_name, "params": dict(zip(keys, values))})
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(all_configs))[:n_candidates]
+    return [all_configs[i] for i in order]
+
+def share_arrays(arrays):
+    """Copies arrays into shared memory blocks once; returns (blocks, specs for workers)."""
+    blocks, specs = [], {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+        blocks.append(shm)
+        specs[name] = (shm.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+def attach_arrays(specs):
+    """Worker initializer: maps the shared blocks as read-only arrays without copying."""
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        array = np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+        array.flags.writeable = False
+        _worker_arrays[name] = (shm, array)
+
+def shared_array(name):
+    """An array attached by attach_arrays in this process."""
+    return _worker_arrays[name][1]
+
+def process_pool(n_workers, specs):
+    """A ProcessPoolExecutor whose workers attach the shared arrays described by specs."""
+    return ProcessPoolExecutor(
+        max_workers=n_workers, mp_context=multiprocessing.get_context(POOL_CONTEXT),
+        initializer=attach_arrays, initargs=(specs,),
+    )
+
+def terminate_pool(executor):
+    """Shuts a pool down without waiting, killing the workers and any fits still running in them."""
+    processes = list((executor._processes or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(timeout=5)
+
+def _evaluate(candidate, fraction, seed):
+    """Fits one candidate on a fraction of the fit rows and scores it on the validation rows."""
+    X_fit = shared_array("X_fit")
+    y_fit = shared_array("y_fit")
+    X_val = shared_array("X_val")
+    y_val = shared_array("y_val")
+
+    n_rows = max(10, int(len(X_fit) * fraction))
+    if n_rows < len(X_fit):
+        rows = np.random.default_rng(seed).permutation(len(X_fit))[:n_rows]
+        X_fit, y_fit = X_fit[rows], y_fit[rows]
+
+    start = time.perf_counter()
+    model = MODEL_CLASSES[candidate["model"]](**candidate["params"], random_state=seed, n_jobs=1)
+    model.fit(X_fit, y_fit)
+    pred = model.predict(X_val)
+    return {
+        **candidate,
+        "fraction": fraction,
+        "rows": int(n_rows),
+        "rmse": float(np.sqrt(np.mean((pred - y_val) ** 2))),
+        "fit_s": time.perf_counter() - start,
+    }
+
+def search(X, y, time_budget=300.0, n_workers=None, n_candidates=24, seed=42, report=None):
+    """
+    Searches SEARCH_SPACE with successive halving across a process pool.
+    X/y are split into fit and validation rows and placed in shared memory once, so
+    workers read them without a per-task copy. When time_budget seconds are up, the
+    workers are terminated along with any fits still running.
+    Returns (best, log): the best evaluated candidate and every evaluation.
+    """
+    report = report or (lambda stage, fraction: None)
+    deadline = time.perf_counter() + time_budget
+    n_workers = n_workers or os.cpu_count() or 1
+
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    order = np.random.default_rng(seed).permutation(len(X))
+    n_val = max(1, int(len(X) * VALIDATION_FRACTION))
+    val, fit = order[:n_val], order[n_val:]
+    blocks, specs = share_arrays({"X_fit": X[fit], "y_fit": y[fit], "X_val": X[val], "y_val": y[val]})
+
+    log = []
+    survivors = sample_candidates(n_candidates, seed)
+    executor = process_pool(n_workers, specs)
+    try:
+        for rung, fraction in enumerate(RUNG_FRACTIONS):
+            results = []
+            pending = {executor.submit(_evaluate, c, fraction, seed) for c in survivors}
+            while pending:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        print(f"Candidate failed: {e}")
+                report(f"Tuning (rung {rung + 1}/{len(RUNG_FRACTIONS)}, {len(log) + len(results)} fits)",
+                       (rung + len(results) / max(1, len(survivors))) / len(RUNG_FRACTIONS))
+            for future in pending:
+                future.cancel()
+            for r in results:
+                r["rung"] = rung
+            log.extend(results)
+            if not results or pending:
+                break  # out of time
+            results.sort(key=lambda r: r["rmse"])
+            keep = max(1, len(results) // ETA)
+            survivors = [{"model": r["model"], "params": r["params"]} for r in results[:keep]]
+    finally:
+        terminate_pool(executor)
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    if not log:
+        raise RuntimeError("Hyperparameter search produced no results within the time budget")
+    # Prefer candidates that got furthest (more data), then lowest error
+    best = min(log, key=lambda r: (-r["fraction"], r["rmse"]))
+    return best, log
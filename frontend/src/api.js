@@ -29,14 +29,58 @@ export const getMetrics = async () => {
     }
 };
 
-export const retrainModel = async () => {
+export const getRetrainJob = async (jobId) => {
+    const response = await api.get(`/mlops/retrain/${jobId}`);
+    return response.data;
+};
+
+// Starts a background retrain and resolves with the finished job.
+export const retrainModel = async (onProgress) => {
     try {
-        const response = await api.post('/mlops/retrain');
-        return response.data;
+        let job = (await api.post('/mlops/retrain')).data;
+        while (job.status === 'Queued' || job.status === 'Running') {
+            if (onProgress) onProgress(job);
+            await new Promise((resolve) => setTimeout(resolve, 1000));
+            job = await getRetrainJob(job.job_id);
+        }
+        if (job.status !== 'Success') {
+            throw new Error(job.message || 'Retraining failed');
+        }
+        return job;
     } catch (error) {
         console.error('Error retraining model:', error);
         throw error;
     }
 };
 
+export const getQueueStatus = async () => {
+    try {
+        const response = await api.get('/queue/status');
+        return response.data;
+    } catch (error) {
+        console.error('Error getting queue status:', error);
+        throw error;
+    }
+};
+
+export const callNextPatient = async (doctorId, department) => {
+    const response = await api.post(`/queue/doctors/${doctorId}/next`, null, {
+        params: department ? { department } : {},
+    });
+    return response.data;
+};
+
+// Subscribes to the server's live event stream (/events).
+// handlers maps event names (snapshot, token_issued, token_called, token_cancelled,
+// model_version) to callbacks receiving the parsed payload. Returns an unsubscribe function.
+// The browser reconnects on its own and resumes from the last event it received.
+export const subscribeEvents = (handlers) => {
+    const source = new EventSource(`${API_BASE_URL}/events`);
+    Object.entries(handlers).forEach(([event, handler]) => {
+        source.addEventListener(event, (message) => handler(JSON.parse(message.data)));
+    });
+    source.onerror = () => console.error('Event stream interrupted, reconnecting...');
+    return () => source.close();
+};
+
 export default api;
@@ -1,15 +1,36 @@
-import React from 'react';
+import React, { useState, useEffect } from 'react';
 import { Users, Clock } from 'lucide-react';
+import { subscribeEvents } from '../api';
 
-// Mock data for dashboard since we don't have a real backend for queue state yet
-const mockDoctors = [
-    { id: 'DOC_001', name: 'Dr. Smith', dept: 'Cardiology', queue: 5, avgWait: 15 },
-    { id: 'DOC_002', name: 'Dr. Jones', dept: 'Orthopedics', queue: 3, avgWait: 10 },
-    { id: 'DOC_003', name: 'Dr. Emily', dept: 'Pediatrics', queue: 8, avgWait: 25 },
-    { id: 'DOC_004', name: 'Dr. Brow', dept: 'Dermatology', queue: 2, avgWait: 5 },
-];
+const toRow = (q) => ({
+    id: q.DoctorID,
+    dept: q.Department,
+    queue: q.QueueLength,
+    avgWait: Math.round(q.AvgPredictedWait_Minutes),
+});
+const rowKey = (row) => `${row.dept}-${row.id}`;
 
 const DoctorDashboard = () => {
+    const [doctors, setDoctors] = useState([]);
+
+    useEffect(() => {
+        // The server pushes a snapshot, then the changed queue row for every token event
+        const applyRow = ({ queue }) => {
+            const row = toRow(queue);
+            setDoctors((rows) => {
+                const next = rows.filter((r) => rowKey(r) !== rowKey(row));
+                next.push(row);
+                return next.sort((a, b) => rowKey(a).localeCompare(rowKey(b)));
+            });
+        };
+        return subscribeEvents({
+            snapshot: (data) => setDoctors(data.queues.map(toRow)),
+            token_issued: applyRow,
+            token_called: applyRow,
+            token_cancelled: applyRow,
+        });
+    }, []);
+
     return (
         <div className="bg-white p-6 rounded-lg shadow-md border border-gray-100 mt-8">
             <h2 className="text-xl font-semibold mb-4 text-gray-800 flex items-center gap-2">
@@ -27,9 +48,9 @@ const DoctorDashboard = () => {
                         </tr>
                     </thead>
                     <tbody className="bg-white divide-y divide-gray-200">
-                        {mockDoctors.map((doc) => (
-                            <tr key={doc.id}>
-                                <td className="px-6 py-4 whitespace-nowrap text-sm font-medium text-gray-900">{doc.name} <span className="text-gray-400 text-xs">({doc.id})</span></td>
+                        {doctors.map((doc) => (
+                            <tr key={`${doc.dept}-${doc.id}`}>
+                                <td className="px-6 py-4 whitespace-nowrap text-sm font-medium text-gray-900">{doc.id}</td>
                                 <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-500">{doc.dept}</td>
                                 <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">{doc.queue}</td>
                                 <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-500 flex items-center gap-1">
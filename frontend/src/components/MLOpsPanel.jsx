@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { getMetrics, retrainModel } from '../api';
+import { getMetrics, retrainModel, subscribeEvents } from '../api';
 import { RefreshCw, Activity, GitCommitHorizontal, CheckCircle, TriangleAlert } from 'lucide-react';
 
 const MLOpsPanel = () => {
@@ -27,7 +27,7 @@ const MLOpsPanel = () => {
             const result = await retrainModel();
             setMessage({ type: 'success', text: result.message || 'Retraining successful' });
             // Reload metrics
-            setMetrics(result.results || result); // Adjust based on actual API response structure
+            setMetrics(result.metrics);
             loadMetrics(); // Refresh to be sure
         } catch (error) {
             setMessage({ type: 'error', text: 'Retraining failed' });
@@ -38,6 +38,8 @@ const MLOpsPanel = () => {
 
     useEffect(() => {
         loadMetrics();
+        // Refresh when any client's retrain swaps in a new model
+        return subscribeEvents({ model_version: () => loadMetrics() });
     }, []);
 
     if (loading && !metrics) return <div className="p-4">Loading MLOps stats...</div>;
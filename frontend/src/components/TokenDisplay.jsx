@@ -19,6 +19,11 @@ const TokenDisplay = ({ prediction }) => {
                 <div className="bg-blue-50 p-4 rounded-md">
                     <p className="text-sm text-blue-600 font-medium flex items-center gap-1"><Clock className="w-3 h-3" /> Est. Wait Time</p>
                     <p className="text-2xl font-bold text-blue-800">{prediction.WaitTime_Minutes.toFixed(1)} mins</p>
+                    {prediction.WaitTime_Low_Minutes != null && (
+                        <p className="text-xs text-blue-500 mt-1">
+                            Likely {Math.round(prediction.WaitTime_Low_Minutes)}–{Math.round(prediction.WaitTime_High_Minutes)} mins
+                        </p>
+                    )}
                     <p className="text-xs text-blue-500 mt-1">Consult Time: {new Date(prediction.PredictedConsultTime).toLocaleTimeString()}</p>
                 </div>
 
@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+import time
 from datetime import datetime
 import pandas as pd
 
@@ -59,17 +60,25 @@ with st.sidebar:
     st.divider()
     
     if st.button("🎯 Retrain Model"):
-        with st.spinner("Retraining model..."):
-            try:
-                response = requests.post(f"{API_BASE_URL}/mlops/retrain")
-                if response.status_code == 200:
-                    result = response.json()
-                    st.success(f"Status: {result['status']}")
-                    st.info(f"Model Version: {result['model_version']}")
+        try:
+            response = requests.post(f"{API_BASE_URL}/mlops/retrain")
+            if response.status_code == 202:
+                job = response.json()
+                progress_bar = st.progress(0.0, text=job["stage"])
+                # Retraining runs in the background; poll the job until it finishes
+                while job["status"] in ("Queued", "Running"):
+                    time.sleep(1)
+                    job = requests.get(f"{API_BASE_URL}/mlops/retrain/{job['job_id']}").json()
+                    progress_bar.progress(job["progress"], text=job["stage"])
+                if job["status"] == "Success":
+                    st.success(f"Status: {job['status']}")
+                    st.info(f"Model Version: {job['model_version']}")
                 else:
-                    st.error(f"Failed to retrain: {response.status_code}")
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
+                    st.error(f"Retraining failed: {job.get('message')}")
+            else:
+                st.error(f"Failed to retrain: {response.status_code}")
+        except Exception as e:
+            st.error(f"Error: {str(e)}")
 
 # Main content
 tab1, tab2 = st.tabs(["🎫 New Patient Token", "👨‍⚕️ Doctor Dashboard"])
@@ -128,6 +137,8 @@ with tab1:
                     
                     with col3:
                         st.metric("Wait Time (min)", f"{result['WaitTime_Minutes']:.0f}")
+                        if result.get("WaitTime_Low_Minutes") is not None:
+                            st.caption(f"Likely {result['WaitTime_Low_Minutes']:.0f}–{result['WaitTime_High_Minutes']:.0f} min")
                     
                     with col4:
                         consult_time = datetime.fromisoformat(result["PredictedConsultTime"])
@@ -147,24 +158,58 @@ with tab1:
 with tab2:
     st.subheader("Doctor Load Dashboard")
     
-    # Mock data for dashboard (since we don't have a real-time queue system)
-    mock_doctors = [
-        {"Doctor": "Dr. Smith (DOC_001)", "Department": "Cardiology", "Queue": 5, "Avg Wait": "15 min", "Status": "Busy"},
-        {"Doctor": "Dr. Jones (DOC_002)", "Department": "Orthopedics", "Queue": 3, "Avg Wait": "10 min", "Status": "Available"},
-        {"Doctor": "Dr. Emily (DOC_003)", "Department": "Pediatrics", "Queue": 8, "Avg Wait": "25 min", "Status": "Busy"},
-        {"Doctor": "Dr. Brown (DOC_004)", "Department": "Dermatology", "Queue": 2, "Avg Wait": "5 min", "Status": "Available"},
-    ]
-    
-    df = pd.DataFrame(mock_doctors)
-    
-    # Display as a styled dataframe
-    st.dataframe(
-        df,
-        use_container_width=True,
-        hide_index=True
-    )
-    
-    st.info("📊 This is mock data. Real-time queue tracking would require additional backend implementation.")
+    def queue_status_label(queue_length):
+        if queue_length > 5:
+            return "Busy"
+        if queue_length > 2:
+            return "Moderate"
+        return "Available"
+
+    try:
+        response = requests.get(f"{API_BASE_URL}/queue/status")
+        response.raise_for_status()
+        status = response.json()
+    except Exception as e:
+        st.error(f"❌ Could not load queue status: {str(e)}")
+        status = None
+
+    if status and status["queues"]:
+        df = pd.DataFrame([
+            {
+                "Doctor": q["DoctorID"],
+                "Department": q["Department"],
+                "Queue": q["QueueLength"],
+                "Avg Wait": f"{q['AvgPredictedWait_Minutes']:.0f} min",
+                "Served": q["Served"],
+                "Status": queue_status_label(q["QueueLength"]),
+            }
+            for q in status["queues"]
+        ])
+        
+        # Display as a styled dataframe
+        st.dataframe(
+            df,
+            use_container_width=True,
+            hide_index=True
+        )
+        st.metric("Total Queue", status["total_waiting"])
+
+        col1, col2, col3 = st.columns([2, 2, 1])
+        with col1:
+            call_doctor = st.selectbox("Doctor", sorted(df["Doctor"].unique()))
+        with col2:
+            call_department = st.selectbox("Department ", ["Any"] + sorted(df["Department"].unique()))
+        with col3:
+            st.write("")
+            if st.button("📢 Call Next"):
+                params = {} if call_department == "Any" else {"department": call_department}
+                response = requests.post(f"{API_BASE_URL}/queue/doctors/{call_doctor}/next", params=params)
+                if response.status_code == 200:
+                    st.success(f"Token #{response.json()['TokenNumber']} to {call_doctor}")
+                else:
+                    st.info("No patients waiting")
+    elif status is not None:
+        st.info("📊 No patients in queue yet. Tokens generated in the first tab appear here.")
 
 # Footer
 st.divider()